@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+Pickup and trip speeds learned from order lifecycle timestamps, per zone
+(routing.zone_of of the pickup) and hour bucket.
+
+  pickup: pickup_km (straight line, driver → pickup, recorded on accept)
+          over arrived_at - accepted_at
+  trip:   distance_km over finished_at - started_at
+
+Every (zone, bucket) cell keeps sums [km, hours, n]; its speed is km / hours,
+so a long trip weighs more than a short one and a single odd order can't
+swing the value. When n passes `max_samples` the sums are scaled down to it —
+old orders fade out and the table follows the city. Implausible samples
+(under 30 s, over 3 h, outside 2–130 km/h) are skipped.
+
+A lookup is at most four dict hits — the cell, then the zone over all
+hours, the bucket over all zones, everything — taking the first with at
+least `min_samples` orders; None when nothing has enough data.
+
+driver-bot owns the table: `build()` streams orders.json in a worker thread
+(with ijson installed the file is never loaded whole), `observe()` adds
+every order as it finishes and `save()` writes the file atomically.
+passenger-bot only reads it (watch=True): lookups pick up a new file by
+mtime, checked at most once per `check_sec`.
+
+The hour is the wall-clock hour of created_at (Kyiv local time).
+
+This module is kept identical in driver-bot/ and passenger-bot/.
+"""
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import ijson
+except ImportError:  # optional: fall back to json.load
+    ijson = None
+
+from routing import NO_ZONE, order_pickup, zone_of
+
+PICKUP = "pickup"
+TRIP = "trip"
+KINDS = (PICKUP, TRIP)
+ANY = "*"
+
+MIN_SEC = 30.0
+MAX_SEC = 3 * 3600.0
+MIN_KMH = 2.0
+MAX_KMH = 130.0
+
+# "zone/bucket" -> [km, hours, n]
+Cells = Dict[str, List[float]]
+
+
+def _epoch(value: Any) -> Optional[float]:
+    try:
+        return datetime.fromisoformat(str(value)).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def _hour(created_at: Any) -> Optional[int]:
+    s = str(created_at or "")
+    try:
+        return int(s[11:13]) if len(s) >= 13 and s[10] in "T " else None
+    except ValueError:
+        return None
+
+
+def samples(order: Dict[str, Any]) -> List[Tuple[str, str, int, float, float]]:
+    """(kind, zone, hour, km, hours) for the legs of a finished order."""
+    zone = zone_of(order_pickup(order))
+    hour = _hour(order.get("created_at"))
+    if zone == NO_ZONE or hour is None:
+        return []
+    legs = (
+        (PICKUP, order.get("pickup_km"), "accepted_at", "arrived_at"),
+        (TRIP, order.get("distance_km"), "started_at", "finished_at"),
+    )
+    out = []
+    for kind, km, begin, end in legs:
+        t0, t1 = _epoch(order.get(begin)), _epoch(order.get(end))
+        if not isinstance(km, (int, float)) or t0 is None or t1 is None:
+            continue
+        sec = t1 - t0
+        if not MIN_SEC <= sec <= MAX_SEC:
+            continue
+        hours = sec / 3600.0
+        if MIN_KMH <= km / hours <= MAX_KMH:
+            out.append((kind, zone, hour, float(km), hours))
+    return out
+
+
+def stream_orders(path: str) -> Iterator[Dict[str, Any]]:
+    """Orders from a driver-bot orders.json ({"orders": [...]})."""
+    try:
+        with open(path, "rb") as f:
+            if ijson is not None:
+                for order in ijson.items(f, "orders.item", use_float=True):
+                    if isinstance(order, dict):
+                        yield order
+                return
+            data = json.load(f)
+    except FileNotFoundError:
+        return
+    yield from (o for o in (data or {}).get("orders") or [] if isinstance(o, dict))
+
+
+class Calibration:
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        bucket_h: int = 3,
+        min_samples: int = 5,
+        max_samples: int = 500,
+        check_sec: float = 60.0,
+        watch: bool = True,
+    ):
+        self.path = path
+        self.bucket_h = bucket_h
+        self.min_samples = min_samples
+        self.max_samples = max_samples
+        self.check_sec = check_sec
+        self.watch = watch  # reader: follow the file; the writer loads it once
+        self.tables: Dict[str, Cells] = {kind: {} for kind in KINDS}
+        self.dirty = False
+        self._mtime: Optional[float] = None
+        self._checked = 0.0
+        self._rebuilding: Optional[List[Tuple[str, str, int, float, float]]] = None
+
+    # ---- learning (driver-bot) ----
+
+    def observe(self, order: Dict[str, Any]) -> int:
+        found = samples(order)
+        for sample in found:
+            self._add(self.tables, *sample)
+        if self._rebuilding is not None:
+            self._rebuilding.extend(found)  # replayed onto the rebuilt table
+        self.dirty = self.dirty or bool(found)
+        return len(found)
+
+    def rebuild_start(self):
+        self._rebuilding = []
+
+    def build(self, orders: Iterable[Dict[str, Any]]) -> Tuple[Dict[str, Cells], int]:
+        """Fresh tables from `orders`; touches no state, safe in a worker
+        thread. Install the result with `rebuild_finish` on the owning loop."""
+        tables: Dict[str, Cells] = {kind: {} for kind in KINDS}
+        n = 0
+        for order in orders:
+            for sample in samples(order):
+                self._add(tables, *sample)
+                n += 1
+        return tables, n
+
+    def rebuild_abort(self):
+        self._rebuilding = None  # the live table already has these samples
+
+    def rebuild_finish(self, tables: Dict[str, Cells]):
+        for sample in self._rebuilding or ():
+            self._add(tables, *sample)
+        self._rebuilding = None
+        self.tables = tables
+        self.dirty = True
+
+    def save(self):
+        if not self.path:
+            return
+        data: Dict[str, Any] = {"v": 1, "bucket_h": self.bucket_h, "updated_at": time.time()}
+        for kind, cells in self.tables.items():
+            data[kind] = {k: [round(km, 3), round(h, 5), n] for k, (km, h, n) in cells.items()}
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp, self.path)
+        self.dirty = False
+
+    # ---- reading (both bots) ----
+
+    def reload(self, force: bool = False) -> bool:
+        """Load the file if it changed; True when a new table was loaded."""
+        now = time.monotonic()
+        if not self.path or (not force and now - self._checked < self.check_sec):
+            return False
+        self._checked = now
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return False  # no file yet: keep what we have
+        if mtime == self._mtime and not force:
+            return False
+        self._mtime = mtime  # don't retry a broken file until it changes
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            tables = {kind: dict(data.get(kind) or {}) for kind in KINDS}
+            bucket_h = int(data.get("bucket_h", self.bucket_h))
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            logging.error(f"[CALIBRATION] Can't load {self.path}: {e}; keeping the old table")
+            return False
+        self.tables, self.bucket_h = tables, bucket_h
+        return True
+
+    def kmh(self, kind: str, zone: str, hour: int) -> Optional[float]:
+        if self.watch:
+            self.reload()
+        cells = self.tables[kind]
+        bucket = hour // self.bucket_h
+        for key in (f"{zone}/{bucket}", f"{zone}/{ANY}", f"{ANY}/{bucket}", f"{ANY}/{ANY}"):
+            cell = cells.get(key)
+            if cell and cell[2] >= self.min_samples and cell[1] > 0:
+                return cell[0] / cell[1]
+        return None
+
+    def pickup_kmh(self, zone: str, hour: int) -> Optional[float]:
+        """Straight-line km/h from a driver's spot to the pickup."""
+        return self.kmh(PICKUP, zone, hour)
+
+    def trip_kmh(self, zone: str, hour: int) -> Optional[float]:
+        """Route km/h of trips starting in `zone`."""
+        return self.kmh(TRIP, zone, hour)
+
+    # ---- internals ----
+
+    def _add(self, tables: Dict[str, Cells], kind: str, zone: str, hour: int, km: float, hours: float):
+        bucket = hour // self.bucket_h
+        cells = tables[kind]
+        for key in (f"{zone}/{bucket}", f"{zone}/{ANY}", f"{ANY}/{bucket}", f"{ANY}/{ANY}"):
+            cell = cells.setdefault(key, [0.0, 0.0, 0])
+            cell[0] += km
+            cell[1] += hours
+            cell[2] += 1
+            if cell[2] > self.max_samples:
+                scale = self.max_samples / cell[2]
+                cell[0] *= scale
+                cell[1] *= scale
+                cell[2] = self.max_samples
@@ -6,25 +6,83 @@ Single-file implementation with:
 - Registration & approval flow for drivers
 - Online/offline toggle and settings
 - Location updates (GPS share or manual address -> geocode via OSM)
-- Orders pipeline backed by RabbitMQ:
-  - Consumes new orders from QUEUE_ORDERS
+- Orders pipeline over the message bus (mq.py: RabbitMQ / in-process / file):
+  - Consumes new orders from QUEUE_ORDERS (bound to ORDERS_EXCHANGE)
   - Offers to nearby/eligible online drivers
   - On accept -> publishes confirmation into QUEUE_CONFIRMATIONS
 - Local JSON storage (drivers, pending applications, orders, settings)
 
 Env variables (.env supported):
   DRIVER_BOT_TOKEN or BOT_TOKEN
+  MQ_BACKEND=rabbitmq            (rabbitmq | memory | file)
   RABBITMQ_HOST=localhost
+  MQ_SPOOL_DIR=/tmp/flytaxi-mq   (MQ_BACKEND=file only)
   QUEUE_ORDERS=orders
   QUEUE_CONFIRMATIONS=confirmations
 
+Sharding (optional, see routing.py) — several instances split dispatch by zone:
+  ORDERS_EXCHANGE=orders.topic   topic exchange, keys orders.<zone>.<class>
+  ZONE_CELL_KM=5                 zone grid cell size (same value in both bots)
+  SHARD_ZONES=*                  zones this instance dispatches, e.g. 1123x432,1123x433;
+                                 - dispatches none (the poller next to zone shards)
+  SHARD_CLASSES=*                tariff classes, e.g. business
+  DRIVER_BOT_POLLING=1           exactly one instance polls Telegram; shards use 0
+  DRIVER_BOT_INSTANCE=           instance name; default "poller" or
+                                 "shard.<zones>[.<classes>]", e.g. shard.1123x432+1123x433
+  QUEUE_DRIVERS=drivers          driver events queue prefix, see below
+  DRIVER_BOT_DATA_DIR=.          where the JSON files live (one per instance)
+Every instance consumes its own queues, so each gets its copy of a message:
+orders from <QUEUE_ORDERS>.<instance> (plain QUEUE_ORDERS when not sharded),
+driver events from <QUEUE_DRIVERS>.<instance>. Accepts and declines land on
+the poller, which tells the dispatching shard (order_closed / offer_declined
+on drivers.<zone>).
+Next to zone shards the poller runs with SHARD_ZONES=- (sharded, dispatches
+nothing): with SHARD_ZONES=* it would dispatch every order itself, and
+unsharded it would neither sync drivers to the shards nor close their orders.
+
+Priorities (routing.order_priority): retries, waiting time and tariff class
+raise an order's priority. Orders come from ORDERS_EXCHANGE (consume_topic)
+into this instance's orders queue, declared with x-max-priority.
+  ORDER_PRIORITY_TARIFFS=business:2,comfort:1
+  ORDER_PRIORITY_AGE_STEP_SEC=30   ORDER_PRIORITY_MAX_AGE_BONUS=4
+
+Offers go out in waves (dispatch_order_to_nearby_drivers), best score first
+(scoring.py: distance, acceptance rate, idle time, rating):
+  DRIVER_SCORE_WEIGHTS=distance:1,accept:0.5,idle:0.3,rating:0.4
+  DISPATCH_WAVE_SIZE=3           DISPATCH_WAVE_INTERVAL_SEC=15
+  DISPATCH_WAVE_RADII_KM=1.5,3,5,10   radius per wave, the last one repeats
+
+Dispatch: orders from the bus go through a bounded priority queue served by
+a fixed pool of workers on the bot loop. When it is full the MQ thread waits,
+so it stops acking and the backlog stays in the broker (see MQ_PREFETCH).
+  DISPATCH_WORKERS=4             DISPATCH_QUEUE_SIZE=100
+  TELEGRAM_RATE_PER_SEC=25       TELEGRAM_BURST=25   global send budget (outbox.py)
+  TELEGRAM_CHAT_RATE_PER_SEC=1   TELEGRAM_CHAT_BURST=3   TELEGRAM_GROUP_RATE_PER_MIN=20
+  TELEGRAM_SEND_WORKERS=4
+  DISPATCH_BATCH_MS=0            >0: match the orders of each window to drivers
+                                 at once (matching.py), DISPATCH_BATCH_MAX=20
+
+Supply feed (supply.py): available drivers per zone go to passenger-bot for
+surge pricing — on change, at most every SUPPLY_PUBLISH_SEC, and at least
+every SUPPLY_HEARTBEAT_SEC. Only the polling instance publishes.
+  QUEUE_SUPPLY=drivers.supply    SUPPLY_PUBLISH_SEC=10   SUPPLY_HEARTBEAT_SEC=60
+
+Calibration (calibration.py): pickup and trip speeds per zone and hour bucket,
+learned from the lifecycle timestamps of finished orders — rebuilt from
+orders.json at startup, then updated as orders finish and saved to
+DATA_DIR/calibration.json every CALIBRATION_SAVE_SEC. passenger-bot reads
+the file for pickup ETA and trip durations.
+  CALIBRATION_SAVE_SEC=60        CALIBRATION_BUCKET_H=3
+
 Run:
-  pip install aiogram==3.* python-dotenv pika requests
+  pip install aiogram==3.* python-dotenv pika msgpack requests
   python driver_bot.py
 """
 import os
 import json
 import asyncio
+import concurrent.futures
+import itertools
 import logging
 import time as time_module  # для sleep()
 
@@ -61,7 +119,31 @@ class PaymentFSM(StatesGroup):
 
 from dotenv import load_dotenv
 import requests
-import pika
+
+import metrics
+from calibration import Calibration, stream_orders
+from matching import assign
+from outbox import DISPATCH, Outbox
+from scoring import FeatureCache
+from supply import SupplyIndex
+from timers import DeadlineScheduler
+from mq import MAX_PRIORITY, get_bus
+from routing import (
+    ORDERS_EXCHANGE_DEFAULT,
+    driver_routing_key,
+    order_age_sec,
+    order_binding_keys,
+    order_pickup,
+    parse_shard_list,
+    tariff_class,
+    zone_of,
+)
+from wire import (
+    WireError,
+    decode_order,
+    encode_confirmation,
+    encode_supply,
+)
 
 
 def save_json(path, data):
@@ -103,7 +185,9 @@ def save_settings():
 
 
 def load_drivers():
-    return _load_json(DRIVERS_FILE, {})
+    # drivers.json is written only by this process, so the in-memory dict is
+    # always current — handlers and dispatch share it instead of re-reading.
+    return drivers
 
 
 def now_iso():
@@ -147,38 +231,114 @@ API_TOKEN = os.getenv("DRIVER_BOT_TOKEN") or os.getenv("BOT_TOKEN")
 if not API_TOKEN:
     raise RuntimeError("Please set DRIVER_BOT_TOKEN (or BOT_TOKEN) in .env")
 
-# RabbitMQ config (with sane defaults)
-RABBITMQ_HOST = os.getenv("RABBITMQ_HOST", "localhost")
+# Message bus config (with sane defaults; backend is picked in mq.get_bus)
 QUEUE_ORDERS = os.getenv("QUEUE_ORDERS", "orders")
 QUEUE_CONFIRMATIONS = os.getenv("QUEUE_CONFIRMATIONS", "confirmations")
+QUEUE_SUPPLY = os.getenv("QUEUE_SUPPLY", "drivers.supply")
+SUPPLY_PUBLISH_SEC = float(os.getenv("SUPPLY_PUBLISH_SEC", "10"))
+SUPPLY_HEARTBEAT_SEC = float(os.getenv("SUPPLY_HEARTBEAT_SEC", "60"))
+CALIBRATION_SAVE_SEC = float(os.getenv("CALIBRATION_SAVE_SEC", "60"))
 
 logging.basicConfig(format="%(asctime)s %(levelname)s: %(message)s", level=logging.INFO)
 
 bot = Bot(API_TOKEN)
 dp = Dispatcher(storage=MemoryStorage())
+
+# Every send/edit goes through one queue with global and per-chat limits
+outbox = Outbox(
+    bot,
+    rate=float(os.getenv("TELEGRAM_RATE_PER_SEC", "25")),
+    burst=int(os.getenv("TELEGRAM_BURST", "25")),
+    chat_rate=float(os.getenv("TELEGRAM_CHAT_RATE_PER_SEC", "1")),
+    chat_burst=int(os.getenv("TELEGRAM_CHAT_BURST", "3")),
+    group_rate=float(os.getenv("TELEGRAM_GROUP_RATE_PER_MIN", "20")) / 60.0,
+    workers=int(os.getenv("TELEGRAM_SEND_WORKERS", "4")),
+)
+
 router = Router()  # ✅ тут тепер router замість dp
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DRIVERS_FILE = os.path.join(BASE_DIR, "drivers.json")
-PENDING_FILE = os.path.join(BASE_DIR, "pending_drivers.json")
-ORDERS_FILE = os.path.join(BASE_DIR, "orders.json")
-SETTINGS_FILE = os.path.join(BASE_DIR, "settings.json")
+DATA_DIR = os.getenv("DRIVER_BOT_DATA_DIR", BASE_DIR)
+DRIVERS_FILE = os.path.join(DATA_DIR, "drivers.json")
+PENDING_FILE = os.path.join(DATA_DIR, "pending_drivers.json")
+ORDERS_FILE = os.path.join(DATA_DIR, "orders.json")
+SETTINGS_FILE = os.path.join(DATA_DIR, "settings.json")
+CALIBRATION_FILE = os.path.join(DATA_DIR, "calibration.json")
+
+# Sharding: zones/classes this instance dispatches (None = all)
+ORDERS_EXCHANGE = os.getenv("ORDERS_EXCHANGE", ORDERS_EXCHANGE_DEFAULT)
+SHARD_ZONES = parse_shard_list(os.getenv("SHARD_ZONES"))
+SHARD_CLASSES = parse_shard_list(os.getenv("SHARD_CLASSES"))
+SHARDED = SHARD_ZONES is not None
+DRIVER_BOT_POLLING = os.getenv("DRIVER_BOT_POLLING", "1") != "0"
+
+
+def instance_id() -> str:
+    """Stable name of this instance: the poller, or a shard by its zones/classes."""
+    explicit = os.getenv("DRIVER_BOT_INSTANCE")
+    if explicit:
+        return explicit
+    if DRIVER_BOT_POLLING:
+        return "poller"
+    name = "shard." + "+".join(SHARD_ZONES or ["all"])
+    return name + ("." + "+".join(SHARD_CLASSES) if SHARD_CLASSES else "")
+
+
+# Every instance needs its own queues: on one shared queue the instances
+# would compete for messages instead of each getting its copy.
+INSTANCE_ID = instance_id()
+if SHARDED:
+    QUEUE_ORDERS = f"{QUEUE_ORDERS}.{INSTANCE_ID}"
+QUEUE_DRIVERS = os.getenv("QUEUE_DRIVERS", "drivers") + f".{INSTANCE_ID}"
+if not DRIVER_BOT_POLLING and not SHARD_ZONES:
+    raise RuntimeError("DRIVER_BOT_POLLING=0 is a dispatch shard: set SHARD_ZONES to its zones")
 
 drivers: Dict[str, Any] = _load_json(DRIVERS_FILE, {})
 pending: Dict[str, Any] = _load_json(PENDING_FILE, {})
 orders_state: Dict[str, Any] = _load_json(ORDERS_FILE, {"orders": []})
 settings: Dict[str, Any] = _load_json(SETTINGS_FILE, {"ADMIN_CHAT_ID": None})
 
+# Dispatch scoring features, refreshed by sync_driver() on every change
+driver_features = FeatureCache()
+driver_features.load(drivers)
+# Available drivers per zone for the passenger-bot surge engine, same upkeep
+driver_supply = SupplyIndex()
+driver_supply.load(drivers)
+# Learned pickup/trip speeds; this bot writes the file, passenger-bot reads it
+calibration = Calibration(
+    CALIBRATION_FILE, bucket_h=int(os.getenv("CALIBRATION_BUCKET_H", "3")), watch=False
+)
+calibration.reload(force=True)
+
 
 # Keep a simple in-memory map of raw orders by id (useful for confirmations)
 ORDERS_BY_ID: Dict[str, Dict[str, Any]] = {}
 
+# Sharding: zone each driver was last announced in (polling instance only)
+DRIVER_ZONES: Dict[str, str] = {}
+
 # Optional hard-coded admin IDs (can keep empty)
 ADMIN_IDS = set()
 
 # Offer timeout
 OFFER_TIMEOUT_SEC = 120
 
+# Dispatch work queue (see dispatch_worker)
+DISPATCH_WORKERS = max(1, int(os.getenv("DISPATCH_WORKERS", "4")))
+DISPATCH_QUEUE_SIZE = max(1, int(os.getenv("DISPATCH_QUEUE_SIZE", "100")))
+# Batch matching window (0 = off) and the most orders solved at once
+DISPATCH_BATCH_MS = int(os.getenv("DISPATCH_BATCH_MS", "0"))
+DISPATCH_BATCH_MAX = max(1, int(os.getenv("DISPATCH_BATCH_MAX", "20")))
+
+# Offer waves: the nearest DISPATCH_WAVE_SIZE drivers first, then the next
+# ones every DISPATCH_WAVE_INTERVAL_SEC while the radius grows per wave
+# (the driver's own pickup_km still applies).
+DISPATCH_WAVE_SIZE = max(1, int(os.getenv("DISPATCH_WAVE_SIZE", "3")))
+DISPATCH_WAVE_INTERVAL_SEC = float(os.getenv("DISPATCH_WAVE_INTERVAL_SEC", "15"))
+DISPATCH_WAVE_RADII_KM = [
+    float(r) for r in os.getenv("DISPATCH_WAVE_RADII_KM", "1.5,3,5,10").split(",")
+]
+
 # ----------------------------
 # UI Builders
 # ----------------------------
@@ -251,17 +411,22 @@ def ontrip_inline_kb(order_id: str) -> InlineKeyboardMarkup:
 
 def format_order_card(order: Dict[str, Any]) -> str:
     pickup = order.get("pickup", {})
-    drop = order.get("dropoff", {})
+    drop = order.get("dropoff") or {}
+    pickup_addr = pickup.get("address")
+    if not pickup_addr and pickup.get("coords"):
+        pickup_addr = "{:.6f},{:.6f}".format(*pickup["coords"])
     tariff = order.get("tariff", "-")
     price = order.get("price", "-")
     payment = order.get("payment", "-")
     dist = float(order.get("distance_km", 0.0) or 0.0)
     eta = int(order.get("eta_min", 5) or 5)
+    trip = order.get("duration_min")
+    trip_txt = f" (~{round(trip)} хв)" if trip else ""
     return (
         f"🚖 <b>Замовлення #{order.get('id','')}</b>\n"
-        f"📍 Подача: {pickup.get('address','-')}\n"
-        f"🏁 Фініш: {drop.get('address','-')}\n"
-        f"🛣 Відстань: {dist:.1f} км\n"
+        f"📍 Подача: {pickup_addr or '-'}\n"
+        f"🏁 Фініш: {drop.get('address') or '-'}\n"
+        f"🛣 Відстань: {dist:.1f} км{trip_txt}\n"
         f"🚗 Тариф: {tariff}\n"
         f"💳 Оплата: {payment}\n"
         f"💵 Ціна: {fmt_price(price)}\n"
@@ -306,6 +471,81 @@ def is_admin(user_id: Optional[int], chat_id: Optional[int] = None) -> bool:
     return False
 
 
+def owns_zone(zone: str) -> bool:
+    return SHARD_ZONES is None or zone in SHARD_ZONES
+
+
+def owns_order(order: Dict[str, Any]) -> bool:
+    if not owns_zone(zone_of(order_pickup(order))):
+        return False
+    return SHARD_CLASSES is None or tariff_class(order.get("tariff")) in SHARD_CLASSES
+
+
+def sync_driver(user_id):
+    """Call after every change to a driver record: refreshes the dispatch
+    scoring features and the zone supply counters and, in sharded mode,
+    announces the driver's state to the shard owning their zone.
+
+    When the driver's location crossed a zone boundary, the old shard gets a
+    `driver_left` first, so the driver is rebalanced to exactly one shard.
+    """
+    uid = str(user_id)
+    d = drivers.get(uid)
+    driver_features.refresh(uid, d)
+    driver_supply.refresh(uid, d)
+    if not SHARDED or not DRIVER_BOT_POLLING:
+        return
+    if d is None:
+        return
+    zone = zone_of(d.get("last_location"))
+    prev = DRIVER_ZONES.get(uid)
+    bus = get_bus()
+    try:
+        if prev and prev != zone:
+            bus.publish_topic(
+                ORDERS_EXCHANGE,
+                driver_routing_key(prev),
+                json.dumps({"type": "driver_left", "uid": uid}).encode("utf-8"),
+            )
+        state = {k: v for k, v in d.items() if k != "docs"}
+        bus.publish_topic(
+            ORDERS_EXCHANGE,
+            driver_routing_key(zone),
+            json.dumps(
+                {"type": "driver", "uid": uid, "driver": state}, ensure_ascii=False
+            ).encode("utf-8"),
+        )
+        DRIVER_ZONES[uid] = zone
+    except Exception as e:
+        logging.exception(f"[SHARD] Failed to sync driver {uid}: {e}")
+
+
+def announce_to_shard(order: Optional[Dict[str, Any]], kind: str, **fields):
+    """Poller → the shard dispatching `order` (a DriverEventsThread event)."""
+    if not order or not SHARDED or not DRIVER_BOT_POLLING or owns_order(order):
+        return
+    zone = zone_of(order_pickup(order))
+    try:
+        get_bus().publish_topic(
+            ORDERS_EXCHANGE,
+            driver_routing_key(zone),
+            json.dumps({"type": kind, "order_id": order.get("id"), **fields}).encode("utf-8"),
+        )
+    except Exception as e:
+        logging.exception(f"[SHARD] Failed to send {kind} for order {order.get('id')}: {e}")
+
+
+def announce_order_closed(order: Dict[str, Any], accepted_by: Optional[int] = None):
+    """Stop the order's waves and revoke its offers on the dispatching shard."""
+    announce_to_shard(order, "order_closed", accepted_by=accepted_by)
+
+
+def announce_offer_declined(order_id: str, did: int):
+    """Free the driver's reservation for the order on the dispatching shard."""
+    order = next((o for o in orders_state["orders"] if o.get("id") == order_id), None)
+    announce_to_shard(order, "offer_declined", driver_id=did)
+
+
 def ensure_driver_skeleton(user_id: int):
     if str(user_id) not in drivers:
         drivers[str(user_id)] = {
@@ -592,10 +832,10 @@ async def submit_registration(message: types.Message, state: FSMContext):
         media.append(types.InputMediaPhoto(media=data["interior"]))
 
     if media:
-        await bot.send_media_group(admin_id, media)
+        await outbox.send_media_group(admin_id, media)
     else:
         # fallback — якщо немає фото
-        await bot.send_message(admin_id, text_caption, parse_mode="HTML")
+        await outbox.send_message(admin_id, text_caption, parse_mode="HTML")
 
     # --- Кнопки для підтвердження ---
     inline_keyboard = [
@@ -623,7 +863,7 @@ async def submit_registration(message: types.Message, state: FSMContext):
     ]
     kb = InlineKeyboardMarkup(inline_keyboard=inline_keyboard)
 
-    await bot.send_message(
+    await outbox.send_message(
         admin_id, "⬆️ Фото заявки. Оберіть дію:", reply_markup=kb, parse_mode="HTML"
     )
 
@@ -673,7 +913,7 @@ async def submit_registration(message: types.Message, state: FSMContext):
     add(data.get("car_photo"), "🚗 Авто")
     if media:
         try:
-            await bot.send_media_group(admin_id, media=media)
+            await outbox.send_media_group(admin_id, media=media)
         except Exception:
             pass
 
@@ -696,7 +936,7 @@ async def set_admin_chat(message: types.Message):
     save_settings()
     await message.answer("✅ Цей чат збережено як адмін-чат для заявок.")
     try:
-        await bot.send_message(
+        await outbox.send_message(
             settings["ADMIN_CHAT_ID"], "🔔 Тест: адмін-чат успішно налаштований."
         )
     except Exception as e:
@@ -709,7 +949,7 @@ async def set_admin_chat_channel(message: types.Message):
     save_settings()
     await message.answer("✅ Цей канал збережено як адмін-чат для заявок.")
     try:
-        await bot.send_message(
+        await outbox.send_message(
             settings["ADMIN_CHAT_ID"], "🔔 Тест: адмін-чат успішно налаштований."
         )
     except Exception as e:
@@ -784,6 +1024,7 @@ async def cb_approve(call: types.CallbackQuery):
     pending.pop(uid, None)
     save_drivers(drivers)
     save_pending()
+    sync_driver(uid)
 
     try:
         await call.message.edit_reply_markup(reply_markup=None)
@@ -793,7 +1034,7 @@ async def cb_approve(call: types.CallbackQuery):
     await call.answer("✅ Заявку підтверджено", show_alert=True)
 
     try:
-        await bot.send_message(
+        await outbox.send_message(
             int(uid),
             f"✅ Вас підтверджено як водія.\nДоступні класи: {', '.join(classes)}",
             reply_markup=driver_main_menu(int(uid)),
@@ -805,7 +1046,7 @@ async def cb_approve(call: types.CallbackQuery):
     payment_chat = settings.get("PAYMENT_CHAT_ID")
     if payment_chat:
         try:
-            await bot.send_message(
+            await outbox.send_message(
                 int(payment_chat),
                 f"💵 Водій {uid} підтверджений. Не забудьте оплатити добу ({DAILY_FEE} грн).\n"
                 f"Посилання: tg://user?id={uid}",
@@ -837,7 +1078,7 @@ async def cb_reject(call: types.CallbackQuery):
     await call.answer("❌ Заявку відхилено", show_alert=True)
 
     try:
-        await bot.send_message(
+        await outbox.send_message(
             int(uid),
             "❌ Вашу заявку відхилено. Ви можете подати її повторно після виправлення.",
         )
@@ -904,7 +1145,7 @@ async def process_receipt(message: types.Message, state: FSMContext):
         ]
     )
 
-    await bot.send_photo(
+    await outbox.send_photo(
         chat_id=payment_chat,
         photo=message.photo[-1].file_id,
         caption=caption,
@@ -948,7 +1189,7 @@ async def approve_payment(callback: types.CallbackQuery):
     # повідомлення водію
     try:
         end_local = end_of_day_utc.astimezone().strftime("%Y-%m-%d %H:%M")
-        await bot.send_message(
+        await outbox.send_message(
             int(uid), f"✅ Оплату підтверджено. Доступ активний до {end_local}."
         )
     except Exception as e:
@@ -968,7 +1209,7 @@ async def reject_payment(callback_query: types.CallbackQuery):
     await callback_query.message.edit_reply_markup()
 
     try:
-        await bot.send_message(
+        await outbox.send_message(
             int(uid), "❌ Оплату відхилено. Завантажте правильний чек."
         )
     except Exception as e:
@@ -1029,6 +1270,7 @@ async def go_online(message: types.Message, state: FSMContext):
     driver["online"] = True
     drivers[uid] = driver
     save_drivers(drivers)
+    sync_driver(uid)
 
     await message.answer(
         "🟢 Ви вийшли онлайн. Замовлення будуть надходити автоматично.",
@@ -1045,7 +1287,7 @@ async def go_offline(message: types.Message, state: FSMContext):
     if uid in drivers:
         drivers[uid]["online"] = False
         save_drivers(drivers)
-        drivers = load_drivers()
+        sync_driver(uid)
 
     await message.answer(
         "🔴 Ви вийшли офлайн.",
@@ -1060,7 +1302,7 @@ async def support(message: types.Message):
 
 async def show_order_waiting_screen(chat_id: int):
     try:
-        await bot.send_message(
+        await outbox.send_message(
             chat_id,
             "🚖 Очікування нових замовлень…",
             reply_markup=driver_main_menu(chat_id),
@@ -1144,7 +1386,7 @@ async def reject_payment(call: types.CallbackQuery):
     await call.message.edit_caption(
         caption=call.message.caption + "\n❌ Оплату відхилено адміністратором"
     )
-    await bot.send_message(
+    await outbox.send_message(
         uid, "❌ Ваш платіж відхилено. Зв’яжіться з адміністратором."
     )
     await call.answer()
@@ -1160,6 +1402,7 @@ async def set_pickup_distance(call: types.CallbackQuery):
         return
     drivers.setdefault(uid, {})["pickup_km"] = val
     save_drivers(drivers)
+    sync_driver(uid)
 
     pay = drivers.get(uid, {}).get("payment_method")
     if pay in ("cash", "card", "both"):
@@ -1178,7 +1421,7 @@ async def set_pickup_distance(call: types.CallbackQuery):
         "• Оплата: <b>не обрано</b>\n\n"
         "Оберіть тип оплати нижче ⤵️"
     )
-    await bot.send_message(call.from_user.id, text, parse_mode="HTML")
+    await outbox.send_message(call.from_user.id, text, parse_mode="HTML")
     dummy = types.Message(
         message_id=call.message.message_id,
         date=call.message.date,
@@ -1289,33 +1532,21 @@ def get_order_lock(order_id: str) -> asyncio.Lock:
     return _order_locks[order_id]
 
 
-async def dispatch_order_to_nearby_drivers(order: dict):
-    from math import radians, sin, cos, sqrt, atan2
+def observe_order_wait(name: str, order: Dict[str, Any]):
+    """Time since the order was created — overall and per priority lane."""
+    wait = order_age_sec(order)
+    metrics.histogram(name).observe(wait)
+    metrics.histogram(f"{name}.p{int(order.get('priority') or 0)}").observe(wait)
 
-    def haversine(coord1, coord2):
-        """Рахує відстань (у км) між двома координатами (lat, lon)"""
-        R = 6371.0  # радіус Землі в км
-        lat1, lon1 = coord1
-        lat2, lon2 = coord2
 
-        dlat = radians(lat2 - lat1)
-        dlon = radians(lon2 - lon1)
-
-        a = (
-            sin(dlat / 2) ** 2
-            + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon / 2) ** 2
-        )
-        c = 2 * atan2(sqrt(a), sqrt(1 - a))
-
-        return R * c
-
-    nearby: List[int] = []
+def eligible_drivers(order: dict) -> List[Tuple[float, int]]:
+    """(distance_km, driver_id) of every driver who may take the order,
+    nearest first."""
+    nearby: List[Tuple[float, int]] = []
     pickup_coords = None
 
     try:
-        pickup_coords = tuple(
-            order.get("route", {}).get("start", {}).get("coords") or []
-        )
+        pickup_coords = tuple(order_pickup(order) or [])
         if len(pickup_coords) != 2:
             pickup_coords = None
         logging.info(f"[DISPATCH] Pickup coords = {pickup_coords}")
@@ -1323,11 +1554,21 @@ async def dispatch_order_to_nearby_drivers(order: dict):
         logging.error(f"[DISPATCH] Error extracting pickup coords: {e}")
         pickup_coords = None
 
-    drivers = load_drivers()
-
-    for uid, d in drivers.items():
+    for uid, d in list(drivers.items()):
         logging.info(f"[FILTER] Checking driver {uid}: {d}")
 
+        # --- 0. Шардинг: лише водії з зон цього інстансу ---
+        if SHARDED and not owns_zone(zone_of(d.get("last_location"))):
+            continue
+
+        # --- 0b. Зайняті: активна поїздка або відкритий офер іншого замовлення ---
+        if d.get("active_order_id"):
+            logging.info(f"[FILTER] Driver {uid} skipped (on a trip)")
+            continue
+        if is_reserved(int(uid), order.get("id")):
+            logging.info(f"[FILTER] Driver {uid} skipped (holds another offer)")
+            continue
+
         # --- 1. Перевірка на approve + online ---
         if not d.get("approved") or not d.get("online"):
             logging.info(f"[FILTER] Driver {uid} skipped (not approved/online)")
@@ -1344,9 +1585,7 @@ async def dispatch_order_to_nearby_drivers(order: dict):
             "на картку": "card",
         }
 
-        order_payment = str(
-            order.get("payment_type") or order.get("payment") or ""
-        ).lower()
+        order_payment = str(order.get("payment") or "").lower()
         order_payment = PAYMENT_ALIASES.get(order_payment, order_payment)
 
         driver_payment = d.get("payment_method", "both").lower()
@@ -1395,7 +1634,7 @@ async def dispatch_order_to_nearby_drivers(order: dict):
             continue
 
         try:
-            dist = haversine(driver_loc, pickup_coords)
+            dist = haversine_km(driver_loc, pickup_coords)
             if dist > float(d.get("pickup_km", 5.0)):
                 logging.info(
                     f"[FILTER] Driver {uid} skipped (distance {dist:.2f} km > {d.get('pickup_km')} km)"
@@ -1406,49 +1645,344 @@ async def dispatch_order_to_nearby_drivers(order: dict):
             continue
 
         # Якщо водій пройшов усі фільтри — додаємо його
-        nearby.append(int(uid))
+        nearby.append((dist, int(uid)))
 
     logging.info(f"[FILTER] Total nearby drivers = {len(nearby)}")
+    nearby.sort()
+    return nearby
 
-    if not nearby:
-        logging.info("No nearby drivers for order %s", order.get("id"))
-        return
 
-    order["status"] = "offered"
-    order["accepted_by"] = None
-    order["offered_at"] = now_iso()
-    save_orders()
+# Order id -> {driver_id: (wave, offered_at)}; accept latency per wave
+OFFER_WAVES: Dict[str, Dict[int, Tuple[int, float]]] = {}
 
-    kb = offer_inline_kb(order["id"])
-    text = (
-        format_order_card(order) + f"\n⏳ У вас {OFFER_TIMEOUT_SEC} сек, щоб прийняти."
+# Offer waves and expiry: one "offer:<order_id>" deadline per order
+deadlines = DeadlineScheduler(os.path.join(DATA_DIR, "timers.json"))
+
+# Order id -> (card text, keyboard), rendered once per dispatch
+OFFER_CARDS: Dict[str, Tuple[str, InlineKeyboardMarkup]] = {}
+# Order id -> time.monotonic() when the MQ consumer got it
+ORDER_RECEIVED_AT: Dict[str, float] = {}
+
+# Order id -> {driver_id: message_id} of the offer cards still on screen
+OFFER_MESSAGES: Dict[str, Dict[int, int]] = {}
+OFFER_REVOKE_CONCURRENCY = max(1, int(os.getenv("OFFER_REVOKE_CONCURRENCY", "5")))
+REVOKE_TAKEN = "🚫 Замовлення вже прийняв інший водій."
+REVOKE_EXPIRED = "⌛ Час на прийняття замовлення вийшов."
+REVOKE_GONE = "🚫 Замовлення вже неактуальне."
+
+
+def revoke_offers(order_id: str, text: str, keep: Optional[int] = None):
+    """Replace the order's live offer cards (all but `keep`'s) with `text`
+    and drop their buttons. Runs in the background, a few edits at a time."""
+    messages = OFFER_MESSAGES.pop(order_id, {})
+    targets = [(did, mid) for did, mid in messages.items() if did != keep]
+    if targets:
+        asyncio.create_task(_revoke(order_id, targets, text))
+
+
+async def _revoke(order_id: str, targets: List[Tuple[int, int]], text: str):
+    slots = asyncio.Semaphore(OFFER_REVOKE_CONCURRENCY)
+
+    async def one(did: int, mid: int):
+        async with slots:
+            try:
+                await outbox.edit_message_text(
+                    text, chat_id=did, message_id=mid, reply_markup=None, priority=DISPATCH
+                )
+            except Exception as e:  # already deleted / not modified
+                logging.info(f"[DISPATCH] Offer {order_id} for {did} not revoked: {e}")
+
+    with metrics.histogram("dispatch.revoke_sec").timer():
+        await asyncio.gather(*(one(did, mid) for did, mid in targets))
+    metrics.counter("dispatch.offers_revoked").inc(len(targets))
+
+
+# Soft reservations: driver_id -> (order_id, until). A driver with an open
+# offer is not offered anything else until they answer or the offer expires.
+RESERVATIONS: Dict[int, Tuple[str, float]] = {}
+
+
+def is_reserved(did: int, order_id: Optional[str] = None) -> bool:
+    held = RESERVATIONS.get(did)
+    if not held:
+        return False
+    if held[1] <= time_module.monotonic():
+        del RESERVATIONS[did]
+        return False
+    return held[0] != order_id
+
+
+def reserve(did: int, order_id: str, until: float) -> bool:
+    if is_reserved(did, order_id):
+        return False
+    RESERVATIONS[did] = (order_id, until)
+    return True
+
+
+def release(did: int, order_id: str):
+    held = RESERVATIONS.get(did)
+    if held and held[0] == order_id:
+        del RESERVATIONS[did]
+
+
+def drop_offer(order_id: str, did: int):
+    """The driver declined: free them, forget their card."""
+    release(did, order_id)
+    OFFER_MESSAGES.get(order_id, {}).pop(did, None)
+    metrics.gauge("dispatch.reserved_drivers").set(len(RESERVATIONS))
+
+
+def release_order(order_id: str):
+    """Free every driver who got an offer for this order."""
+    for did in OFFER_WAVES.get(order_id, ()):
+        release(did, order_id)
+    metrics.gauge("dispatch.reserved_drivers").set(len(RESERVATIONS))
+
+
+def wave_radius_km(wave: int) -> float:
+    return DISPATCH_WAVE_RADII_KM[min(wave, len(DISPATCH_WAVE_RADII_KM) - 1)]
+
+
+async def send_offer_wave(
+    order: dict, wave: int, started: float, only: Optional[int] = None
+) -> int:
+    """Offer the order to the next DISPATCH_WAVE_SIZE best-scored drivers
+    (scoring.py) within this wave's radius who have not seen it yet (or just
+    to `only`, the driver batch matching picked). Returns how many got it."""
+    offered = OFFER_WAVES.setdefault(order["id"], {})
+    radius = wave_radius_km(wave)
+    batch = [
+        did
+        for dist, did in driver_features.rank(eligible_drivers(order))
+        if (did == only if only is not None else dist <= radius)
+        and did not in offered
+    ][:DISPATCH_WAVE_SIZE]
+    # reserve before the first await, so a concurrent dispatch can't take them
+    until = time_module.monotonic() + max(
+        0.0, started + OFFER_TIMEOUT_SEC - time_module.time()
+    )
+    batch = [did for did in batch if reserve(did, order["id"], until)]
+    metrics.gauge("dispatch.reserved_drivers").set(len(RESERVATIONS))
+    if not batch:
+        return 0
+
+    if order.get("status") != "offered":
+        order["status"] = "offered"
+        order["accepted_by"] = None
+        order["offered_at"] = now_iso()
+        save_orders()
+        observe_order_wait("orders.offer_wait_sec", order)
+
+    wave_start = time_module.monotonic()
+    left = max(1, int(started + OFFER_TIMEOUT_SEC - time_module.time()))
+    card, kb = OFFER_CARDS.get(order["id"]) or (
+        format_order_card(order),
+        offer_inline_kb(order["id"]),
     )
+    text = card + f"\n⏳ У вас {left} сек, щоб прийняти."
+
+    messages = OFFER_MESSAGES.setdefault(order["id"], {})
 
-    for did in nearby:
+    async def send(did: int):
+        offered[did] = (wave, time_module.monotonic())
         try:
-            await bot.send_message(did, text, parse_mode="HTML", reply_markup=kb)
+            msg = await outbox.send_message(
+                did, text, parse_mode="HTML", reply_markup=kb, priority=DISPATCH
+            )
+            messages[did] = msg.message_id
         except Exception as e:
             logging.error(f"[DISPATCH] Error sending offer to driver {did}: {e}")
 
-    # --- Таймер завершення оферу ---
-    async def expire():
-        await asyncio.sleep(OFFER_TIMEOUT_SEC)
-        lock = get_order_lock(order["id"])
-        async with lock:
-            for o in orders_state["orders"]:
-                if (
-                    o["id"] == order["id"]
-                    and o.get("accepted_by") is None
-                    and o.get("status") == "offered"
-                ):
-                    o["status"] = "expired"
-                    save_orders()
-                    logging.info(
-                        f"[DISPATCH] Order {order['id']} expired (no driver accepted)"
-                    )
-                    break
+    await asyncio.gather(*(send(did) for did in batch))
+    metrics.histogram("dispatch.fanout_sec").observe(time_module.monotonic() - wave_start)
+    received = ORDER_RECEIVED_AT.pop(order["id"], None)
+    if received is not None:
+        metrics.histogram("orders.received_to_offered_sec").observe(
+            time_module.monotonic() - received
+        )
+    metrics.counter(f"dispatch.offers_sent.w{wave}").inc(len(batch))
+    logging.info(
+        f"[DISPATCH] Order {order['id']} wave {wave} (≤{radius:g} km): {batch}"
+    )
+    return len(batch)
+
+
+# "searching": re-dispatched orders recorded by older versions
+OPEN_STATUSES = ("new", "offered", "searching")
+
+
+def is_redelivery(existing: Dict[str, Any], order: Dict[str, Any]) -> bool:
+    """`order` is a copy of one already taken or being dispatched here — not
+    a re-dispatch, which raises `attempt` (e.g. after a driver cancel)."""
+    if existing.get("accepted_by") is not None:
+        return True
+    if deadlines.due(f"offer:{existing.get('id')}") is None:
+        return False  # waves are over (expired) or never started: dispatch again
+    return int(order.get("attempt") or 0) <= int(existing.get("attempt") or 0)
+
+
+def order_still_open(order_id: str) -> bool:
+    o = next((o for o in orders_state["orders"] if o.get("id") == order_id), None)
+    return bool(o) and o.get("accepted_by") is None and o.get("status") in OPEN_STATUSES
 
-    asyncio.create_task(expire())
+
+def forget_offer(order_id: str, revoke_text: str, keep: Optional[int] = None):
+    """Drop the order's dispatch state: reservations, live cards, caches."""
+    release_order(order_id)
+    revoke_offers(order_id, revoke_text, keep=keep)
+    OFFER_WAVES.pop(order_id, None)
+    OFFER_CARDS.pop(order_id, None)
+    ORDER_RECEIVED_AT.pop(order_id, None)
+
+
+def schedule_offer_wave(order_id: str, wave: int, started: float):
+    """Next wave in DISPATCH_WAVE_INTERVAL_SEC, or the expiry if that's sooner."""
+    deadlines.schedule(
+        f"offer:{order_id}",
+        "offer_wave",
+        at=min(started + OFFER_TIMEOUT_SEC, time_module.time() + DISPATCH_WAVE_INTERVAL_SEC),
+        data={"order_id": order_id, "wave": wave, "started": started},
+    )
+
+
+async def on_offer_deadline(key: str, data: Dict[str, Any]):
+    """One more wave until somebody accepts, expiry at OFFER_TIMEOUT_SEC."""
+    oid = data["order_id"]
+    wave = int(data["wave"])
+    started = float(data["started"])
+    if not order_still_open(oid):
+        forget_offer(oid, REVOKE_GONE)
+        return
+
+    if time_module.time() < started + OFFER_TIMEOUT_SEC:
+        order = next(o for o in orders_state["orders"] if o.get("id") == oid)
+        await send_offer_wave(order, wave, started)
+        # an accept or a re-dispatch during the sends owns the order now
+        if deadlines.due(key) is None and order_still_open(oid):
+            schedule_offer_wave(oid, wave + 1, started)
+        return
+
+    revoke_text = REVOKE_GONE
+    async with get_order_lock(oid):
+        o = next((o for o in orders_state["orders"] if o.get("id") == oid), None)
+        if o and o.get("accepted_by") is None and o.get("status") == "offered":
+            o["status"] = "expired"
+            save_orders()
+            revoke_text = REVOKE_EXPIRED
+            logging.info(f"[DISPATCH] Order {oid} expired (no driver accepted)")
+        elif not OFFER_WAVES.get(oid):
+            logging.info("No nearby drivers for order %s", oid)
+    forget_offer(oid, revoke_text)
+
+
+deadlines.on("offer_wave", on_offer_deadline)
+
+
+def close_offer_waves(order_id: str, accepted_by: Optional[int] = None):
+    """Stop the order's waves and revoke the other drivers' offers;
+    record accept latency for the driver's wave."""
+    info = OFFER_WAVES.get(order_id, {}).get(accepted_by)
+    if info:
+        wave, offered_at = info
+        latency = time_module.monotonic() - offered_at
+        metrics.histogram("dispatch.accept_latency_sec").observe(latency)
+        metrics.histogram(f"dispatch.accept_latency_sec.w{wave}").observe(latency)
+    deadlines.cancel(f"offer:{order_id}")
+    forget_offer(order_id, REVOKE_TAKEN, keep=accepted_by)
+
+
+async def dispatch_order_to_nearby_drivers(order: dict, preferred: Optional[int] = None):
+    """First wave goes out right away; later waves and the expiry are
+    deadlines in the bot's scheduler, so the dispatch worker is free again."""
+    oid = order["id"]
+    if deadlines.cancel(f"offer:{oid}"):
+        # re-dispatch: start over
+        release_order(oid)
+        revoke_offers(oid, REVOKE_GONE)
+    started = time_module.time()
+    OFFER_WAVES[oid] = {}
+    order = next((o for o in orders_state["orders"] if o.get("id") == oid), order)
+    OFFER_CARDS[oid] = (format_order_card(order), offer_inline_kb(oid))
+    sent = await send_offer_wave(order, 0, started, only=preferred)
+    if not sent and preferred is not None:
+        await send_offer_wave(order, 0, started)  # matched driver is gone
+    if order_still_open(oid):
+        schedule_offer_wave(oid, 1, started)
+
+
+# ----------------------------
+# Dispatch queue
+# ----------------------------
+
+# (-priority, seq, enqueued_at, order); created on the bot loop in on_startup
+dispatch_queue: Optional[asyncio.PriorityQueue] = None
+dispatch_tasks: List[asyncio.Task] = []
+supply_task: Optional[asyncio.Task] = None
+calibration_task: Optional[asyncio.Task] = None
+_dispatch_seq = itertools.count()
+
+
+async def enqueue_dispatch(order: Dict[str, Any]):
+    """Waits while the queue is full — the caller's MQ thread blocks with it."""
+    prio = int(order.get("priority") or 0)
+    await dispatch_queue.put((-prio, next(_dispatch_seq), time_module.monotonic(), order))
+    metrics.gauge("dispatch.queue_depth").set(dispatch_queue.qsize())
+
+
+async def run_dispatch(item: tuple, preferred: Optional[int] = None):
+    _, _, enqueued_at, order = item
+    metrics.gauge("dispatch.queue_depth").set(dispatch_queue.qsize())
+    metrics.histogram("dispatch.queue_wait_sec").observe(
+        time_module.monotonic() - enqueued_at
+    )
+    try:
+        with metrics.histogram("dispatch.run_sec").timer():
+            await dispatch_order_to_nearby_drivers(order, preferred)
+    except Exception:
+        logging.exception(f"[DISPATCH] Failed on order {order.get('id')}")
+    finally:
+        dispatch_queue.task_done()
+
+
+async def dispatch_worker(n: int):
+    while True:
+        await run_dispatch(await dispatch_queue.get())
+
+
+async def dispatch_batcher():
+    """DISPATCH_BATCH_MS > 0: orders that arrive within one window are matched
+    to drivers together (matching.assign — least total pickup distance), and
+    each order's first wave is its assigned driver only."""
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(DISPATCH_WORKERS)
+
+    async def run(item: tuple, preferred: Optional[int]):
+        async with slots:
+            await run_dispatch(item, preferred)
+
+    while True:
+        items = [await dispatch_queue.get()]
+        deadline = loop.time() + DISPATCH_BATCH_MS / 1000.0
+        while len(items) < DISPATCH_BATCH_MAX:
+            left = deadline - loop.time()
+            if left <= 0:
+                break
+            try:
+                items.append(await asyncio.wait_for(dispatch_queue.get(), left))
+            except asyncio.TimeoutError:
+                break
+        metrics.histogram("dispatch.batch_size").observe(len(items))
+        plan: Dict[int, Optional[int]] = {}
+        try:
+            with metrics.histogram("dispatch.batch_solve_sec").timer():
+                costs = [
+                    {did: dist for dist, did in eligible_drivers(item[3])}
+                    for item in items
+                ]
+                plan = assign(costs) if len(items) > 1 else {}
+        except Exception:
+            logging.exception("[DISPATCH] Batch matching failed, dispatching one by one")
+        await asyncio.gather(*(run(item, plan.get(i)) for i, item in enumerate(items)))
 
 
 # ----------------------------
@@ -1481,10 +2015,8 @@ def build_driver_card(uid: str) -> dict:
 
 
 def publish_confirmation(confirmation: Dict[str, Any]):
-    """Publish confirmation to RabbitMQ in a short-lived connection."""
+    """Publish confirmation to QUEUE_CONFIRMATIONS via the message bus."""
     try:
-        connection = pika.BlockingConnection(pika.ConnectionParameters(RABBITMQ_HOST))
-        channel = connection.channel()
         # Ensure driver card present
         try:
             if "driver" not in confirmation and confirmation.get("driver_id"):
@@ -1493,18 +2025,51 @@ def publish_confirmation(confirmation: Dict[str, Any]):
                 )
         except Exception:
             pass
-        channel.queue_declare(queue=QUEUE_CONFIRMATIONS, durable=True)
-        channel.basic_publish(
-            exchange="",
-            routing_key=QUEUE_CONFIRMATIONS,
-            body=json.dumps(confirmation, ensure_ascii=False).encode("utf-8"),
-        )
-        connection.close()
+        get_bus().publish(QUEUE_CONFIRMATIONS, encode_confirmation(confirmation))
         logging.info("[SEND] confirmations → %s", confirmation)
     except Exception as e:
         logging.exception(f"Failed to publish confirmation: {e}")
 
 
+async def supply_publisher():
+    """Publish driver_supply on QUEUE_SUPPLY when it changed (checked every
+    SUPPLY_PUBLISH_SEC) or SUPPLY_HEARTBEAT_SEC passed, so passenger-bot can
+    tell a quiet feed from a dead one."""
+    sent_version, sent_at = -1, 0.0
+    while True:
+        now = time_module.monotonic()
+        if driver_supply.version != sent_version or now - sent_at >= SUPPLY_HEARTBEAT_SEC:
+            version = driver_supply.version
+            try:
+                get_bus().publish(QUEUE_SUPPLY, encode_supply(driver_supply.snapshot()))
+                sent_version, sent_at = version, now
+            except Exception as e:
+                logging.exception(f"[SUPPLY] Failed to publish: {e}")
+        await asyncio.sleep(SUPPLY_PUBLISH_SEC)
+
+
+async def calibration_job():
+    """Rebuild the calibration table from orders.json (in a worker thread,
+    orders finishing meanwhile are replayed on top), then save it whenever
+    finished orders changed it, every CALIBRATION_SAVE_SEC."""
+    calibration.rebuild_start()
+    try:
+        tables, n = await asyncio.to_thread(calibration.build, stream_orders(ORDERS_FILE))
+    except Exception as e:
+        calibration.rebuild_abort()
+        logging.exception(f"[CALIBRATION] Rebuild failed, keeping the saved table: {e}")
+    else:
+        calibration.rebuild_finish(tables)
+        logging.info(f"[CALIBRATION] Rebuilt from {n} samples")
+    while True:
+        if calibration.dirty:
+            try:
+                calibration.save()
+            except OSError as e:
+                logging.exception(f"[CALIBRATION] Failed to save: {e}")
+        await asyncio.sleep(CALIBRATION_SAVE_SEC)
+
+
 @router.callback_query(F.data.startswith("accept:"))
 async def cb_accept(call: types.CallbackQuery):
     order_id = call.data.split(":", 1)[1]
@@ -1528,10 +2093,17 @@ async def cb_accept(call: types.CallbackQuery):
         target["status"] = "accepted"
         target["accepted_by"] = int(uid)
         target["accepted_at"] = now_iso()
+        pickup = order_pickup(target)
+        if d.get("last_location") and pickup:
+            # straight-line km to the pickup: calibration's pickup speed sample
+            target["pickup_km"] = round(haversine_km(d["last_location"], pickup), 3)
         drivers[uid]["active_order_id"] = order_id
         drivers[uid]["today"]["accepted"] = drivers[uid]["today"].get("accepted", 0) + 1
         save_orders()
         save_drivers(drivers)
+    sync_driver(uid)
+    close_offer_waves(order_id, int(uid))
+    announce_order_closed(target, int(uid))
 
     await call.message.edit_text(
         format_order_card(target) + "\n✅ Ви прийняли замовлення.", parse_mode="HTML"
@@ -1604,12 +2176,15 @@ async def cb_accept(call: types.CallbackQuery):
 @router.callback_query(F.data.startswith("decline:"))
 async def cb_decline(call: types.CallbackQuery):
     uid = str(call.from_user.id)
+    order_id = call.data.split(":", 1)[1]
+    drop_offer(order_id, int(uid))  # card is deleted below
+    announce_offer_declined(order_id, int(uid))
     if uid in drivers:
         drivers[uid]["today"]["declined"] = drivers[uid]["today"].get("declined", 0) + 1
         save_drivers(drivers)
+        sync_driver(uid)
 
         await call.message.delete()
-        await call.message.delete()
     await call.answer("Відхилено.")
 
 
@@ -1698,6 +2273,7 @@ async def cb_finish(call: types.CallbackQuery):
     target["status"] = "done"
     target["finished_at"] = now_iso()
     save_orders()
+    calibration.observe(target)
 
     # --- Додаємо статистику ---
     price = float(target.get("price", 0) or 0)
@@ -1710,11 +2286,13 @@ async def cb_finish(call: types.CallbackQuery):
 
     # --- Звільняємо водія від активного замовлення ---
     drivers[uid]["active_order_id"] = None
+    drivers[uid]["last_finished_at"] = now_iso()
 
     # --- Водій залишається онлайн ---
     drivers[uid]["online"] = True
 
     save_drivers(drivers)
+    sync_driver(uid)
 
     # --- Повідомлення водію ---
     await call.message.answer(
@@ -1757,7 +2335,6 @@ async def cb_cancel(call: types.CallbackQuery):
     target["accepted_by"] = None
     target.pop("sent_to", None)
     target.pop("viewed_by", None)
-    target["created_at"] = now_iso()
 
     # водій вільний від замовлення і лишається онлайн
     driver["active_order_id"] = None
@@ -1765,11 +2342,13 @@ async def cb_cancel(call: types.CallbackQuery):
 
     save_orders()
     save_drivers(drivers)
+    sync_driver(uid)
 
     await call.message.edit_text("❌ Ви скасували поїздку.")
     await call.answer()
 
-    # 2) повідомляємо пасажирський бот через MQ
+    # 2) повідомляємо пасажирський бот через MQ — він і повертає
+    #    замовлення у пошук (ConfirmConsumer, driver_cancelled)
     publish_confirmation(
         {
             "status": "driver_cancelled",
@@ -1778,12 +2357,6 @@ async def cb_cancel(call: types.CallbackQuery):
         }
     )
 
-    # 3) повертаємо замовлення у пошук іншого водія
-    target["status"] = "searching"
-    target["accepted_by"] = None
-    save_orders()
-    publish_order(target)
-
 
 # ----------------------------
 # Misc commands
@@ -1795,6 +2368,13 @@ async def ping(message: types.Message):
     await message.answer("pong")
 
 
+@router.message(Command("metrics"))
+async def show_metrics(message: types.Message):
+    if not is_admin(message.from_user.id, message.chat.id):
+        return
+    await message.answer(f"<pre>{metrics.render()}</pre>", parse_mode="HTML")
+
+
 @router.message(Command("id"))
 async def my_id(message: types.Message):
     await message.answer(
@@ -1831,6 +2411,7 @@ async def save_geo_location(message: types.Message, state: FSMContext):
             message.location.longitude,
         ]
         save_drivers(drivers)
+        sync_driver(uid)
 
         await message.answer(
             f"✅ Локація оновлена\n🌍 https://maps.google.com/?q={message.location.latitude},{message.location.longitude}",
@@ -1866,6 +2447,7 @@ async def save_address_location(message: types.Message, state: FSMContext):
             if uid in drivers:
                 drivers[uid]["last_location"] = [lat, lon]
                 save_drivers(drivers)
+                sync_driver(uid)
 
                 await message.answer(
                     f"✅ Локація оновлена\n🌍 https://maps.google.com/?q={lat},{lon}",
@@ -1892,7 +2474,7 @@ async def back_to_menu(message: types.Message, state: FSMContext):
 
 
 # ----------------------------
-# RabbitMQ consumer (background thread)
+# Orders consumer (background thread)
 # ----------------------------
 
 
@@ -1900,86 +2482,182 @@ class MQConsumerThread(threading.Thread):
     def __init__(self, loop: asyncio.AbstractEventLoop):
         super().__init__(daemon=True)
         self.loop = loop
-        self._stop = threading.Event()
-        self.connection = None
-        self.channel = None
+        self._stop_event = threading.Event()
 
     def run(self):
-        while not self._stop.is_set():
-            try:
-                params = pika.ConnectionParameters(
-                    RABBITMQ_HOST, heartbeat=30, blocked_connection_timeout=300
-                )
-                self.connection = pika.BlockingConnection(params)
-                self.channel = self.connection.channel()
-                self.channel.queue_declare(queue=QUEUE_ORDERS, durable=True)
-                logging.info(f"[MQ] Connected. Consuming from '{QUEUE_ORDERS}'")
-
-                for method_frame, properties, body in self.channel.consume(
-                    QUEUE_ORDERS, inactivity_timeout=1, auto_ack=True
-                ):
-                    if self._stop.is_set():
-                        break
-                    if body is None:
-                        continue
-                    try:
-                        order = json.loads(body)
-
-                    except Exception:
-                        logging.exception("Invalid JSON from MQ")
-                        continue
-
-                    # Guarantee ID
-                    oid = str(order.get("id") or int(time.time() * 1000))
-                    order["id"] = oid
-
-                    # Store raw for pass-through to confirmation
-                    ORDERS_BY_ID[oid] = order
-
-                    # Put into orders_state list (ensure single instance)
-                    existing = next(
-                        (o for o in orders_state["orders"] if o.get("id") == oid), None
-                    )
-                    if existing:
-                        existing.update(order)
-                    else:
-                        orders_state["orders"].append(order)
-                    save_orders()
-
-                    # Schedule coroutine into bot loop
-                    asyncio.run_coroutine_threadsafe(
-                        dispatch_order_to_nearby_drivers(order.copy()), self.loop
-                    )
+        # The polling instance records every order (accept callbacks land
+        # there), dispatch shards only receive their own zones.
+        if DRIVER_BOT_POLLING:
+            keys = order_binding_keys(None)
+        else:
+            keys = order_binding_keys(SHARD_ZONES, SHARD_CLASSES)
+        get_bus().consume_topic(
+            ORDERS_EXCHANGE,
+            QUEUE_ORDERS,
+            keys,
+            self.handle,
+            self._stop_event,
+            max_priority=MAX_PRIORITY,
+        )
 
-                try:
-                    if self.connection and self.connection.is_open:
-                        self.connection.close()
-                except Exception:
-                    pass
+    def handle(self, body: bytes):
+        try:
+            order = decode_order(body)
+        except WireError as e:
+            logging.error(f"[MQ] Rejected order message: {e}")
+            return
+        oid = order["id"]
+        observe_order_wait("orders.queue_wait_sec", order)
+        existing = next((o for o in orders_state["orders"] if o.get("id") == oid), None)
+        if existing is not None and is_redelivery(existing, order):
+            # the passenger's timed republish of an order we already work on:
+            # refresh the record, keep its status and the running waves
+            existing.update({k: v for k, v in order.items() if k not in ("status", "attempt")})
+            save_orders()
+            metrics.counter("orders.redelivered").inc()
+            logging.info(f"[MQ] Order {oid} redelivered, dispatch continues")
+            return
+        # whatever the sender called it, an order on the bus is up for dispatch
+        order["status"] = "new"
 
-            except Exception as e:
-                logging.error(f"[MQ] Connection error: {e}. Reconnecting in 3s...")
-                time.sleep(3)
+        # Store raw for pass-through to confirmation
+        ORDERS_BY_ID[oid] = order
+
+        # Put into orders_state list (ensure single instance)
+        if existing:
+            existing.update(order)
+        else:
+            orders_state["orders"].append(order)
+        save_orders()
+
+        if not owns_order(order):
+            logging.info(f"[SHARD] Order {oid} recorded, dispatched by another shard")
+            return
+        ORDER_RECEIVED_AT[oid] = time_module.monotonic()
+
+        # Hand over to the dispatch workers. Blocking here is the backpressure:
+        # the message is acked only after the order got a place in the queue.
+        fut = asyncio.run_coroutine_threadsafe(enqueue_dispatch(order.copy()), self.loop)
+        with metrics.histogram("dispatch.enqueue_block_sec").timer():
+            while True:
+                try:
+                    fut.result(timeout=1)
+                    break
+                except concurrent.futures.TimeoutError:
+                    if self._stop_event.is_set():
+                        fut.cancel()
+                        logging.warning(f"[MQ] Shutdown: order {oid} not dispatched")
+                        return
 
     def stop(self):
-        self._stop.set()
+        self._stop_event.set()
+
+
+class DriverEventsThread(threading.Thread):
+    """Sharded mode only.
+
+    The polling instance answers `resync` requests with the full driver list;
+    dispatch shards keep the state of drivers inside their own zones and
+    follow accepts and declines made on the poller (`order_closed`,
+    `offer_declined`).
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        super().__init__(daemon=True)
+        self.loop = loop
+        self._stop_event = threading.Event()
+
+    def run(self):
+        bus = get_bus()
+        if DRIVER_BOT_POLLING:
+            keys = [driver_routing_key("resync")]
+        else:
+            keys = [driver_routing_key(z) for z in SHARD_ZONES]
+        bus.bind(ORDERS_EXCHANGE, QUEUE_DRIVERS, keys)
+        if not DRIVER_BOT_POLLING:
+            bus.publish_topic(
+                ORDERS_EXCHANGE, driver_routing_key("resync"), b'{"type": "resync"}'
+            )
+        bus.consume_topic(
+            ORDERS_EXCHANGE, QUEUE_DRIVERS, keys, self.handle, self._stop_event
+        )
+
+    def handle(self, body: bytes):
         try:
-            if self.connection and self.connection.is_open:
-                self.connection.close()
+            msg = json.loads(body)
         except Exception:
-            pass
+            logging.exception("Invalid JSON in driver events")
+            return
+        # driver state is owned by the bot loop — apply changes there
+        self.loop.call_soon_threadsafe(self.apply, msg)
+
+    @staticmethod
+    def apply(msg: Dict[str, Any]):
+        kind = msg.get("type")
+        if kind == "resync" and DRIVER_BOT_POLLING:
+            DRIVER_ZONES.clear()
+            for uid in list(drivers):
+                sync_driver(uid)
+        elif kind == "driver" and not DRIVER_BOT_POLLING:
+            uid = str(msg.get("uid"))
+            drivers[uid] = msg.get("driver") or {}
+            driver_features.refresh(uid, drivers[uid])
+        elif kind == "driver_left" and not DRIVER_BOT_POLLING:
+            drivers.pop(str(msg.get("uid")), None)
+            driver_features.refresh(str(msg.get("uid")), None)
+        elif kind == "order_closed" and not DRIVER_BOT_POLLING:
+            oid = str(msg.get("order_id"))
+            accepted_by = msg.get("accepted_by")
+            accepted_by = int(accepted_by) if accepted_by is not None else None
+            o = next((o for o in orders_state["orders"] if o.get("id") == oid), None)
+            if o and accepted_by is not None:
+                o["status"] = "accepted"
+                o["accepted_by"] = accepted_by
+                save_orders()
+            close_offer_waves(oid, accepted_by)
+        elif kind == "offer_declined" and not DRIVER_BOT_POLLING:
+            drop_offer(str(msg.get("order_id")), int(msg.get("driver_id")))
+
+    def stop(self):
+        self._stop_event.set()
 
 
 mq_thread: Optional[MQConsumerThread] = None
+drivers_thread: Optional[DriverEventsThread] = None
 
 
 async def on_startup():
-    global mq_thread
+    global mq_thread, drivers_thread, dispatch_queue, supply_task, calibration_task
     loop = asyncio.get_running_loop()
+    deadlines.start()
+    outbox.start()
+    if dispatch_queue is None:
+        dispatch_queue = asyncio.PriorityQueue(maxsize=DISPATCH_QUEUE_SIZE)
+        if DISPATCH_BATCH_MS > 0:
+            dispatch_tasks.append(asyncio.create_task(dispatch_batcher()))
+        else:
+            dispatch_tasks.extend(
+                asyncio.create_task(dispatch_worker(n)) for n in range(DISPATCH_WORKERS)
+            )
+        logging.info(
+            f"[DISPATCH] {DISPATCH_WORKERS} workers, queue size {DISPATCH_QUEUE_SIZE}, "
+            f"batch window {DISPATCH_BATCH_MS} ms"
+        )
+    if DRIVER_BOT_POLLING and supply_task is None:
+        supply_task = asyncio.create_task(supply_publisher())
+    if DRIVER_BOT_POLLING and calibration_task is None:
+        calibration_task = asyncio.create_task(calibration_job())
     if mq_thread is None or not mq_thread.is_alive():
         mq_thread = MQConsumerThread(loop)
         mq_thread.start()
         logging.info("[MQ] Consumer thread started")
+    if SHARDED and (drivers_thread is None or not drivers_thread.is_alive()):
+        drivers_thread = DriverEventsThread(loop)
+        drivers_thread.start()
+        logging.info(f"[SHARD] Zones {SHARD_ZONES}, classes {SHARD_CLASSES or 'all'}")
+        if DRIVER_BOT_POLLING:
+            for uid in list(drivers):
+                sync_driver(uid)
 
 
 async def on_shutdown():
@@ -1987,6 +2665,18 @@ async def on_shutdown():
     if mq_thread and mq_thread.is_alive():
         mq_thread.stop()
         logging.info("[MQ] Consumer thread stopped")
+    if drivers_thread and drivers_thread.is_alive():
+        drivers_thread.stop()
+    for task in dispatch_tasks:
+        task.cancel()
+    if supply_task:
+        supply_task.cancel()
+    if calibration_task:
+        calibration_task.cancel()
+        if calibration.dirty:
+            calibration.save()
+    await deadlines.stop()
+    await outbox.stop()
 
 
 dp.include_router(router)
@@ -1995,7 +2685,11 @@ dp.include_router(router)
 async def main():
     await on_startup()
     try:
-        await dp.start_polling(bot)
+        if DRIVER_BOT_POLLING:
+            await dp.start_polling(bot)
+        else:
+            # dispatch-only shard: offers are sent, callbacks go to the poller
+            await asyncio.Event().wait()
     finally:
         await on_shutdown()
 
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+Order ↔ driver assignment for batched dispatch.
+
+Orders that arrive within one batching window (DISPATCH_BATCH_MS) are matched
+to free drivers as a whole: `assign()` minimises the total pickup distance
+with the Hungarian method, `greedy()` is the one-by-one behaviour it replaces
+(every order takes its nearest still-free driver). simulate_dispatch.py
+compares the two.
+
+Pure Python, O(n³) — fine for the tens of orders a window holds.
+"""
+import math
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+INF = float("inf")
+
+# order index -> {driver id: distance km}; missing pair = driver not eligible
+Costs = Sequence[Mapping[int, float]]
+
+
+def haversine_km(a: Sequence[float], b: Sequence[float]) -> float:
+    lat1, lon1 = math.radians(a[0]), math.radians(a[1])
+    lat2, lon2 = math.radians(b[0]), math.radians(b[1])
+    h = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * 6371.0 * math.asin(math.sqrt(h))
+
+
+def hungarian(cost: List[List[float]]) -> List[int]:
+    """Min-cost assignment for an n×m matrix with n <= m.
+
+    Returns the column picked for every row. Classic potentials version
+    (e-maxx), rows and columns 1-based inside.
+    """
+    n = len(cost)
+    m = len(cost[0]) if n else 0
+    if n > m:
+        raise ValueError("hungarian() needs rows <= columns")
+    u = [0.0] * (n + 1)
+    v = [0.0] * (m + 1)
+    p = [0] * (m + 1)  # p[j] = row assigned to column j
+    way = [0] * (m + 1)
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = [INF] * (m + 1)
+        used = [False] * (m + 1)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            delta = INF
+            j1 = 0
+            for j in range(1, m + 1):
+                if used[j]:
+                    continue
+                cur = cost[i0 - 1][j - 1] - u[i0] - v[j]
+                if cur < minv[j]:
+                    minv[j] = cur
+                    way[j] = j0
+                if minv[j] < delta:
+                    delta = minv[j]
+                    j1 = j
+            for j in range(m + 1):
+                if used[j]:
+                    u[p[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+    rows = [0] * n
+    for j in range(1, m + 1):
+        if p[j]:
+            rows[p[j] - 1] = j - 1
+    return rows
+
+
+def assign(costs: Costs) -> Dict[int, Optional[int]]:
+    """Order index -> driver id (None when no eligible driver is left),
+    minimising the total distance of the matched pairs."""
+    driver_ids = sorted({did for row in costs for did in row})
+    if not costs:
+        return {}
+    if not driver_ids:
+        return {i: None for i in range(len(costs))}
+    finite = [d for row in costs for d in row.values()]
+    # "not eligible" must lose to any real pair, and to leaving the order unmatched
+    big = (max(finite) + 1.0) * (len(costs) + 1)
+    # one dummy column per order: "unmatched" is always possible, rows <= columns
+    matrix = []
+    for row in costs:
+        line = [row.get(did, big * 2) for did in driver_ids]
+        line.extend([big] * len(costs))
+        matrix.append(line)
+    picked = hungarian(matrix)
+    out: Dict[int, Optional[int]] = {}
+    for i, j in enumerate(picked):
+        ok = j < len(driver_ids) and driver_ids[j] in costs[i]
+        out[i] = driver_ids[j] if ok else None
+    return out
+
+
+def greedy(costs: Costs) -> Dict[int, Optional[int]]:
+    """Orders in arrival order, each takes its nearest still-free driver."""
+    taken = set()
+    out: Dict[int, Optional[int]] = {}
+    for i, row in enumerate(costs):
+        free = [(dist, did) for did, dist in row.items() if did not in taken]
+        if free:
+            _, did = min(free)
+            taken.add(did)
+            out[i] = did
+        else:
+            out[i] = None
+    return out
+
+
+def total_km(costs: Costs, plan: Mapping[int, Optional[int]]) -> Tuple[int, float]:
+    """(matched orders, summed pickup distance) of a plan."""
+    matched = [(i, did) for i, did in plan.items() if did is not None]
+    return len(matched), sum(costs[i][did] for i, did in matched)
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+One outbound queue for everything a bot sends to Telegram.
+
+Telegram allows ~30 messages per second per bot, about one per second in a
+private chat and 20 per minute in a group; going over gets a 429
+(RetryAfter) that stalls the bot. Every send_* / edit goes through here:
+
+  • a priority queue — TRANSACTIONAL (accept, arrived, trip start/end),
+    then DISPATCH (offers and their revocations), then INFO (everything
+    else); FIFO within a level;
+  • a per-chat token bucket, checked without waiting: a throttled chat's
+    message goes back to the queue after its wait and the worker moves on;
+  • the global bucket (ratelimit.TokenBucket), shared by all workers;
+  • RetryAfter pauses the global and the chat bucket for the time asked and
+    re-queues the call (up to `attempts` tries).
+
+`await outbox.send_message(chat_id, ..., priority=TRANSACTIONAL)` returns
+what the Bot method returns. From another thread:
+asyncio.run_coroutine_threadsafe(outbox.send_message(...), loop).
+Before `start()` (scripts, tests) calls go straight to the API.
+
+Metrics: telegram.queue_depth, telegram.send_sec (queued → sent),
+telegram.retry_after, telegram.requeued_chat.
+
+This module is kept identical in driver-bot/ and passenger-bot/.
+"""
+import asyncio
+import itertools
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from aiogram.exceptions import TelegramRetryAfter
+
+import metrics
+from ratelimit import TokenBucket
+
+TRANSACTIONAL = 0
+DISPATCH = 1
+INFO = 2
+
+# chat buckets idle this long are dropped (they'd be full again anyway)
+IDLE_BUCKET_SEC = 60.0
+PRUNE_EVERY = 1024
+
+
+class Outbox:
+    def __init__(
+        self,
+        bot,
+        rate: float = 25.0,
+        burst: int = 25,
+        chat_rate: float = 1.0,
+        chat_burst: int = 3,
+        group_rate: float = 20 / 60.0,
+        workers: int = 4,
+        attempts: int = 3,
+    ):
+        self.bot = bot
+        self.bucket = TokenBucket(rate, burst)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.workers = max(1, workers)
+        self.attempts = max(1, attempts)
+        self._chats: Dict[int, TokenBucket] = {}
+        self._lookups = 0
+        self._seq = itertools.count()
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._depth = metrics.gauge("telegram.queue_depth")
+        self._latency = metrics.histogram("telegram.send_sec")
+
+    # ---- lifecycle ----
+
+    def start(self):
+        """Start the workers on the running loop."""
+        if self._queue is not None:
+            return
+        self._queue = asyncio.PriorityQueue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    # ---- sending ----
+
+    async def call(self, chat_id: int, make: Callable[[], Awaitable[Any]], priority: int = INFO) -> Any:
+        """Run `make()` (one Bot API call for `chat_id`) when the limits allow."""
+        if self._queue is None:
+            return await make()
+        fut = asyncio.get_running_loop().create_future()
+        self._put((priority, next(self._seq), time.monotonic(), int(chat_id), make, fut, 0))
+        return await fut
+
+    def send_message(self, chat_id: int, *args, priority: int = INFO, **kwargs):
+        return self.call(chat_id, lambda: self.bot.send_message(chat_id, *args, **kwargs), priority)
+
+    def send_photo(self, chat_id: int, *args, priority: int = INFO, **kwargs):
+        return self.call(chat_id, lambda: self.bot.send_photo(chat_id, *args, **kwargs), priority)
+
+    def send_contact(self, chat_id: int, *args, priority: int = INFO, **kwargs):
+        return self.call(chat_id, lambda: self.bot.send_contact(chat_id, *args, **kwargs), priority)
+
+    def send_media_group(self, chat_id: int, *args, priority: int = INFO, **kwargs):
+        return self.call(
+            chat_id, lambda: self.bot.send_media_group(chat_id, *args, **kwargs), priority
+        )
+
+    def edit_message_text(self, text: str, chat_id: int, priority: int = INFO, **kwargs):
+        return self.call(
+            chat_id, lambda: self.bot.edit_message_text(text, chat_id=chat_id, **kwargs), priority
+        )
+
+    def delete_message(self, chat_id: int, message_id: int, priority: int = INFO):
+        return self.call(chat_id, lambda: self.bot.delete_message(chat_id, message_id), priority)
+
+    # ---- internals ----
+
+    def _put(self, item: tuple):
+        if self._queue is None:  # stopped meanwhile
+            item[5].cancel()
+            return
+        self._queue.put_nowait(item)
+        self._depth.set(self._queue.qsize())
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        self._lookups += 1
+        if self._lookups % PRUNE_EVERY == 0:
+            cutoff = time.monotonic() - IDLE_BUCKET_SEC
+            for cid in [c for c, b in self._chats.items() if b.updated < cutoff]:
+                del self._chats[cid]
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            # negative ids are groups and channels: 20 messages a minute
+            rate = self.group_rate if chat_id < 0 else self.chat_rate
+            bucket = self._chats[chat_id] = TokenBucket(rate, self.chat_burst)
+        return bucket
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._queue.get()
+            self._depth.set(self._queue.qsize())
+            priority, seq, queued, chat_id, make, fut, attempt = item
+            if fut.done():  # caller gave up
+                continue
+            chat = self._chat_bucket(chat_id)
+            wait = chat.try_acquire()
+            if wait:
+                metrics.counter("telegram.requeued_chat").inc()
+                loop.call_later(wait, self._put, item)
+                continue
+            await self.bucket.acquire()
+            try:
+                result = await make()
+            except TelegramRetryAfter as e:
+                metrics.counter("telegram.retry_after").inc()
+                logging.warning(f"[TG] Flood control in chat {chat_id}, waiting {e.retry_after}s")
+                self.bucket.pause(e.retry_after)
+                chat.pause(e.retry_after)
+                if attempt + 1 < self.attempts:
+                    self._put((priority, seq, queued, chat_id, make, fut, attempt + 1))
+                elif not fut.done():
+                    fut.set_exception(e)
+            except Exception as e:
+                if not fut.done():
+                    fut.set_exception(e)
+            else:
+                self._latency.observe(time.monotonic() - queued)
+                if not fut.done():
+                    fut.set_result(result)
@@ -2,3 +2,4 @@ aiogram
 python - dotenv
 geopy
 pytz
+msgpack
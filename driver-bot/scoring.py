@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Driver scoring for dispatch: which eligible driver sees an offer first.
+
+score = w_distance · (1 - km / DRIVER_SCORE_DISTANCE_KM)
+      + w_accept   · acceptance rate  ((accepted + 1) / (accepted + declined + 2))
+      + w_idle     · min(1, idle seconds since the last finished trip / DRIVER_SCORE_IDLE_SEC)
+      + w_rating   · (average rating - 1) / 4
+
+Weights come from DRIVER_SCORE_WEIGHTS ("distance:1,accept:0.5,idle:0.3,rating:0.4").
+
+Per-driver features live in FeatureCache and are refreshed when the driver's
+record changes (driver_bot.sync_driver), so ranking only touches floats: the
+acceptance and rating terms are folded into one precomputed `base`, and
+scoring a candidate is a couple of multiplications.
+"""
+import os
+import time
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+@lru_cache(maxsize=1)
+def weights() -> Dict[str, float]:
+    # read lazily: the bot calls load_dotenv() after importing this module
+    out = {"distance": 1.0, "accept": 0.5, "idle": 0.3, "rating": 0.4}
+    raw = os.getenv("DRIVER_SCORE_WEIGHTS", "")
+    for item in raw.split(","):
+        name, _, val = (part.strip() for part in item.partition(":"))
+        if name in out and val:
+            out[name] = float(val)
+    out["distance_km"] = float(os.getenv("DRIVER_SCORE_DISTANCE_KM", "5"))
+    out["idle_sec"] = float(os.getenv("DRIVER_SCORE_IDLE_SEC", "1800"))
+    out["default_rating"] = float(os.getenv("DRIVER_SCORE_DEFAULT_RATING", "4.5"))
+    return out
+
+
+def _epoch(value: Any) -> Optional[float]:
+    try:
+        return datetime.fromisoformat(str(value)).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+class FeatureCache:
+    """driver id -> (base, idle_since). Not thread-safe: used from the bot loop."""
+
+    def __init__(self):
+        self._base: Dict[int, float] = {}
+        self._idle_since: Dict[int, float] = {}
+
+    def refresh(self, uid: Any, d: Optional[Dict[str, Any]]):
+        uid = int(uid)
+        if not d:
+            self._base.pop(uid, None)
+            self._idle_since.pop(uid, None)
+            return
+        w = weights()
+        today = d.get("today") or {}
+        accepted = int(today.get("accepted", 0) or 0)
+        declined = int(today.get("declined", 0) or 0)
+        accept_rate = (accepted + 1) / (accepted + declined + 2)
+        rating = d.get("rating")
+        if not isinstance(rating, (int, float)):
+            rating = w["default_rating"]
+        rating_term = min(1.0, max(0.0, (float(rating) - 1.0) / 4.0))
+        self._base[uid] = w["accept"] * accept_rate + w["rating"] * rating_term
+        since = _epoch(d.get("last_finished_at")) or _epoch(d.get("approved_at"))
+        self._idle_since[uid] = since if since is not None else time.time()
+
+    def load(self, drivers: Dict[str, Dict[str, Any]]):
+        for uid, d in drivers.items():
+            self.refresh(uid, d)
+
+    def score(self, uid: Any, dist_km: float, now: Optional[float] = None) -> float:
+        uid = int(uid)
+        w = weights()
+        now = time.time() if now is None else now
+        idle = (now - self._idle_since.get(uid, now)) / w["idle_sec"]
+        return (
+            self._base.get(uid, 0.0)
+            + w["distance"] * (1.0 - dist_km / w["distance_km"])
+            + w["idle"] * (1.0 if idle > 1.0 else idle)
+        )
+
+    def rank(self, candidates: Iterable[Tuple[float, int]]) -> List[Tuple[float, int]]:
+        """(distance_km, driver_id) pairs, best score first."""
+        w = weights()
+        now = time.time()
+        base, idle_since = self._base, self._idle_since
+        w_dist = w["distance"] / w["distance_km"]
+        w_idle = w["idle"]
+        idle_full = now - w["idle_sec"]  # idle since before this = full bonus
+        idle_k = w_idle / w["idle_sec"]
+
+        def key(c: Tuple[float, int]) -> float:
+            since = idle_since.get(c[1], now)
+            idle = w_idle if since < idle_full else idle_k * (now - since)
+            return w_dist * c[0] - base.get(c[1], 0.0) - idle
+
+        return sorted(candidates, key=key)
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+Batched vs greedy dispatch on random orders/drivers (see matching.py).
+
+  python simulate_dispatch.py                          # defaults below
+  python simulate_dispatch.py --orders 8 --drivers 12 --rounds 500 --radius 5
+
+Each round drops orders and free drivers uniformly over a box around Kyiv
+centre; a driver may take an order within --radius km. Prints matched orders
+and deadhead (pickup) km for both strategies.
+"""
+import argparse
+import random
+import time
+
+from matching import assign, greedy, haversine_km, total_km
+
+KYIV = (50.4501, 30.5234)
+
+
+def random_point(rng: random.Random, spread_km: float):
+    dlat = spread_km / 111.32
+    dlon = spread_km / 71.0
+    return (
+        KYIV[0] + rng.uniform(-dlat, dlat),
+        KYIV[1] + rng.uniform(-dlon, dlon),
+    )
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--orders", type=int, default=6, help="orders per window")
+    ap.add_argument("--drivers", type=int, default=8, help="free drivers")
+    ap.add_argument("--rounds", type=int, default=300)
+    ap.add_argument("--spread", type=float, default=6.0, help="box half-size, km")
+    ap.add_argument("--radius", type=float, default=5.0, help="pickup radius, km")
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    rng = random.Random(args.seed)
+    totals = {"greedy": [0, 0.0, 0.0], "batch": [0, 0.0, 0.0]}
+    for _ in range(args.rounds):
+        drivers = [random_point(rng, args.spread) for _ in range(args.drivers)]
+        costs = []
+        for _ in range(args.orders):
+            pickup = random_point(rng, args.spread)
+            row = {}
+            for did, loc in enumerate(drivers):
+                dist = haversine_km(loc, pickup)
+                if dist <= args.radius:
+                    row[did] = dist
+            costs.append(row)
+        for name, solve in (("greedy", greedy), ("batch", assign)):
+            t0 = time.perf_counter()
+            plan = solve(costs)
+            totals[name][2] += time.perf_counter() - t0
+            matched, km = total_km(costs, plan)
+            totals[name][0] += matched
+            totals[name][1] += km
+
+    offered = args.orders * args.rounds
+    print(
+        f"{args.rounds} rounds × {args.orders} orders, {args.drivers} drivers, "
+        f"radius {args.radius:g} km"
+    )
+    for name, (matched, km, sec) in totals.items():
+        per = km / matched if matched else 0.0
+        print(
+            f"  {name:6}  matched {matched}/{offered}  deadhead {km:.1f} km "
+            f"({per:.2f} km/order)  solve {sec / args.rounds * 1000:.2f} ms/round"
+        )
+
+
+if __name__ == "__main__":
+    main()
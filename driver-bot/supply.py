@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Driver supply per zone for passenger-bot surge pricing.
+
+A driver is available when approved, online and not on a trip; they count
+in the zone (routing.zone_of) of their last location. The counters are kept
+up to date by driver_bot.sync_driver() on every driver change — one dict
+lookup and at most two increments — so a snapshot never scans the drivers.
+
+Next to the counters the index keeps every available driver's position and
+car classes ([lat, lon, [class, ...]]) — passenger-bot estimates pickup ETA
+from the nearest of them (eta.py).
+
+driver_bot publishes `snapshot()` on QUEUE_SUPPLY (wire.encode_supply).
+"""
+import time
+from typing import Any, Dict, List, Optional
+
+from routing import NO_ZONE, zone_of
+
+
+def available_zone(d: Optional[Dict[str, Any]]) -> Optional[str]:
+    if not d or not d.get("approved") or not d.get("online") or d.get("active_order_id"):
+        return None
+    zone = zone_of(d.get("last_location"))
+    return None if zone == NO_ZONE else zone
+
+
+def _position(d: Dict[str, Any]) -> List[Any]:
+    lat, lon = d["last_location"]
+    classes = sorted({str(c).lower() for c in d.get("classes") or ["standard"]})
+    return [round(float(lat), 5), round(float(lon), 5), classes]
+
+
+class SupplyIndex:
+    """zone -> available drivers. Not thread-safe: used from the bot loop."""
+
+    def __init__(self):
+        self._zone_of: Dict[str, str] = {}
+        self._counts: Dict[str, int] = {}
+        self._positions: Dict[str, List[Any]] = {}
+        self.version = 0  # bumped on every change, lets the publisher skip no-ops
+
+    def refresh(self, uid: Any, d: Optional[Dict[str, Any]]):
+        uid = str(uid)
+        zone = available_zone(d)
+        position = _position(d) if zone is not None else None
+        if position != self._positions.get(uid):
+            if position is None:
+                del self._positions[uid]
+            else:
+                self._positions[uid] = position
+            self.version += 1
+        prev = self._zone_of.get(uid)
+        if zone == prev:
+            return
+        if prev is not None:
+            left = self._counts[prev] - 1
+            if left:
+                self._counts[prev] = left
+            else:
+                del self._counts[prev]
+        if zone is None:
+            del self._zone_of[uid]
+        else:
+            self._zone_of[uid] = zone
+            self._counts[zone] = self._counts.get(zone, 0) + 1
+        self.version += 1
+
+    def load(self, drivers: Dict[str, Dict[str, Any]]):
+        for uid, d in drivers.items():
+            self.refresh(uid, d)
+
+    def count(self, zone: str) -> int:
+        return self._counts.get(zone, 0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "zones": dict(self._counts),
+            "drivers": list(self._positions.values()),
+            "at": time.time(),
+        }
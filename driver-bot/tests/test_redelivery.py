@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""The passenger's timed republish must not restart an order's offer waves."""
+import asyncio
+import os
+import tempfile
+import threading
+
+import pytest
+
+pytest.importorskip("aiogram")
+pytest.importorskip("dotenv")
+
+os.environ.setdefault("DRIVER_BOT_TOKEN", "123456:TEST-TOKEN")
+os.environ.setdefault("DRIVER_BOT_DATA_DIR", tempfile.mkdtemp())
+os.environ.setdefault("MQ_BACKEND", "memory")
+
+import driver_bot as db  # noqa: E402
+from wire import encode_order  # noqa: E402
+
+OID = "t-1"
+ORDER = {
+    "id": OID,
+    "pickup": {"coords": [50.45, 30.52], "address": "Хрещатик, 1"},
+    "tariff": "Стандарт",
+    "price": 200,
+    "status": "new",
+    "attempt": 0,
+}
+
+
+@pytest.fixture
+def dispatching():
+    """ORDER as it is after its first wave: offered, waves and cards live."""
+    db.orders_state["orders"] = [dict(ORDER, status="offered")]
+    db.OFFER_WAVES[OID] = {111: (0, 1.0)}
+    db.OFFER_MESSAGES[OID] = {111: 501, 222: 502}
+    db.deadlines.schedule(f"offer:{OID}", "offer_wave", delay=15, data={"order_id": OID})
+    yield
+    db.deadlines.cancel(f"offer:{OID}")
+    db.OFFER_WAVES.pop(OID, None)
+    db.OFFER_MESSAGES.pop(OID, None)
+    db.orders_state["orders"] = []
+
+
+def test_same_order_twice_keeps_waves_and_offers(dispatching):
+    due = db.deadlines.due(f"offer:{OID}")
+    # no loop: a redelivery must not reach the dispatch queue at all
+    consumer = db.MQConsumerThread(loop=None)
+    consumer.handle(encode_order(ORDER))
+    consumer.handle(encode_order(ORDER))
+
+    assert db.deadlines.due(f"offer:{OID}") == due
+    assert db.OFFER_WAVES[OID] == {111: (0, 1.0)}
+    assert db.OFFER_MESSAGES[OID] == {111: 501, 222: 502}
+    assert db.orders_state["orders"][0]["status"] == "offered"
+
+
+def test_higher_attempt_is_dispatched_again(dispatching):
+    loop = asyncio.new_event_loop()
+    runner = threading.Thread(target=loop.run_forever, daemon=True)
+    runner.start()
+    db.dispatch_queue = asyncio.PriorityQueue()
+    try:
+        db.MQConsumerThread(loop).handle(encode_order(dict(ORDER, attempt=1)))
+        assert db.dispatch_queue.qsize() == 1
+        assert db.orders_state["orders"][0]["attempt"] == 1
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        runner.join(1)
+        db.dispatch_queue = None
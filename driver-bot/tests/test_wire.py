@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+import json
+
+import pytest
+
+from wire import KIND_ORDER, WireError, decode_order, encode_order
+
+ORDER = {
+    "id": "w-1",
+    "pickup": {"coords": [50.45, 30.52], "address": "Хрещатик, 1"},
+    "dropoff": {"coords": [50.40, 30.60], "address": None},
+    "tariff": "Стандарт",
+    "attempt": 1,
+}
+
+
+def test_round_trip():
+    order = decode_order(encode_order(ORDER))
+    assert order["id"] == "w-1"
+    assert order["attempt"] == 1
+    assert order["dropoff"]["address"] is None
+
+
+@pytest.mark.parametrize("extra", [[1, 2], "x", 3])
+def test_extra_must_be_a_map(extra):
+    body = json.dumps({"v": 1, "k": KIND_ORDER, "i": "w-1", "p": {}, "t": "Стандарт", "x": extra})
+    with pytest.raises(WireError, match="x must be a map"):
+        decode_order(body.encode("utf-8"))
+
+
+@pytest.mark.parametrize("version", ["x", None, True, 1.5])
+def test_bad_version(version):
+    body = json.dumps({"v": version, "k": KIND_ORDER, "i": "w-1", "p": {}, "t": "Стандарт"})
+    with pytest.raises(WireError, match="wire version"):
+        decode_order(body.encode("utf-8"))
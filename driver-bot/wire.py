@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+Versioned wire format for bus messages (orders, confirmations and the
+driver supply feed).
+
+A message is one map with short keys plus `v` (format version) and `k`
+(kind), packed with msgpack. Decoding validates required fields and types
+and returns the canonical dict the bots work with (long field names, one
+flat shape — no nested route/pricing duplicates).
+
+Compatibility:
+  • bodies starting with `{` are JSON — either the same short-key map
+    (producer without msgpack installed) or the legacy long-key payload,
+    which is normalized to the canonical shape;
+  • fields outside the schema travel under `x` and come back unchanged.
+
+This module is kept identical in driver-bot/ and passenger-bot/.
+"""
+import json
+from typing import Any, Dict, List, Tuple
+
+try:
+    import msgpack
+except ImportError:  # fall back to JSON with the same compact map
+    msgpack = None
+
+WIRE_VERSION = 1
+
+KIND_ORDER = "order"
+KIND_CONFIRMATION = "confirmation"
+KIND_SUPPLY = "supply"
+
+# (canonical name, wire key, type, required)
+Field = Tuple[str, str, type, bool]
+
+ORDER_FIELDS: List[Field] = [
+    ("id", "i", str, True),
+    ("created_at", "c", str, False),
+    ("passenger", "u", dict, False),
+    ("pickup", "p", dict, True),
+    ("dropoff", "d", dict, False),
+    ("stops", "s", list, False),
+    ("distance_km", "km", float, False),
+    ("duration_min", "dm", float, False),
+    ("tariff", "t", str, True),
+    ("multiplier", "m", float, False),
+    ("extra_stops_fee", "sf", int, False),
+    ("price", "pr", int, False),
+    ("payment", "pay", str, False),
+    ("eta_min", "eta", int, False),
+    ("status", "st", str, False),
+    ("attempt", "a", int, False),
+    ("priority", "q", int, False),
+]
+
+CONFIRMATION_FIELDS: List[Field] = [
+    ("order_id", "o", str, True),
+    ("status", "st", str, True),
+    ("driver_id", "dr", int, False),
+    ("driver", "dc", dict, False),
+    ("free_wait_min", "fw", int, False),
+]
+
+# available drivers per zone (routing.zone_of) and where they are, published
+# by driver-bot
+SUPPLY_FIELDS: List[Field] = [
+    ("zones", "z", dict, True),
+    ("drivers", "dr", list, False),  # [lat, lon, [class, ...]] of each available driver
+    ("at", "t", float, True),
+]
+
+_SCHEMAS = {
+    KIND_ORDER: ORDER_FIELDS,
+    KIND_CONFIRMATION: CONFIRMATION_FIELDS,
+    KIND_SUPPLY: SUPPLY_FIELDS,
+}
+
+
+class WireError(ValueError):
+    """Message cannot be decoded or fails schema validation."""
+
+
+def _coerce(name: str, value: Any, typ: type) -> Any:
+    if typ is float or typ is int:
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                raise WireError(f"{name}: expected number, got {value!r}")
+        return float(value) if typ is float else int(round(value))
+    if typ is str:
+        if isinstance(value, (str, int)) and not isinstance(value, bool):
+            return str(value)
+        raise WireError(f"{name}: expected string, got {value!r}")
+    if not isinstance(value, typ):
+        raise WireError(f"{name}: expected {typ.__name__}, got {value!r}")
+    return value
+
+
+def _pack(kind: str, data: Dict[str, Any]) -> bytes:
+    fields = _SCHEMAS[kind]
+    known = {f[0] for f in fields}
+    msg: Dict[str, Any] = {"v": WIRE_VERSION, "k": kind}
+    for name, key, typ, required in fields:
+        value = data.get(name)
+        if value is None:
+            if required:
+                raise WireError(f"{kind}.{name} is required")
+            continue
+        msg[key] = _coerce(name, value, typ)
+    extra = {k: v for k, v in data.items() if k not in known and v is not None}
+    if extra:
+        msg["x"] = extra
+    if msgpack is not None:
+        return msgpack.packb(msg, use_bin_type=True)
+    return json.dumps(msg, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _unpack(kind: str, body: bytes) -> Dict[str, Any]:
+    if not body:
+        raise WireError("empty message")
+    try:
+        if body[:1] == b"{":
+            msg = json.loads(body.decode("utf-8"))
+        elif msgpack is not None:
+            msg = msgpack.unpackb(body, raw=False)
+        else:
+            raise WireError("binary message, but msgpack is not installed")
+    except WireError:
+        raise
+    except Exception as e:
+        raise WireError(f"undecodable message: {e}")
+    if not isinstance(msg, dict):
+        raise WireError("message is not a map")
+
+    if "v" not in msg:
+        msg = _LEGACY[kind](msg)
+        return _validate(kind, msg)
+
+    version = msg.get("v")
+    if isinstance(version, bool) or not isinstance(version, int):
+        raise WireError(f"bad wire version {version!r}")
+    if version > WIRE_VERSION:
+        raise WireError(f"unsupported wire version {version}")
+    if msg.get("k") != kind:
+        raise WireError(f"expected {kind}, got {msg.get('k')}")
+    extra = msg.get("x") or {}
+    if not isinstance(extra, dict):
+        raise WireError("x must be a map")
+    data: Dict[str, Any] = dict(extra)
+    for name, key, _typ, _required in _SCHEMAS[kind]:
+        if key in msg:
+            data[name] = msg[key]
+    return _validate(kind, data)
+
+
+def _validate(kind: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    for name, _key, typ, required in _SCHEMAS[kind]:
+        value = data.get(name)
+        if value is None:
+            if required:
+                raise WireError(f"{kind}.{name} is required")
+            data.pop(name, None)
+            continue
+        data[name] = _coerce(name, value, typ)
+    if kind == KIND_ORDER:
+        coords = data["pickup"].get("coords")
+        if not isinstance(coords, (list, tuple)) or len(coords) != 2:
+            raise WireError("order.pickup.coords must be [lat, lon]")
+    elif kind == KIND_SUPPLY:
+        data["zones"] = {
+            str(zone): _coerce(f"zones.{zone}", n, int) for zone, n in data["zones"].items()
+        }
+    return data
+
+
+# ----------------------------
+# Legacy JSON producers
+# ----------------------------
+
+
+def _number(value: Any):
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+
+def _legacy_order(d: Dict[str, Any]) -> Dict[str, Any]:
+    """Old payload: nested route/pricing + flat mirror + "Невідомо" fillers."""
+    route = d.get("route") if isinstance(d.get("route"), dict) else {}
+    pricing = d.get("pricing") if isinstance(d.get("pricing"), dict) else {}
+    out = {
+        k: v
+        for k, v in d.items()
+        if k not in ("route", "pricing", "payment_type", "payment_method", "destination")
+    }
+
+    pickup = d.get("pickup")
+    if not isinstance(pickup, dict) or not pickup.get("coords"):
+        pickup = {"coords": (route.get("start") or {}).get("coords")}
+    out["pickup"] = pickup
+    dropoff = d.get("dropoff")
+    if not isinstance(dropoff, dict):
+        dropoff = route.get("final")
+    out["dropoff"] = dropoff
+    out["stops"] = route.get("stops")
+    out["distance_km"] = _number(d.get("distance_km"))
+    if out["distance_km"] is None:
+        out["distance_km"] = _number(route.get("distance_km"))
+    tariff = d.get("tariff")
+    out["tariff"] = tariff if tariff and tariff != "Невідомо" else pricing.get("tariff")
+    out["multiplier"] = pricing.get("multiplier")
+    out["extra_stops_fee"] = pricing.get("extra_stops_fee")
+    out["price"] = _number(d.get("price"))
+    if out["price"] is None:
+        out["price"] = _number(pricing.get("price_total"))
+    payment = d.get("payment")
+    if not payment or payment == "Невідомо":
+        payment = d.get("payment_type") or d.get("payment_method")
+    out["payment"] = payment
+    out["eta_min"] = _number(d.get("eta_min"))
+    return out
+
+
+def _legacy_confirmation(d: Dict[str, Any]) -> Dict[str, Any]:
+    out = dict(d)
+    out["order_id"] = d.get("order_id") or d.get("id")
+    out.pop("id", None)
+    out.setdefault("status", "accepted")
+    return out
+
+
+_LEGACY = {
+    KIND_ORDER: _legacy_order,
+    KIND_CONFIRMATION: _legacy_confirmation,
+    KIND_SUPPLY: dict,  # no legacy producer: same long-key map
+}
+
+
+# ----------------------------
+# Public API
+# ----------------------------
+
+
+def encode_order(order: Dict[str, Any]) -> bytes:
+    return _pack(KIND_ORDER, order)
+
+
+def decode_order(body: bytes) -> Dict[str, Any]:
+    return _unpack(KIND_ORDER, body)
+
+
+def encode_confirmation(confirmation: Dict[str, Any]) -> bytes:
+    return _pack(KIND_CONFIRMATION, confirmation)
+
+
+def decode_confirmation(body: bytes) -> Dict[str, Any]:
+    return _unpack(KIND_CONFIRMATION, body)
+
+
+def encode_supply(supply: Dict[str, Any]) -> bytes:
+    return _pack(KIND_SUPPLY, supply)
+
+
+def decode_supply(body: bytes) -> Dict[str, Any]:
+    return _unpack(KIND_SUPPLY, body)
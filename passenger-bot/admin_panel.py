@@ -1,12 +1,18 @@
 import logging
 import os
+from functools import lru_cache
 from aiogram import Router, types
 from aiogram.filters import Command
 
+import metrics
+from cd import tariffs
 from tariff_store import load_tariffs_cfg, upsert_tariff, save_tariffs_cfg
 
-# ===== Читаємо ADMIN_IDS з .env =====
-ADMIN_IDS = [int(x) for x in os.getenv("ADMIN_IDS", "").split(",") if x.strip()]
+
+# ===== Читаємо ADMIN_IDS з .env (ліниво: load_dotenv() викликається після імпорту) =====
+@lru_cache(maxsize=1)
+def admin_ids() -> frozenset:
+    return frozenset(int(x) for x in os.getenv("ADMIN_IDS", "").split(",") if x.strip())
 
 # ===== Ініціалізація =====
 router = Router()
@@ -16,23 +22,28 @@ logger = logging.getLogger(__name__)
 # ===== Команда /set_tariff =====
 @router.message(Command("set_tariff"))
 async def set_tariff_cmd(message: types.Message):
-    if message.from_user.id not in ADMIN_IDS:
+    if message.from_user.id not in admin_ids():
         return
 
     try:
         parts = message.text.split()
-        if len(parts) != 4:
-            await message.answer("⚠️ Використання: /set_tariff <назва> <база> <за_км>")
+        if len(parts) not in (4, 5):
+            await message.answer("⚠️ Використання: /set_tariff <назва> <база> <за_км> [за_хв]")
             return
 
-        _, name, base, per_km = parts
+        _, name, base, per_km = parts[:4]
         base, per_km = float(base), float(per_km)
+        per_min = float(parts[4]) if len(parts) == 5 else None
 
         cfg = load_tariffs_cfg()
-        upsert_tariff(cfg, name, base, per_km)
+        entry = upsert_tariff(cfg, name, base, per_km, per_min=per_min)
         save_tariffs_cfg(cfg)
+        tariffs.reload(force=True)
 
-        await message.answer(f"✅ Тариф {name} оновлено: база={base}, км={per_km}")
+        await message.answer(
+            f"✅ Тариф {name} оновлено: база={base}, км={per_km}, хв={entry['per_min']} "
+            f"(версія {cfg['version']})"
+        )
     except Exception as e:
         logger.exception("Помилка у set_tariff_cmd")
         await message.answer(f"❌ Помилка: {e}")
@@ -41,13 +52,16 @@ async def set_tariff_cmd(message: types.Message):
 # ===== Команда /show_tariffs =====
 @router.message(Command("show_tariffs"))
 async def show_tariffs_cmd(message: types.Message):
-    if message.from_user.id not in ADMIN_IDS:
+    if message.from_user.id not in admin_ids():
         return
 
     cfg = load_tariffs_cfg()
-    txt = "📊 Поточні тарифи:\n"
+    txt = f"📊 Поточні тарифи (версія {cfg.get('version', 0)}):\n"
     for name, vals in cfg.get("tariffs", {}).items():
-        txt += f"{name}: базова {vals.get('base', 0)} грн, за км {vals.get('per_km', 0)} грн\n"
+        txt += (
+            f"{name}: базова {vals.get('base', 0)} грн за перші {vals.get('included_km', 2)} км, "
+            f"далі {vals.get('per_km', 0)} грн/км, {vals.get('per_min', 0)} грн/хв\n"
+        )
 
     await message.answer(txt)
 
@@ -55,9 +69,18 @@ async def show_tariffs_cmd(message: types.Message):
 # ===== Команда /save_tariffs =====
 @router.message(Command("save_tariffs"))
 async def save_tariffs_cmd(message: types.Message):
-    if message.from_user.id not in ADMIN_IDS:
+    if message.from_user.id not in admin_ids():
         return
 
     cfg = load_tariffs_cfg()
     save_tariffs_cfg(cfg)
-    await message.answer("💾 Тарифи збережено у файл.")
+    tariffs.reload(force=True)
+    await message.answer(f"💾 Тарифи збережено у файл (версія {cfg['version']}).")
+
+
+# ===== Команда /metrics (черга відправки в Telegram та інше) =====
+@router.message(Command("metrics"))
+async def metrics_cmd(message: types.Message):
+    if message.from_user.id not in admin_ids():
+        return
+    await message.answer(f"<pre>{metrics.render()}</pre>", parse_mode="HTML")
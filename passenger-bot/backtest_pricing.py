@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+"""
+Pricing backtest: re-price historical orders under a candidate tariff/peak
+configuration and compare revenue with the current one.
+
+  python backtest_pricing.py --tariffs tariffs_new.json
+  python backtest_pricing.py --peaks peaks_new.json --driver-orders ../driver-bot/orders.json
+  python backtest_pricing.py --synthetic 2000000 --tariffs tariffs_new.json   # timing
+
+Orders are streamed (heatmap.iter_orders: orders_index.json and driver-bot
+orders.json, each order once) into columns — distance, trip minutes, stops,
+minute of the week, tariff, recorded price — and every configuration prices
+all of them in one vectorized pass, the same formula as cd.TariffEngine:
+
+  fare  = base + max(0, km - included_km) · per_km + minutes · per_min
+  price = round(round(fare) · peak + stops · fee)
+
+Orders recorded before trip durations were kept count 0 minutes.
+
+The peak multiplier comes from a 7×1440 minute-of-week table compiled with
+peaks.py. Surge is not replayed (there is no supply history): the schedule
+is the floor the live multiplier never goes below.
+
+Needs numpy (pip install numpy); with ijson the input files aren't loaded
+whole.
+"""
+import argparse
+import json
+import os
+import time
+from array import array
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # only this tool needs it
+    np = None
+
+from heatmap import iter_orders
+from peaks import DEFAULT_PEAKS, MINUTES_PER_DAY, WEEKDAYS, WEEKENDS, compile_schedule
+from tariff_store import DEFAULT_INCLUDED_KM, DEFAULT_PER_MIN, load_tariffs_cfg
+
+EXTRA_STOP_FEE = 30  # грн, as in main.py
+PERCENTILES = (10, 25, 50, 75, 90)
+
+
+class Columns:
+    """Historical orders as parallel numpy arrays; `tariffs[code]` is the name."""
+
+    def __init__(self):
+        self.tariffs: List[str] = []
+        self._codes: Dict[str, int] = {}
+        self._km = array("d")
+        self._minutes = array("d")  # trip duration, 0 when not recorded
+        self._stops = array("h")
+        self._minute = array("h")  # minute of the week, Mon 00:00 = 0
+        self._tariff = array("h")
+        self._price = array("d")  # recorded price, NaN when unknown
+        self._weekday: Dict[str, int] = {}
+
+    def add(self, order: Dict[str, Any]) -> bool:
+        route = order.get("route") if isinstance(order.get("route"), dict) else {}
+        pricing = order.get("pricing") if isinstance(order.get("pricing"), dict) else {}
+        km = order.get("distance_km", route.get("distance_km"))
+        tariff = order.get("tariff")
+        if not tariff or tariff == "Невідомо":
+            tariff = pricing.get("tariff")
+        minute = self._minute_of_week(order.get("created_at"))
+        if not isinstance(km, (int, float)) or not tariff or minute is None:
+            return False
+        code = self._codes.get(tariff)
+        if code is None:
+            code = self._codes[tariff] = len(self.tariffs)
+            self.tariffs.append(tariff)
+        stops = order.get("stops")
+        if not isinstance(stops, list):
+            stops = route.get("stops") or []
+        price = order.get("price", pricing.get("price_total"))
+        minutes = order.get("duration_min")
+        self._km.append(float(km))
+        self._minutes.append(float(minutes) if isinstance(minutes, (int, float)) else 0.0)
+        self._stops.append(len(stops))
+        self._minute.append(minute)
+        self._tariff.append(code)
+        self._price.append(float(price) if isinstance(price, (int, float)) else float("nan"))
+        return True
+
+    def _minute_of_week(self, created_at: Any) -> Optional[int]:
+        """Wall-clock minute of the week; created_at is Kyiv local time
+        (with or without offset), parsed by slicing to stay fast."""
+        s = str(created_at or "")
+        if len(s) < 16 or s[10] not in "T ":
+            return None
+        day = s[:10]
+        weekday = self._weekday.get(day)
+        try:
+            if weekday is None:
+                weekday = self._weekday[day] = date.fromisoformat(day).weekday()
+            return weekday * MINUTES_PER_DAY + int(s[11:13]) * 60 + int(s[14:16])
+        except ValueError:
+            return None
+
+    def arrays(self) -> Dict[str, "np.ndarray"]:
+        return {
+            "km": np.frombuffer(self._km, dtype=np.float64),
+            "minutes": np.frombuffer(self._minutes, dtype=np.float64),
+            "stops": np.frombuffer(self._stops, dtype=np.int16),
+            "minute": np.frombuffer(self._minute, dtype=np.int16),
+            "tariff": np.frombuffer(self._tariff, dtype=np.int16),
+            "price": np.frombuffer(self._price, dtype=np.float64),
+        }
+
+
+def load_orders(orders_index: Optional[str], driver_orders: Optional[str]) -> Tuple[Columns, int]:
+    cols, skipped = Columns(), 0
+    for order in iter_orders(orders_index, driver_orders):
+        if not cols.add(order):
+            skipped += 1
+    return cols, skipped
+
+
+def synthetic_orders(n: int, seed: int = 1) -> Tuple[List[str], Dict[str, "np.ndarray"]]:
+    rng = np.random.default_rng(seed)
+    names = ["Стандарт", "Комфорт", "Бізнес"]
+    km = np.round(rng.lognormal(1.8, 0.6, n), 2)
+    return names, {
+        "km": km,
+        "minutes": np.round(km * rng.uniform(1.5, 4.0, n), 1),
+        "stops": np.where(rng.random(n) < 0.9, 0, rng.integers(1, 4, n)).astype(np.int16),
+        "minute": rng.integers(0, 7 * MINUTES_PER_DAY, n).astype(np.int16),
+        "tariff": rng.choice(3, n, p=[0.85, 0.12, 0.03]).astype(np.int16),
+        "price": np.full(n, np.nan),
+    }
+
+
+# ---- configurations ----
+
+
+def peak_table(path: Optional[str]) -> "np.ndarray":
+    """Multiplier for every minute of the week (built-in schedule without a file)."""
+    if path and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            tables = compile_schedule(json.load(f))
+    else:
+        tables = compile_schedule(DEFAULT_PEAKS)
+    week = np.ones(7 * MINUTES_PER_DAY, dtype=np.float64)
+    for wd in range(7):
+        table = tables[WEEKDAYS if wd < 5 else WEEKENDS]
+        day = week[wd * MINUTES_PER_DAY:(wd + 1) * MINUTES_PER_DAY]
+        for start, end, value in zip(table.starts, table.ends, table.values):
+            day[start:end] = value
+    return week
+
+
+def tariff_vectors(cfg: Dict[str, Any], names: List[str]) -> Tuple["np.ndarray", ...]:
+    """(base, per_km, included_km, per_min) indexed by tariff code; NaN for
+    tariffs the configuration doesn't have."""
+    out = np.full((4, len(names)), np.nan)
+    tariffs = cfg.get("tariffs") or {}
+    for code, name in enumerate(names):
+        vals = tariffs.get(name)
+        if isinstance(vals, dict):
+            out[0, code] = float(vals.get("base", np.nan))
+            out[1, code] = float(vals.get("per_km", np.nan))
+            out[2, code] = float(vals.get("included_km", DEFAULT_INCLUDED_KM))
+            out[3, code] = float(vals.get("per_min", DEFAULT_PER_MIN))
+    return out[0], out[1], out[2], out[3]
+
+
+def reprice(
+    a: Dict[str, "np.ndarray"],
+    names: List[str],
+    tariffs_cfg: Dict[str, Any],
+    peaks: "np.ndarray",
+    stop_fee: float,
+) -> "np.ndarray":
+    base, per_km, included, per_min = tariff_vectors(tariffs_cfg, names)
+    t = a["tariff"]
+    fare = np.rint(
+        base[t] + np.maximum(0.0, a["km"] - included[t]) * per_km[t] + a["minutes"] * per_min[t]
+    )
+    return np.rint(fare * peaks[a["minute"]] + a["stops"] * stop_fee)
+
+
+# ---- report ----
+
+
+def _money(x: float) -> str:
+    return f"{x:,.0f}".replace(",", " ")
+
+
+def report(a: Dict[str, "np.ndarray"], names: List[str], current: "np.ndarray", candidate: "np.ndarray"):
+    ok = ~np.isnan(current) & ~np.isnan(candidate)
+    n = int(ok.sum())
+    print(f"orders priced: {n} of {len(current)}")
+    if not n:
+        return
+    cur, cand = current[ok], candidate[ok]
+    rev_cur, rev_cand = float(cur.sum()), float(cand.sum())
+    delta = rev_cand - rev_cur
+    pct = 100.0 * delta / rev_cur if rev_cur else float("nan")
+    recorded = a["price"][ok]
+    has_rec = ~np.isnan(recorded)
+    print(f"revenue  current {_money(rev_cur)}  candidate {_money(rev_cand)}  "
+          f"delta {delta:+,.0f} ({pct:+.1f}%)".replace(",", " "))
+    if has_rec.any():
+        print(f"recorded {_money(float(recorded[has_rec].sum()))} over {int(has_rec.sum())} orders")
+
+    print("\nprice percentiles   " + "  ".join(f"p{p:<5}" for p in PERCENTILES))
+    for label, values in (("current", cur), ("candidate", cand)):
+        q = np.percentile(values, PERCENTILES)
+        print(f"  {label:<17} " + "  ".join(f"{v:<6.0f}" for v in q))
+    diff = cand - cur
+    q = np.percentile(diff, PERCENTILES)
+    print(f"  {'per-order delta':<17} " + "  ".join(f"{v:<+6.0f}" for v in q))
+    print(f"  up {100.0 * (diff > 0).mean():.1f}%  down {100.0 * (diff < 0).mean():.1f}%  "
+          f"same {100.0 * (diff == 0).mean():.1f}%")
+
+    print("\nby tariff")
+    codes = a["tariff"][ok]
+    for code, name in enumerate(names):
+        m = codes == code
+        if not m.any():
+            continue
+        c, k = float(cur[m].sum()), float(cand[m].sum())
+        share = 100.0 * (k - c) / c if c else float("nan")
+        print(f"  {name:<10} {int(m.sum()):>9} orders  {_money(c):>14} -> {_money(k):>14}  ({share:+.1f}%)")
+    unpriced = {names[c] for c in np.unique(a["tariff"][~ok])}
+    if unpriced:
+        print(f"\nnot priced (tariff missing in a config): {', '.join(sorted(unpriced))}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--orders-index", default="orders_index.json")
+    ap.add_argument("--driver-orders", default="../driver-bot/orders.json")
+    ap.add_argument("--current-tariffs", default=None, help="default: TARIFFS_FILE / tariffs.json")
+    ap.add_argument("--current-peaks", default="peaks.json")
+    ap.add_argument("--tariffs", default=None, help="candidate tariffs file (default: current)")
+    ap.add_argument("--peaks", default=None, help="candidate peaks file (default: current)")
+    ap.add_argument("--stop-fee", type=float, default=EXTRA_STOP_FEE)
+    ap.add_argument("--candidate-stop-fee", type=float, default=None)
+    ap.add_argument("--synthetic", type=int, default=0, help="random orders instead of history")
+    args = ap.parse_args()
+    if np is None:
+        raise SystemExit("backtest_pricing.py needs numpy: pip install numpy")
+
+    t0 = time.perf_counter()
+    if args.synthetic:
+        names, a = synthetic_orders(args.synthetic)
+        skipped = 0
+    else:
+        cols, skipped = load_orders(args.orders_index, args.driver_orders)
+        names, a = cols.tariffs, cols.arrays()
+    t1 = time.perf_counter()
+
+    current_cfg = load_tariffs_cfg(args.current_tariffs)
+    candidate_cfg = load_tariffs_cfg(args.tariffs) if args.tariffs else current_cfg
+    current_peaks = peak_table(args.current_peaks)
+    candidate_peaks = peak_table(args.peaks) if args.peaks else current_peaks
+    fee = args.candidate_stop_fee if args.candidate_stop_fee is not None else args.stop_fee
+    current = reprice(a, names, current_cfg, current_peaks, args.stop_fee)
+    candidate = reprice(a, names, candidate_cfg, candidate_peaks, fee)
+    t2 = time.perf_counter()
+
+    print(f"loaded {len(a['km'])} orders ({skipped} skipped) in {t1 - t0:.2f}s, "
+          f"priced twice in {t2 - t1:.3f}s\n")
+    report(a, names, current, candidate)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,121 @@
-def calculate_price(distance_km, car_class):
-    base_prices = {"Стандарт": 100, "Комфорт": 130, "Бізнес": 170}
-    per_km_rates = {"Стандарт": 170, "Комфорт": 20, "Бізнес": 24}
+# -*- coding: utf-8 -*-
+"""
+Tariff engine — the one place prices are computed.
 
-    base_price = base_prices[car_class]
-    per_km_rate = per_km_rates[car_class]
+The config from tariff_store is compiled into a per-class table of
+(base, per_km, included_km, per_min); the table is rebuilt only when the
+tariffs file changes (mtime checked at most once a second), so admin edits
+via /set_tariff reach pricing without a restart.
 
-    if distance_km <= 2:
-        price = base_price
-    else:
-        price = base_price + (distance_km - 2) * per_km_rate
+  base price = base + max(0, km - included_km) · per_km + minutes · per_min
+  total      = round(round(base price) · multiplier + surcharge)
 
-    return round(price)
+`minutes` is the trip duration from the route (maps.RouteLeg, traffic-aware
+when Google has it), cached in the quote — pricing makes no API calls.
+"""
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from tariff_store import (
+    DEFAULT_INCLUDED_KM,
+    DEFAULT_PER_MIN,
+    default_cfg,
+    load_tariffs_cfg,
+    tariffs_path,
+)
+
+CHECK_EVERY_SEC = 1.0
+
+# class -> (base, per_km, included_km, per_min)
+Table = Dict[str, Tuple[float, float, float, float]]
+
+
+def compile_tariffs(cfg: Dict[str, Any]) -> Table:
+    table: Table = {}
+    for name, vals in (cfg.get("tariffs") or {}).items():
+        try:
+            base = float(vals["base"])
+            per_km = float(vals["per_km"])
+            included = float(vals.get("included_km", DEFAULT_INCLUDED_KM))
+            per_min = float(vals.get("per_min", DEFAULT_PER_MIN))
+        except (KeyError, TypeError, ValueError, AttributeError):
+            logging.error(f"[TARIFFS] Bad tariff {name!r}: {vals!r}, skipped")
+            continue
+        table[str(name)] = (base, per_km, included, per_min)
+    return table
+
+
+class TariffEngine:
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.version = 0  # defaults until a tariffs file is loaded
+        self.table: Table = compile_tariffs(default_cfg())
+        self._mtime: Optional[float] = None
+        self._checked = 0.0
+
+    def reload(self, force: bool = False):
+        """Recompile when the tariffs file changed (or `force`)."""
+        now = time.monotonic()
+        if not force and now - self._checked < CHECK_EVERY_SEC:
+            return
+        self._checked = now
+        path = self.path or tariffs_path()
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            mtime = None
+        if mtime == self._mtime and not force:
+            return
+        cfg = load_tariffs_cfg(path)
+        table = compile_tariffs(cfg)
+        if not table:
+            logging.error("[TARIFFS] No valid tariffs, keeping the previous table")
+            return
+        self.table = table
+        self.version = int(cfg.get("version", 0))
+        self._mtime = mtime
+        logging.info(f"[TARIFFS] Version {self.version}: {', '.join(table)}")
+
+    @property
+    def names(self) -> List[str]:
+        self.reload()
+        return list(self.table)
+
+    def base_price(self, distance_km: float, car_class: str, duration_min: float = 0.0) -> int:
+        self.reload()
+        return round(_fare(self.table[car_class], distance_km, duration_min))
+
+    def total(
+        self,
+        distance_km: float,
+        car_class: str,
+        multiplier: float = 1.0,
+        surcharge: float = 0,
+        duration_min: float = 0.0,
+    ) -> int:
+        return int(round(self.base_price(distance_km, car_class, duration_min) * multiplier + surcharge))
+
+    def prices(
+        self,
+        distance_km: float,
+        multiplier: float = 1.0,
+        surcharge: float = 0,
+        duration_min: float = 0.0,
+    ) -> Dict[str, int]:
+        """Total for every class, in tariff order."""
+        self.reload()
+        return {
+            name: int(round(round(_fare(row, distance_km, duration_min)) * multiplier + surcharge))
+            for name, row in self.table.items()
+        }
+
+
+def _fare(row: Tuple[float, float, float, float], distance_km: float, duration_min: float) -> float:
+    base, per_km, included, per_min = row
+    return base + max(0.0, distance_km - included) * per_km + max(0.0, duration_min) * per_min
+
+
+# shared by main.py and admin_panel.py
+tariffs = TariffEngine()
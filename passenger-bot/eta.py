@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+Pickup ETA from where the available drivers actually are.
+
+driver-bot's supply snapshot lists every available driver as
+[lat, lon, [class, ...]]. They are binned into the routing.zone_cell grid,
+so `nearest` looks at the pickup cell and rings of cells around it — never
+the whole fleet — and stops once no unseen cell can hold a closer driver.
+
+  road km = straight-line km · road_factor
+  minutes = overhead + road km / speed(zone, hour) · 60
+
+ETA for a class is taken at the k-th nearest driver who has that class
+(or the farthest of fewer), not the very nearest: the closest driver may
+decline, so the estimate assumes the offer wave reaches a few of them. A
+class with nobody within `max_km` is unavailable (None).
+
+Speeds: SpeedModel.parse("25", "7-10:18,17-20:16", "1134x1174:15") — a
+default km/h, slower hours of the day and per-zone overrides (the zone
+value wins, an hour window caps it).
+
+With a calibration table (calibration.py, learned by driver-bot from
+accepted_at → arrived_at) its pickup speed for the zone and hour wins over
+the model. It is measured on straight-line km over the whole pickup, so
+neither road_factor nor the overhead applies on top:
+
+  minutes = straight-line km / learned speed · 60
+
+Snapshots arrive on the bus thread; hand them to `update` on the bot loop
+(call_soon_threadsafe) — the index is not thread-safe.
+"""
+import heapq
+import math
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from calibration import Calibration
+from routing import NO_ZONE, cell_span_km, tariff_class, zone_cell, zone_of
+
+R_KM = 6371.0
+# (lat, lon, classes)
+Driver = Tuple[float, float, frozenset]
+
+
+def haversine_km(a: Sequence[float], b: Sequence[float]) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * R_KM * math.asin(math.sqrt(h))
+
+
+class SpeedModel:
+    """Average pickup speed in km/h by zone and local hour."""
+
+    def __init__(
+        self,
+        default_kmh: float = 25.0,
+        hours: Sequence[Tuple[int, int, float]] = (),
+        zones: Optional[Dict[str, float]] = None,
+    ):
+        self.default_kmh = default_kmh
+        self.hours = list(hours)  # [start_hour, end_hour) → km/h
+        self.zones = dict(zones or {})
+
+    @classmethod
+    def parse(cls, default: str = "25", hours: str = "", zones: str = "") -> "SpeedModel":
+        """`hours` like "7-10:18,17-20:16", `zones` like "1134x1174:15"."""
+        windows = []
+        for item in filter(None, (x.strip() for x in hours.split(","))):
+            span, kmh = item.split(":")
+            start, end = span.split("-")
+            windows.append((int(start), int(end), float(kmh)))
+        per_zone = {}
+        for item in filter(None, (x.strip() for x in zones.split(","))):
+            zone, kmh = item.rsplit(":", 1)
+            per_zone[zone.strip()] = float(kmh)
+        return cls(float(default), windows, per_zone)
+
+    def kmh(self, zone: str, hour: int) -> float:
+        speed = self.zones.get(zone, self.default_kmh)
+        for start, end, kmh in self.hours:
+            if start <= hour < end:
+                speed = min(speed, kmh)
+        return max(1.0, speed)
+
+
+class PickupEta:
+    def __init__(
+        self,
+        speeds: SpeedModel,
+        hour=lambda: time.localtime().tm_hour,
+        k: int = 3,
+        max_km: float = 5.0,
+        road_factor: float = 1.3,
+        overhead_min: float = 1.0,
+        stale_sec: float = 120.0,
+        calibration: Optional[Calibration] = None,
+    ):
+        self.speeds = speeds
+        self.calibration = calibration
+        self.hour = hour
+        self.k = k
+        self.max_km = max_km
+        self.road_factor = road_factor
+        self.overhead_min = overhead_min
+        self.stale_sec = stale_sec
+        self._cells: Dict[Tuple[int, int], List[Driver]] = {}
+        self._at = 0.0
+
+    # ---- input ----
+
+    def update(self, drivers: Optional[Iterable[Any]], at: Optional[float] = None):
+        cells: Dict[Tuple[int, int], List[Driver]] = {}
+        for item in drivers or ():
+            try:
+                lat, lon, classes = float(item[0]), float(item[1]), item[2]
+            except (TypeError, ValueError, IndexError):
+                continue
+            cells.setdefault(zone_cell(lat, lon), []).append((lat, lon, frozenset(classes)))
+        self._cells = cells
+        self._at = time.time() if at is None else at
+
+    def fresh(self) -> bool:
+        return time.time() - self._at <= self.stale_sec
+
+    # ---- output ----
+
+    def nearest(self, coords: Sequence[float], car_class: str, k: int, max_km: float) -> List[float]:
+        """Straight-line km to the k nearest drivers with `car_class`
+        within `max_km`, nearest first."""
+        ring_km = cell_span_km(coords[0])
+        row, col = zone_cell(coords[0], coords[1])
+        best: List[float] = []  # max-heap (negated) of the k nearest
+        rings = int(max_km / ring_km) + 1
+        for r in range(rings + 1):
+            if len(best) == k and -best[0] <= (r - 1) * ring_km:
+                break  # nothing in ring r can be closer than what we have
+            for cell in _ring(row, col, r):
+                for lat, lon, classes in self._cells.get(cell, ()):
+                    if car_class not in classes:
+                        continue
+                    km = haversine_km(coords, (lat, lon))
+                    if km > max_km:
+                        continue
+                    if len(best) < k:
+                        heapq.heappush(best, -km)
+                    elif km < -best[0]:
+                        heapq.heapreplace(best, -km)
+        return sorted(-x for x in best)
+
+    def minutes(self, coords: Sequence[float], tariffs: Iterable[str]) -> Dict[str, Optional[int]]:
+        """Pickup minutes per tariff name, None when no driver of the class is
+        near. Empty when the supply snapshot is stale (ETA unknown)."""
+        zone = zone_of(coords)
+        if not self.fresh() or zone == NO_ZONE:
+            return {}
+        hour = self.hour()
+        learned = self.calibration.pickup_kmh(zone, hour) if self.calibration else None
+        kmh = self.speeds.kmh(zone, hour)
+        out: Dict[str, Optional[int]] = {}
+        for name in tariffs:
+            dists = self.nearest(coords, tariff_class(name), self.k, self.max_km)
+            if not dists:
+                out[name] = None
+            elif learned:
+                out[name] = max(1, math.ceil(dists[-1] / learned * 60))
+            else:
+                road_km = dists[-1] * self.road_factor
+                out[name] = max(1, math.ceil(self.overhead_min + road_km / kmh * 60))
+        return out
+
+
+def _ring(row: int, col: int, r: int) -> Iterable[Tuple[int, int]]:
+    if r == 0:
+        yield row, col
+        return
+    for dc in range(-r, r + 1):
+        yield row - r, col + dc
+        yield row + r, col + dc
+    for dr in range(-r + 1, r):
+        yield row + dr, col - r
+        yield row + dr, col + r
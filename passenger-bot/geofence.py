@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Service area: one or more polygons (GeoJSON) with an O(1) fast path.
+
+`ServiceArea.contains(lat, lon)`:
+  1. outside the bounding box → False;
+  2. the box is split into GRID×GRID cells, each precomputed as inside,
+     outside or boundary (some polygon edge passes through it) → answer
+     straight from the table for inside/outside cells;
+  3. only on boundary cells → ray-casting point-in-polygon.
+
+GeoJSON: FeatureCollection, Feature, Polygon or MultiPolygon; coordinates
+are [lon, lat]; holes (inner rings) are honoured by the even-odd rule.
+Without a file the area falls back to a circle (centre + radius).
+"""
+import json
+import math
+from typing import Any, Dict, List, Optional, Tuple
+
+GRID = 64
+
+OUTSIDE, INSIDE, BOUNDARY = 0, 1, 2
+
+Ring = List[Tuple[float, float]]  # (lat, lon)
+
+
+def _haversine_km(a, b) -> float:
+    lat1, lon1 = math.radians(a[0]), math.radians(a[1])
+    lat2, lon2 = math.radians(b[0]), math.radians(b[1])
+    h = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * 6371.0 * math.asin(math.sqrt(h))
+
+
+def _geojson_polygons(obj: Dict[str, Any]) -> List[List[Ring]]:
+    """Every polygon as a list of rings (outer first), in (lat, lon)."""
+    kind = obj.get("type")
+    if kind == "FeatureCollection":
+        out: List[List[Ring]] = []
+        for feature in obj.get("features") or []:
+            out.extend(_geojson_polygons(feature))
+        return out
+    if kind == "Feature":
+        return _geojson_polygons(obj.get("geometry") or {})
+    if kind == "Polygon":
+        polys = [obj["coordinates"]]
+    elif kind == "MultiPolygon":
+        polys = obj["coordinates"]
+    else:
+        return []
+    return [[[(float(p[1]), float(p[0])) for p in ring] for ring in poly] for poly in polys]
+
+
+class ServiceArea:
+    def __init__(
+        self,
+        polygons: Optional[List[List[Ring]]] = None,
+        center: Tuple[float, float] = (50.4501, 30.5234),
+        radius_km: float = 100.0,
+        grid: int = GRID,
+    ):
+        self.center = center
+        self.radius_km = radius_km
+        # edges as (lat1, lon1, lat2, lon2), all rings together (even-odd)
+        self.edges: List[Tuple[float, float, float, float]] = []
+        for poly in polygons or []:
+            for ring in poly:
+                n = len(ring)
+                for i in range(n):
+                    a, b = ring[i], ring[(i + 1) % n]
+                    if a != b:
+                        self.edges.append((a[0], a[1], b[0], b[1]))
+        self.grid = grid
+        self.cells: List[int] = []
+        if self.edges:
+            self._build_index()
+
+    @classmethod
+    def from_geojson(cls, path: str, **kwargs) -> "ServiceArea":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(_geojson_polygons(json.load(f)), **kwargs)
+
+    @property
+    def is_polygon(self) -> bool:
+        return bool(self.edges)
+
+    # ---- lookup ----
+
+    def contains(self, lat: float, lon: float) -> bool:
+        if not self.edges:
+            return _haversine_km((lat, lon), self.center) <= self.radius_km
+        if not (self.min_lat <= lat <= self.max_lat and self.min_lon <= lon <= self.max_lon):
+            return False
+        state = self.cells[self._cell(lat, lon)]
+        if state == BOUNDARY:
+            return self._point_in_polygon(lat, lon)
+        return state == INSIDE
+
+    def distance_to_center_km(self, lat: float, lon: float) -> float:
+        return _haversine_km((lat, lon), self.center)
+
+    # ---- index ----
+
+    def _cell(self, lat: float, lon: float) -> int:
+        row = min(self.grid - 1, int((lat - self.min_lat) / self.dlat))
+        col = min(self.grid - 1, int((lon - self.min_lon) / self.dlon))
+        return row * self.grid + col
+
+    def _build_index(self):
+        lats = [e[0] for e in self.edges] + [e[2] for e in self.edges]
+        lons = [e[1] for e in self.edges] + [e[3] for e in self.edges]
+        self.min_lat, self.max_lat = min(lats), max(lats)
+        self.min_lon, self.max_lon = min(lons), max(lons)
+        self.dlat = (self.max_lat - self.min_lat) / self.grid or 1e-9
+        self.dlon = (self.max_lon - self.min_lon) / self.grid or 1e-9
+
+        cells = [OUTSIDE] * (self.grid * self.grid)
+        # Boundary cells: split each edge into pieces no longer than a cell
+        # and mark every cell under each piece's bounding box (conservative).
+        for lat1, lon1, lat2, lon2 in self.edges:
+            steps = max(
+                1,
+                int(math.ceil(max(abs(lat2 - lat1) / self.dlat, abs(lon2 - lon1) / self.dlon))),
+            )
+            for k in range(steps):
+                t0, t1 = k / steps, (k + 1) / steps
+                a = (lat1 + (lat2 - lat1) * t0, lon1 + (lon2 - lon1) * t0)
+                b = (lat1 + (lat2 - lat1) * t1, lon1 + (lon2 - lon1) * t1)
+                r0, c0 = divmod(self._cell(min(a[0], b[0]), min(a[1], b[1])), self.grid)
+                r1, c1 = divmod(self._cell(max(a[0], b[0]), max(a[1], b[1])), self.grid)
+                for r in range(r0, r1 + 1):
+                    for c in range(c0, c1 + 1):
+                        cells[r * self.grid + c] = BOUNDARY
+        # No edge crosses the other cells: their centre decides for the whole cell.
+        for r in range(self.grid):
+            for c in range(self.grid):
+                i = r * self.grid + c
+                if cells[i] != BOUNDARY:
+                    lat = self.min_lat + (r + 0.5) * self.dlat
+                    lon = self.min_lon + (c + 0.5) * self.dlon
+                    cells[i] = INSIDE if self._point_in_polygon(lat, lon) else OUTSIDE
+        self.cells = cells
+
+    def _point_in_polygon(self, lat: float, lon: float) -> bool:
+        inside = False
+        for lat1, lon1, lat2, lon2 in self.edges:
+            if (lat1 > lat) != (lat2 > lat):
+                cross = lon1 + (lat - lat1) * (lon2 - lon1) / (lat2 - lat1)
+                if lon < cross:
+                    inside = not inside
+        return inside
+
+
+def load_service_area(
+    path: Optional[str], center: Tuple[float, float], radius_km: float
+) -> ServiceArea:
+    if path:
+        return ServiceArea.from_geojson(path, center=center, radius_km=radius_km)
+    return ServiceArea(center=center, radius_km=radius_km)
+
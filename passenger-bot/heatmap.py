@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+Demand heatmap: where orders start and end, per zone (routing.zone_of grid).
+
+Every order is counted once for its pickup and once for its drop-off:
+  • sliding windows — 5 min, 1 h and 1 day, each a ring of time buckets
+    per zone, so adding is O(1) and old buckets expire lazily on reuse;
+  • hour-of-week profile — lifetime counts per zone for each of the 168
+    hours of the week (what a typical Friday 18:00 looks like).
+
+`backfill()` replays historical orders (orders_index.json, driver-bot
+orders.json) in one streaming pass — with ijson installed the files are
+never loaded whole — so a restart doesn't start from an empty map.
+"""
+import json
+import logging
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    import ijson
+except ImportError:  # optional: fall back to json.load
+    ijson = None
+
+from routing import NO_ZONE, order_pickup, zone_of
+
+PICKUP = "pickup"
+DROPOFF = "dropoff"
+
+# name -> (window seconds, bucket seconds)
+WINDOWS: Dict[str, Tuple[int, int]] = {
+    "5m": (300, 30),
+    "1h": (3600, 300),
+    "1d": (86400, 3600),
+}
+
+HOURS_PER_WEEK = 168
+
+
+def order_dropoff(order: Dict[str, Any]) -> Optional[Sequence[float]]:
+    dropoff = order.get("dropoff")
+    if isinstance(dropoff, dict) and dropoff.get("coords"):
+        return dropoff["coords"]
+    return ((order.get("route") or {}).get("final") or {}).get("coords") or None
+
+
+def order_epoch(order: Dict[str, Any]) -> Optional[float]:
+    try:
+        return datetime.fromisoformat(str(order.get("created_at"))).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def hour_of_week(ts: float) -> int:
+    t = time.localtime(ts)
+    return t.tm_wday * 24 + t.tm_hour
+
+
+class _Ring:
+    """Counts per bucket; stamps[i] is the absolute bucket number in slot i."""
+
+    __slots__ = ("counts", "stamps")
+
+    def __init__(self, n: int):
+        self.counts = [0] * n
+        self.stamps = [-1] * n
+
+
+class DemandHeatmap:
+    def __init__(self):
+        # (kind, window) -> zone -> ring
+        self._rings: Dict[Tuple[str, str], Dict[str, _Ring]] = {
+            (kind, w): {} for kind in (PICKUP, DROPOFF) for w in WINDOWS
+        }
+        # kind -> zone -> 168 counters
+        self._profile: Dict[str, Dict[str, List[int]]] = {PICKUP: {}, DROPOFF: {}}
+        self.total = 0
+
+    # ---- updates ----
+
+    def add(self, kind: str, coords: Optional[Sequence[float]], ts: Optional[float] = None):
+        zone = zone_of(coords)
+        if zone == NO_ZONE:
+            return
+        ts = time.time() if ts is None else ts
+        now = time.time()
+        for name, (span, step) in WINDOWS.items():
+            n = span // step
+            slot = int(ts // step)
+            if slot <= int(now // step) - n:
+                continue  # already outside this window
+            ring = self._rings[(kind, name)].get(zone)
+            if ring is None:
+                ring = self._rings[(kind, name)][zone] = _Ring(n)
+            i = slot % n
+            if ring.stamps[i] > slot:
+                continue  # a newer bucket owns the slot (out-of-order replay)
+            if ring.stamps[i] != slot:
+                ring.stamps[i] = slot
+                ring.counts[i] = 0
+            ring.counts[i] += 1
+        profile = self._profile[kind].get(zone)
+        if profile is None:
+            profile = self._profile[kind][zone] = [0] * HOURS_PER_WEEK
+        profile[hour_of_week(ts)] += 1
+
+    def add_order(self, order: Dict[str, Any], ts: Optional[float] = None):
+        ts = order_epoch(order) if ts is None else ts
+        self.add(PICKUP, order_pickup(order), ts)
+        self.add(DROPOFF, order_dropoff(order), ts)
+        self.total += 1
+
+    # ---- queries ----
+
+    def count(self, zone: str, window: str = "1h", kind: str = PICKUP) -> int:
+        ring = self._rings[(kind, window)].get(zone)
+        if ring is None:
+            return 0
+        span, step = WINDOWS[window]
+        n = span // step
+        now_slot = int(time.time() // step)
+        return sum(
+            c for c, s in zip(ring.counts, ring.stamps) if 0 <= now_slot - s < n
+        )
+
+    def top(self, window: str = "1h", kind: str = PICKUP, n: int = 10) -> List[Tuple[str, int]]:
+        counts = [(z, self.count(z, window, kind)) for z in self._rings[(kind, window)]]
+        counts = [zc for zc in counts if zc[1]]
+        counts.sort(key=lambda zc: -zc[1])
+        return counts[:n]
+
+    def profile(self, zone: str, kind: str = PICKUP, how: Optional[int] = None) -> int:
+        """Lifetime orders in `zone` at hour-of-week `how` (default: now)."""
+        counters = self._profile[kind].get(zone)
+        if counters is None:
+            return 0
+        return counters[hour_of_week(time.time()) if how is None else how]
+
+    # ---- history ----
+
+    def backfill(self, orders_index_path: Optional[str] = None, driver_orders_path: Optional[str] = None) -> int:
+        added = 0
+        for order in iter_orders(orders_index_path, driver_orders_path):
+            ts = order_epoch(order)
+            if ts is None:
+                continue
+            self.add_order(order, ts)
+            added += 1
+        logging.info(f"[HEATMAP] Backfilled {added} orders")
+        return added
+
+
+def iter_orders(orders_index_path: Optional[str], driver_orders_path: Optional[str]) -> Iterator[Dict[str, Any]]:
+    """orders_index.json: {order_id: {..., "payload": order}};
+    driver-bot orders.json: {"orders": [order, ...]}. Both may hold the same
+    order — only the first copy counts."""
+    seen = set()
+    if orders_index_path:
+        for oid, info in _stream(orders_index_path, "kv", ""):
+            if isinstance(info, dict) and isinstance(info.get("payload"), dict):
+                seen.add(str(oid))
+                yield info["payload"]
+    if driver_orders_path:
+        for order in _stream(driver_orders_path, "items", "orders.item"):
+            if isinstance(order, dict) and str(order.get("id")) not in seen:
+                seen.add(str(order.get("id")))
+                yield order
+
+
+def _stream(path: str, mode: str, prefix: str) -> Iterator[Any]:
+    try:
+        with open(path, "rb") as f:
+            if ijson is not None:
+                if mode == "kv":
+                    yield from ijson.kvitems(f, prefix, use_float=True)
+                else:
+                    yield from ijson.items(f, prefix, use_float=True)
+                return
+            data = json.load(f)
+    except FileNotFoundError:
+        return
+    except Exception:
+        logging.exception(f"[HEATMAP] Can't read {path}")
+        return
+    if mode == "kv":
+        yield from (data.items() if isinstance(data, dict) else [])
+    else:
+        yield from ((data or {}).get("orders") or [])
@@ -2,7 +2,7 @@ from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
 
 class_keyboard = ReplyKeyboardMarkup(
     keyboard=[
-        [KeyboardButton(text="Економ")],
+        [KeyboardButton(text="Стандарт")],
         [KeyboardButton(text="Комфорт")],
         [KeyboardButton(text="Бізнес")],
     ],
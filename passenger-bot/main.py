@@ -1,25 +1,43 @@
 # -*- coding: utf-8 -*-
 # === FlyTaxi Passenger Bot (Aiogram v3) — ORIGINAL FEATURES + RabbitMQ integration ===
 # Збережено всі функції з "копія main (13).py" і додано:
-#   • Публікацію замовлень у RabbitMQ (QUEUE_ORDERS)
-#   • Фоновий споживач підтверджень з RabbitMQ (QUEUE_CONFIRMATIONS)
+#   • Публікацію замовлень у шину повідомлень (ORDERS_EXCHANGE)
+#   • Фоновий споживач підтверджень із шини (QUEUE_CONFIRMATIONS)
 #   • Зв'язок order_id → chat_id/user_id для коректної доставки нотифікацій
 #
 # Env (.env):
 #   BOT_TOKEN=...
 #   GOOGLE_MAPS_API_KEY=...
+#   MQ_BACKEND=rabbitmq   (rabbitmq | memory | file — див. mq.py)
 #   RABBITMQ_HOST=localhost
-#   QUEUE_ORDERS=orders
+#   ORDERS_EXCHANGE=orders.topic  (замовлення з ключем orders.<зона>.<клас>)
+#   ZONE_CELL_KM=5                (розмір зони; однаковий в обох ботах)
+#   ORDER_PRIORITY_TARIFFS=business:2,comfort:1  (пріоритет у черзі, routing.py)
+#   PEAKS_FILE=peaks.json         (пікові години за днями тижня, peaks.py)
+#   SERVICE_AREA_GEOJSON=         (необов'язково: полігони зони обслуговування, geofence.py;
+#                                  перевірте на історії замовлень перед увімкненням)
 #   QUEUE_CONFIRMATIONS=confirmations
+#   QUOTE_TTL_SEC=300             (строк дії ціни маршруту, quotes.py)
+#   TARIFFS_FILE=tariffs.json     (тарифи, /set_tariff в admin_panel.py; cd.py перечитує при зміні)
+#   ADMIN_IDS=1,2                 (хто може змінювати тарифи)
+#   QUEUE_SUPPLY=drivers.supply   (вільні водії по зонах від driver-bot, surge.py)
+#   SURGE_WINDOW=5m  SURGE_RATIO_START=1.0  SURGE_STEP=0.5  SURGE_MAX=2.0
+#   SURGE_MIN_ORDERS=3  SURGE_SMOOTH_SEC=180  SURGE_STALE_SEC=120
+#   ETA_SPEED_KMH=25  ETA_SPEED_HOURS=7-10:18,17-20:16  ETA_ZONE_SPEEDS=1134x1174:15
+#   ETA_K=3  ETA_MAX_KM=5  ETA_ROAD_FACTOR=1.3  (подача від найближчих водіїв, eta.py)
+#   CALIBRATION_FILE=../driver-bot/calibration.json  (швидкості подачі й поїздок, calibration.py)
+#   TELEGRAM_RATE_PER_SEC=25  TELEGRAM_BURST=25  TELEGRAM_CHAT_RATE_PER_SEC=1
+#   TELEGRAM_CHAT_BURST=3  TELEGRAM_GROUP_RATE_PER_MIN=20  (черга відправки, outbox.py)
+#   STATUS_CARD_DEBOUNCE_SEC=2    (картка статусу замовлення, status_card.py)
 #
-# pip install aiogram==3.* python-dotenv geopy pika pytz
+# pip install aiogram==3.* python-dotenv geopy pika msgpack pytz
 #
 import os
 import json
 import logging
 import threading
 import time as _time
-from datetime import datetime, time
+from datetime import datetime
 import pytz
 import asyncio
 import uuid
@@ -29,36 +47,80 @@ from keyboards import class_keyboard
 from math import radians, sin, cos, asin, sqrt
 from aiogram import Bot, Dispatcher, types, F
 from aiogram.filters import CommandStart, Command, StateFilter
-from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
+from aiogram.types import (
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    KeyboardButton,
+    ReplyKeyboardMarkup,
+)
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.storage.memory import MemoryStorage
 from dotenv import load_dotenv
 
-from cd import calculate_price
+from admin_panel import router as admin_router
+from geofence import load_service_area
+from calibration import Calibration
+from eta import PickupEta, SpeedModel
+from heatmap import DemandHeatmap
 from maps import build_route
+from peaks import PeakSchedule
+from quotes import Quote, make_quote
 
 from geopy.geocoders import GoogleV3
 from geopy.location import Location as GeoLocation
 
-import pika  # NEW
+from mq import get_bus
+from outbox import TRANSACTIONAL, Outbox
+from routing import (
+    ORDERS_EXCHANGE_DEFAULT,
+    order_pickup,
+    order_priority,
+    order_routing_key,
+    zone_of,
+)
+from status_card import StatusCards
+from surge import SurgeEngine
+from timers import DeadlineScheduler
+from wire import WireError, decode_confirmation, decode_supply, encode_order
 
 load_dotenv()
 
 API_TOKEN = os.getenv("BOT_TOKEN")
 GOOGLE_MAPS_API_KEY = os.getenv("GOOGLE_MAPS_API_KEY")
-RABBITMQ_HOST = os.getenv("RABBITMQ_HOST", "localhost")  # NEW
-QUEUE_ORDERS = os.getenv("QUEUE_ORDERS", "orders")  # NEW
+ORDERS_EXCHANGE = os.getenv("ORDERS_EXCHANGE", ORDERS_EXCHANGE_DEFAULT)
 QUEUE_CONFIRMATIONS = os.getenv("QUEUE_CONFIRMATIONS", "confirmations")  # NEW
+QUEUE_SUPPLY = os.getenv("QUEUE_SUPPLY", "drivers.supply")
 SERVICE_CENTER_LAT = float(os.getenv("SERVICE_CENTER_LAT", "50.4501"))
 SERVICE_CENTER_LON = float(os.getenv("SERVICE_CENTER_LON", "30.5234"))
 SERVICE_RADIUS_KM = float(os.getenv("SERVICE_RADIUS_KM", "100"))
 SERVICE_AREA_NAME = os.getenv("SERVICE_AREA_NAME", "Києва")
+# Полігони зони обслуговування (GeoJSON) — лише якщо задано явно;
+# без файлу — коло SERVICE_RADIUS_KM
+SERVICE_AREA_GEOJSON = os.getenv("SERVICE_AREA_GEOJSON", "")
+if SERVICE_AREA_GEOJSON and not os.path.exists(SERVICE_AREA_GEOJSON):
+    logging.warning(f"SERVICE_AREA_GEOJSON={SERVICE_AREA_GEOJSON} not found, using the radius")
+SERVICE_AREA = load_service_area(
+    SERVICE_AREA_GEOJSON if os.path.exists(SERVICE_AREA_GEOJSON) else None,
+    (SERVICE_CENTER_LAT, SERVICE_CENTER_LON),
+    SERVICE_RADIUS_KM,
+)
 
 logging.basicConfig(level=logging.INFO)
 
 bot = Bot(token=API_TOKEN)
 dp = Dispatcher(storage=MemoryStorage())
+# Усі повідомлення поза відповідями на апдейти — через одну чергу з лімітами
+# Telegram (загальним і на чат); підтвердження поїздки йдуть першими
+outbox = Outbox(
+    bot,
+    rate=float(os.getenv("TELEGRAM_RATE_PER_SEC", "25")),
+    burst=int(os.getenv("TELEGRAM_BURST", "25")),
+    chat_rate=float(os.getenv("TELEGRAM_CHAT_RATE_PER_SEC", "1")),
+    chat_burst=int(os.getenv("TELEGRAM_CHAT_BURST", "3")),
+    group_rate=float(os.getenv("TELEGRAM_GROUP_RATE_PER_MIN", "20")) / 60.0,
+)
+dp.include_router(admin_router)  # /set_tariff, /show_tariffs, /save_tariffs
 
 user_states = {}
 USERS_FILE = "users.json"
@@ -66,8 +128,19 @@ ORDERS_FILE = "orders.json"
 ORDERS_INDEX_FILE = (
     "orders_index.json"  # NEW: order_id → {chat_id, user_id, await_rating?}
 )
+PEAKS_FILE = os.getenv("PEAKS_FILE", "peaks.json")  # розклад пікових годин (peaks.py)
+TIMERS_FILE = "timers.json"  # дедлайни перепублікації (timers.py), переживають рестарт
+
+deadlines = DeadlineScheduler(TIMERS_FILE)
+
+KYIV_TZ = pytz.timezone("Europe/Kiev")
+# peaks.json компілюється в таблиці інтервалів і перечитується при зміні файлу
+peak_schedule = PeakSchedule(PEAKS_FILE)
+
+# Попит по зонах (heatmap.py); історія — orders_index.json і, за бажання,
+# orders.json водійського бота (HEATMAP_DRIVER_ORDERS=../driver-bot/orders.json)
+demand = DemandHeatmap()
 
-TARIFFS = ["Стандарт", "Комфорт", "Бізнес"]
 RESTART_TEXT = "🔄 Перезапустити"
 PROFILE_TEXT = "👤 Мій профіль"
 SUPPORT_TEXT = "🆘 Служба підтримки"
@@ -96,6 +169,7 @@ CONTINUE_TEXT = "▶️ Продовжити"
 
 EXTRA_STOP_FEE = 30  # грн
 MAX_STOPS = 5
+QUOTE_TTL_SEC = float(os.getenv("QUOTE_TTL_SEC", "300"))  # скільки діє розрахована ціна
 
 RESTART_BUTTON = KeyboardButton(text=RESTART_TEXT)
 PROFILE_BUTTON = KeyboardButton(text=PROFILE_TEXT)
@@ -112,6 +186,7 @@ NEGATIVE_REASONS = [
 ]
 
 # ——— ETA (подача авто) ———
+# Лише запасний варіант, коли знімок вільних водіїв від driver-bot застарів
 ETA_BASE_MIN = {"Стандарт": 6, "Комфорт": 8, "Бізнес": 10}
 
 
@@ -128,19 +203,20 @@ def _haversine_km(a, b):
 
 
 def _inside_service(lat, lon) -> bool:
-    return (
-        _haversine_km((lat, lon), (SERVICE_CENTER_LAT, SERVICE_CENTER_LON))
-        <= SERVICE_RADIUS_KM
-    )
+    return SERVICE_AREA.contains(lat, lon)
 
 
 async def _guard_point(message, lat, lon, what: str) -> bool:
     if _inside_service(lat, lon):
         return True
-    dist = _haversine_km((lat, lon), (SERVICE_CENTER_LAT, SERVICE_CENTER_LON))
+    dist = SERVICE_AREA.distance_to_center_km(lat, lon)
+    if SERVICE_AREA.is_polygon:
+        where = f"межі {SERVICE_AREA_NAME}"
+    else:
+        where = f"{SERVICE_RADIUS_KM:.0f} км від {SERVICE_AREA_NAME}"
     await message.answer(
-        f"⛔ {what} поза зоною обслуговування ({SERVICE_RADIUS_KM:.0f} км від {SERVICE_AREA_NAME}). "
-        f"Відстань ≈ {dist:.1f} км. Оберіть іншу адресу."
+        f"⛔ {what} поза зоною обслуговування ({where}). "
+        f"Відстань до центру ≈ {dist:.1f} км. Оберіть іншу адресу."
     )
     return False
 
@@ -157,36 +233,95 @@ def eta_minutes(tariff: str, multiplier: float) -> int:
 
 # === PEAK HOURS ===
 def is_peak_hour() -> float:
-    kyiv_now = datetime.now(pytz.timezone("Europe/Kiev"))
-    current_time = kyiv_now.time()
-    weekday = kyiv_now.weekday()  # Пн=0, Нд=6
-
-    if weekday < 5:  # будні
-        peak_periods_30 = [
-            (time(5, 0), time(6, 0)),
-            (time(7, 30), time(10, 30)),
-            (time(16, 30), time(19, 30)),
-            (time(21, 30), time(23, 59, 59)),
-        ]
-        for start, end in peak_periods_30:
-            if start <= current_time <= end:
-                return 1.3
-    else:  # субота або неділя
-        peak_periods_30 = [
-            (time(5, 0), time(6, 0)),
-            (time(9, 0), time(11, 0)),
-            (time(14, 0), time(17, 0)),
-        ]
-        peak_periods_75 = [
-            (time(21, 30), time(23, 59, 59)),
-        ]
-        for start, end in peak_periods_75:
-            if start <= current_time <= end:
-                return 1.75
-        for start, end in peak_periods_30:
-            if start <= current_time <= end:
-                return 1.3
-    return 1.0
+    return peak_schedule.multiplier(datetime.now(KYIV_TZ))
+
+
+# Динамічний коефіцієнт: замовлення / вільні водії в зоні подачі, згладжений
+# і обмежений SURGE_MAX; розклад пікових годин лишається нижньою межею
+surge = SurgeEngine(
+    demand,
+    floor=is_peak_hour,
+    window=os.getenv("SURGE_WINDOW", "5m"),
+    start=float(os.getenv("SURGE_RATIO_START", "1.0")),
+    step=float(os.getenv("SURGE_STEP", "0.5")),
+    cap=float(os.getenv("SURGE_MAX", "2.0")),
+    min_orders=int(os.getenv("SURGE_MIN_ORDERS", "3")),
+    smooth_sec=float(os.getenv("SURGE_SMOOTH_SEC", "180")),
+    stale_sec=float(os.getenv("SURGE_STALE_SEC", "120")),
+)
+
+
+# Швидкості подачі й поїздок по зонах і годинах, які driver-bot вивчає з
+# завершених замовлень; файл перечитується при зміні
+calibration = Calibration(os.getenv("CALIBRATION_FILE", "../driver-bot/calibration.json"))
+
+# Подача від k найближчих вільних водіїв класу (знімок supply від driver-bot)
+pickup_eta = PickupEta(
+    SpeedModel.parse(
+        os.getenv("ETA_SPEED_KMH", "25"),
+        os.getenv("ETA_SPEED_HOURS", "7-10:18,17-20:16"),
+        os.getenv("ETA_ZONE_SPEEDS", ""),
+    ),
+    hour=lambda: datetime.now(KYIV_TZ).hour,
+    k=int(os.getenv("ETA_K", "3")),
+    max_km=float(os.getenv("ETA_MAX_KM", "5")),
+    road_factor=float(os.getenv("ETA_ROAD_FACTOR", "1.3")),
+    stale_sec=float(os.getenv("SURGE_STALE_SEC", "120")),
+    calibration=calibration,
+)
+
+
+def tariff_etas(data: dict, quote: Quote) -> dict:
+    """Хвилини подачі для кожного класу екрана тарифів; None — поруч немає
+    вільних авто цього класу. Рахується раз на показ екрана і живе в FSM."""
+    live = pickup_eta.minutes(data["route_coords"][0], quote.classes)
+    return {
+        t: live[t] if t in live else eta_minutes(t, quote.multiplier) for t in quote.classes
+    }
+
+
+def class_eta(etas: dict, tariff: str, multiplier: float):
+    """Збережена ETA класу; для класу, якого не було на екрані, — запасна."""
+    return etas[tariff] if tariff in etas else eta_minutes(tariff, multiplier)
+
+
+# === QUOTES ===
+async def route_quote(state: FSMContext, data: dict) -> Quote:
+    """Ціна маршруту з FSM; рахуємо заново, лише якщо її ще немає, маршрут
+    змінився або строк дії минув (тоді й коефіцієнт береться свіжий)."""
+    distance_km = data.get("distance_km", 0.0)
+    duration_min = data.get("duration_sec", 0) / 60.0
+    if not duration_min and distance_km:
+        # маршрут без тривалості від Google — беремо вивчену швидкість поїздок
+        kmh = calibration.trip_kmh(zone_of(data["route_coords"][0]), datetime.now(KYIV_TZ).hour)
+        duration_min = distance_km / kmh * 60 if kmh else 0.0
+    extra_stops = len(data.get("stops_addresses", []))
+    quote = Quote.from_state(data.get("quote"))
+    if (
+        quote is None
+        or quote.expired()
+        or not quote.matches(distance_km, duration_min, extra_stops)
+    ):
+        quote = make_quote(
+            distance_km,
+            duration_min,
+            surge.multiplier(data["route_coords"][0]),
+            extra_stops,
+            EXTRA_STOP_FEE,
+            QUOTE_TTL_SEC,
+        )
+        data["quote"] = quote.to_state()
+        await state.update_data(quote=data["quote"])
+    return quote
+
+
+def tariff_rows(quote: Quote, etas: dict):
+    rows = []
+    for t, total in quote.prices:
+        eta = class_eta(etas, t, quote.multiplier)
+        when = f"~{eta} хв" if eta is not None else "немає авто поруч"
+        rows.append([KeyboardButton(text=f"{t} — {total} грн • {when}")])
+    return rows
 
 
 # === UTILS ===
@@ -485,8 +620,14 @@ async def start_choose_home_or_work(message: types.Message, state: FSMContext):
         await message.answer("Ця адреса ще не збережена або не має координат.")
         return
     coords = tuple(entry["coords"])
+    if not await _guard_point(message, coords[0], coords[1], "Точка подачі"):
+        return
     await state.update_data(
-        start_coords=coords, route_addresses=[], route_coords=[coords], distance_km=0.0
+        start_coords=coords,
+        route_addresses=[],
+        route_coords=[coords],
+        distance_km=0.0,
+        duration_sec=0,
     )
     kb = kb_dest_selection(user_id)
     await message.answer(
@@ -502,13 +643,14 @@ async def get_location_or_address(message: types.Message, state: FSMContext):
     geolocator = GoogleV3(api_key=GOOGLE_MAPS_API_KEY)
     if message.location:
         lat, lng = message.location.latitude, message.location.longitude
-        if not await _guard_point(message, lat, lng, "Точка"):
+        if not await _guard_point(message, lat, lng, "Точка подачі"):
             return  # зупиняємо, якщо поза зоною
         await state.update_data(
             start_coords=(lat, lng),
             route_addresses=[],
             route_coords=[(lat, lng)],
             distance_km=0.0,
+            duration_sec=0,
         )
 
         if not registered_users[user_id].get("favorites_prompted", False):
@@ -549,9 +691,9 @@ async def get_location_or_address(message: types.Message, state: FSMContext):
                 "❌ Не знайшов такої адреси. Спробуйте ще або оберіть інший спосіб.",
                 reply_markup=kb,
             )
-            # Перевірка кінцевої точки
+            return
         if not await _guard_point(
-            message, location.latitude, location.longitude, "Кінцева точка"
+            message, location.latitude, location.longitude, "Точка подачі"
         ):
             return
 
@@ -560,6 +702,7 @@ async def get_location_or_address(message: types.Message, state: FSMContext):
             route_addresses=[],
             route_coords=[(location.latitude, location.longitude)],
             distance_km=0.0,
+            duration_sec=0,
         )
         kb = kb_dest_selection(user_id)
         await message.answer(
@@ -620,22 +763,26 @@ async def choose_home_or_work_as_final(message: types.Message, state: FSMContext
     address = fav_entry["address"] if isinstance(fav_entry, dict) else str(fav_entry)
     data = await state.get_data()
     start_coords = data["route_coords"][-1]
-    dest_coords, leg_km, map_file = build_route(start_coords, address)
+    dest_coords, leg, map_file = build_route(start_coords, address)
     if not dest_coords:
         await message.answer("❌ Не вдалося побудувати маршрут до цієї адреси.")
         return
+    if not await _guard_point(message, dest_coords[0], dest_coords[1], "Кінцева точка"):
+        return
     await state.update_data(
         final_address=address,
         final_coords=dest_coords,
         stops_addresses=[],
         stops_coords=[],
-        distance_km=leg_km,
-        leg_to_final_km=leg_km,
-        multiplier=is_peak_hour(),
+        distance_km=leg.km,
+        duration_sec=leg.duration_sec,
+        leg_to_final_km=leg.km,
+        leg_to_final_sec=leg.duration_sec,
+        quote=None,
     )
     await message.answer_photo(
         types.FSInputFile(map_file),
-        caption=f"Старт → Фініш: {leg_km} км\nСумарно: {leg_km:.2f} км",
+        caption=f"Старт → Фініш: {leg.km:.2f} км, ~{round(leg.duration_sec / 60)} хв\nСумарно: {leg.km:.2f} км",
     )
     rows = [
         [KeyboardButton(text=ADD_FAVORITE_FINAL_TEXT)],
@@ -654,22 +801,26 @@ async def choose_other_favorite_as_final(message: types.Message, state: FSMConte
     address = message.text[2:].strip()
     data = await state.get_data()
     start_coords = data["route_coords"][-1]
-    dest_coords, leg_km, map_file = build_route(start_coords, address)
+    dest_coords, leg, map_file = build_route(start_coords, address)
     if not dest_coords:
         await message.answer("❌ Не вдалося побудувати маршрут до цієї адреси.")
         return
+    if not await _guard_point(message, dest_coords[0], dest_coords[1], "Кінцева точка"):
+        return
     await state.update_data(
         final_address=address,
         final_coords=dest_coords,
         stops_addresses=[],
         stops_coords=[],
-        distance_km=leg_km,
-        leg_to_final_km=leg_km,
-        multiplier=is_peak_hour(),
+        distance_km=leg.km,
+        duration_sec=leg.duration_sec,
+        leg_to_final_km=leg.km,
+        leg_to_final_sec=leg.duration_sec,
+        quote=None,
     )
     await message.answer_photo(
         types.FSInputFile(map_file),
-        caption=f"Старт → Фініш: {leg_km} км\nСумарно: {leg_km:.2f} км",
+        caption=f"Старт → Фініш: {leg.km:.2f} км, ~{round(leg.duration_sec / 60)} хв\nСумарно: {leg.km:.2f} км",
     )
     rows = [
         [KeyboardButton(text=ADD_FAVORITE_FINAL_TEXT)],
@@ -691,7 +842,7 @@ async def get_final_destination(message: types.Message, state: FSMContext):
         return
     start_coords = data["route_coords"][-1]
     final_address = message.text.strip()
-    dest_coords, leg_km, map_file = build_route(start_coords, final_address)
+    dest_coords, leg, map_file = build_route(start_coords, final_address)
     if not dest_coords:
         kb = kb_dest_selection(user_id)
         await message.answer(
@@ -699,18 +850,22 @@ async def get_final_destination(message: types.Message, state: FSMContext):
             reply_markup=kb,
         )
         return
+    if not await _guard_point(message, dest_coords[0], dest_coords[1], "Кінцева точка"):
+        return
     await state.update_data(
         final_address=final_address,
         final_coords=dest_coords,
         stops_addresses=[],
         stops_coords=[],
-        distance_km=leg_km,
-        leg_to_final_km=leg_km,
-        multiplier=is_peak_hour(),
+        distance_km=leg.km,
+        duration_sec=leg.duration_sec,
+        leg_to_final_km=leg.km,
+        leg_to_final_sec=leg.duration_sec,
+        quote=None,
     )
     await message.answer_photo(
         types.FSInputFile(map_file),
-        caption=f"Старт → Фініш: {leg_km} км\nСумарно: {leg_km:.2f} км",
+        caption=f"Старт → Фініш: {leg.km:.2f} км, ~{round(leg.duration_sec / 60)} хв\nСумарно: {leg.km:.2f} км",
     )
 
     fav = registered_users[user_id]["favorites"]
@@ -798,27 +953,21 @@ async def ask_next_stop(message: types.Message, state: FSMContext):
 @dp.message(OrderTaxi.waiting_for_additional_stops, F.text == NEXT_TEXT)
 async def proceed_to_tariff(message: types.Message, state: FSMContext):
     data = await state.get_data()
-    distance_km = data.get("distance_km", 0.0)
-    extra_stops = len(data.get("stops_addresses", []))
-    surcharge = extra_stops * EXTRA_STOP_FEE
-    multiplier = data.get("multiplier", 1.0)
-
-    tariff_rows = []
-    for tariff in TARIFFS:
-        base = calculate_price(distance_km, tariff)
-        total = int(round(base * multiplier + surcharge))
-        eta = eta_minutes(tariff, multiplier)
-        tariff_rows.append([KeyboardButton(text=f"{tariff} — {total} грн • ~{eta} хв")])
-
-    kb = kb_with_common_rows(tariff_rows)
-    await message.answer(f"🛣 Загальна відстань маршруту: {distance_km:.2f} км")
-    await message.answer(f"🅿️ Проміжних зупинок: {extra_stops}")
-    if extra_stops > 0:
+    quote = await route_quote(state, data)
+    etas = tariff_etas(data, quote)
+    await state.update_data(etas=etas)
+
+    kb = kb_with_common_rows(tariff_rows(quote, etas))
+    await message.answer(
+        f"🛣 Загальна відстань маршруту: {quote.distance_km:.2f} км, ~{round(quote.duration_min)} хв у дорозі"
+    )
+    await message.answer(f"🅿️ Проміжних зупинок: {quote.extra_stops}")
+    if quote.extra_stops > 0:
         await message.answer(
-            f"➕ Додаткові зупинки: {extra_stops} × {EXTRA_STOP_FEE} грн = {surcharge} грн (додано до вартості)"
+            f"➕ Додаткові зупинки: {quote.extra_stops} × {quote.stop_fee} грн = {quote.surcharge} грн (додано до вартості)"
         )
-    if multiplier > 1.0:
-        pct = int((multiplier - 1.0) * 100)
+    if quote.multiplier > 1.0:
+        pct = int((quote.multiplier - 1.0) * 100)
         await message.answer(f"⚠️ Ураховано піковий тариф: +{pct}%")
     await message.answer("🚗 Оберіть клас авто:", reply_markup=kb)
     await state.set_state(OrderTaxi.waiting_for_tariff)
@@ -861,13 +1010,25 @@ async def add_intermediate_stop(message: types.Message, state: FSMContext):
             reply_markup=kb,
         )
         return
+    if not await _guard_point(
+        message, dest_coords_stop[0], dest_coords_stop[1], "Зупинка"
+    ):
+        return
 
     _, leg_stop_to_final, _ = build_route(dest_coords_stop, final_address)
-    old_tail = data.get("leg_to_final_km", 0.0)
+    if leg_stop_to_final is None:
+        await message.answer("❌ Не вдалося побудувати маршрут від цієї зупинки до фінішу.")
+        return
+    # хвіст до фінішу замінюємо двома новими ногами — і км, і секунди
     new_total = (
-        max(0.0, data.get("distance_km", 0.0) - old_tail)
-        + leg_prev_to_stop
-        + leg_stop_to_final
+        max(0.0, data.get("distance_km", 0.0) - data.get("leg_to_final_km", 0.0))
+        + leg_prev_to_stop.km
+        + leg_stop_to_final.km
+    )
+    new_duration = (
+        max(0, data.get("duration_sec", 0) - data.get("leg_to_final_sec", 0))
+        + leg_prev_to_stop.duration_sec
+        + leg_stop_to_final.duration_sec
     )
 
     stops_addresses.append(message.text.strip())
@@ -877,7 +1038,9 @@ async def add_intermediate_stop(message: types.Message, state: FSMContext):
         stops_addresses=stops_addresses,
         stops_coords=stops_coords,
         distance_km=new_total,
-        leg_to_final_km=leg_stop_to_final,
+        duration_sec=new_duration,
+        leg_to_final_km=leg_stop_to_final.km,
+        leg_to_final_sec=leg_stop_to_final.duration_sec,
     )
 
     kb = kb_with_common_rows(
@@ -892,7 +1055,7 @@ async def add_intermediate_stop(message: types.Message, state: FSMContext):
         types.FSInputFile(map_file_stop),
         caption=(
             f"Додано зупинку: {message.text.strip()}\n"
-            f"Оновлена сумарна дистанція: {new_total:.2f} км\n"
+            f"Оновлена сумарна дистанція: {new_total:.2f} км, ~{round(new_duration / 60)} хв\n"
             f"Маршрут: {route_preview}"
         ),
     )
@@ -902,30 +1065,21 @@ async def add_intermediate_stop(message: types.Message, state: FSMContext):
 @dp.message(OrderTaxi.waiting_for_tariff)
 async def choose_tariff(message: types.Message, state: FSMContext):
     chosen = message.text.split(" — ")[0]
-    if chosen not in TARIFFS:
-        data = await state.get_data()
-        distance_km = data.get("distance_km", 1.0)
-        multiplier = data.get("multiplier", 1.0)
-        extra_stops = len(data.get("stops_addresses", []))
-        surcharge = extra_stops * EXTRA_STOP_FEE
-        rows = []
-        for t in TARIFFS:
-            base = calculate_price(distance_km, t)
-            total = int(round(base * multiplier + surcharge))
-            eta = eta_minutes(t, multiplier)
-            rows.append([KeyboardButton(text=f"{t} — {total} грн • ~{eta} хв")])
-        kb = kb_with_common_rows(rows)
+    data = await state.get_data()
+    quote = await route_quote(state, data)
+    price = quote.price(chosen)
+    etas = data.get("etas") or {}
+    if price is None:
+        kb = kb_with_common_rows(tariff_rows(quote, etas))
         await message.answer("❌ Оберіть тариф з кнопок нижче.", reply_markup=kb)
         return
-
-    data = await state.get_data()
-    distance_km = data.get("distance_km", 0.0)
-    multiplier = data.get("multiplier", 1.0)
-    extra_stops = len(data.get("stops_addresses", []))
-    surcharge = extra_stops * EXTRA_STOP_FEE
-
-    base_price = calculate_price(distance_km, chosen)
-    price = int(round(base_price * multiplier + surcharge))
+    eta = class_eta(etas, chosen, quote.multiplier)
+    if eta is None:
+        kb = kb_with_common_rows(tariff_rows(quote, etas))
+        await message.answer(
+            f"🚫 Поруч немає вільних авто класу {chosen}. Оберіть інший клас:", reply_markup=kb
+        )
+        return
 
     # SAVE TARIFF HERE (fixes KeyError 'tariff')
     await state.update_data(tariff=chosen, price=price)
@@ -936,9 +1090,10 @@ async def choose_tariff(message: types.Message, state: FSMContext):
             [KeyboardButton(text="💳 Переказ на картку водію")],
         ]
     )
-    eta = eta_minutes(chosen, multiplier)
     pct_line = (
-        f"\n⚠️ Піковий тариф: +{int((multiplier-1.0)*100)}%" if multiplier > 1.0 else ""
+        f"\n⚠️ Піковий тариф: +{int((quote.multiplier-1.0)*100)}%"
+        if quote.multiplier > 1.0
+        else ""
     )
     await message.answer(
         f"💵 Вартість: {price} грн{pct_line}\n⏱ Орієнтовна подача: ~{eta} хв\n\nОберіть спосіб оплати:",
@@ -1022,68 +1177,89 @@ async def choose_payment(message: types.Message, state: FSMContext):
     await state.set_state(OrderTaxi.waiting_for_confirmation)
 
 
-# === RabbitMQ PUBLISH (NEW) ===
+# === MQ PUBLISH (NEW) ===
 def _publish_order_to_mq(payload: dict):
     try:
-        conn = pika.BlockingConnection(pika.ConnectionParameters(RABBITMQ_HOST))
-        ch = conn.channel()
-        ch.queue_declare(queue=QUEUE_ORDERS, durable=True)
-        ch.basic_publish(
-            exchange="",
-            routing_key=QUEUE_ORDERS,
-            body=json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+        routing_key = order_routing_key(payload)
+        # пріоритет рахуємо на кожну публікацію: вік і спроби ростуть
+        payload["priority"] = order_priority(payload)
+        get_bus().publish_topic(
+            ORDERS_EXCHANGE,
+            routing_key,
+            encode_order(payload),
+            priority=payload["priority"],
+        )
+        logging.info(
+            "Published order %s as %s (priority %s)",
+            payload.get("id"),
+            routing_key,
+            payload["priority"],
         )
-        conn.close()
-        logging.info("Published order %s to %s", payload.get("id"), QUEUE_ORDERS)
     except Exception as e:
-        logging.exception("RabbitMQ publish error: %s", e)
+        logging.exception("MQ publish error: %s", e)
 
 
-async def schedule_republish(order_id: str, delay: int = 30, max_attempts: int = 3):
-    """Перепубліковуємо замовлення, якщо його не підтвердили, максимум max_attempts разів."""
-    attempts = 0
-
-    while attempts < max_attempts:
-        await asyncio.sleep(delay)
-        od = orders_index.get(order_id)
-        if not od or od.get("confirmed"):
-            return  # замовлення вже підтверджене або видалене
+def schedule_republish(
+    order_id: str, delay: int = 30, max_attempts: int = 3, attempt: int = 0
+):
+    """Дедлайн перепублікації: якщо замовлення не підтвердили за delay сек —
+    публікуємо ще раз, максимум max_attempts разів (див. on_republish_deadline)."""
+    deadlines.schedule(
+        f"republish:{order_id}",
+        "republish",
+        delay=delay,
+        data={
+            "order_id": order_id,
+            "delay": delay,
+            "max_attempts": max_attempts,
+            "attempt": attempt,
+        },
+    )
 
-        attempts += 1
-        logging.info(f"⏳ Замовлення {order_id} не підтверджене. Спроба #{attempts}")
 
-        if attempts < max_attempts:
-            _publish_order_to_mq(od["payload"])
+async def on_republish_deadline(key: str, data: dict):
+    order_id = data["order_id"]
+    od = orders_index.get(order_id)
+    if not od or od.get("confirmed"):
+        return  # замовлення вже підтверджене або видалене
 
-        else:
-            od = orders_index.get(order_id)
+    attempts = int(data.get("attempt", 0)) + 1
+    max_attempts = int(data.get("max_attempts", 3))
+    logging.info(f"⏳ Замовлення {order_id} не підтверджене. Спроба #{attempts}")
 
-    if not od:  # якщо замовлення вже видалено
+    if attempts < max_attempts:
+        # той самий attempt: driver-bot лише оновить запис і не почне хвилі
+        # пропозицій спочатку (повтор — на випадок втраченого повідомлення)
+        _publish_order_to_mq(od["payload"])
+        schedule_republish(order_id, int(data.get("delay", 30)), max_attempts, attempts)
+        set_order_status(order_id, CARD_SEARCHING, search_round=attempts)
         return
 
     chat_id = od.get("chat_id")
 
     if chat_id:
-        # Повідомлення користувачу
-        await bot.send_message(
-            chat_id,
-            "🚫 На жаль, авто не знайдено.\nБудь ласка, виберіть інший клас авто:",
-        )
+        set_order_status(order_id, CARD_NOT_FOUND)
 
         # Переводимо у стан вибору класу авто
         ctx = dp.fsm.get_context(bot=bot, chat_id=chat_id, user_id=chat_id)
         await ctx.set_state(OrderTaxi.waiting_for_tariff)
 
         # Використовуємо готову клавіатуру
-        await bot.send_message(
-            chat_id, "Оберіть клас авто:", reply_markup=class_keyboard
+        await outbox.send_message(
+            chat_id, "Оберіть клас авто:", reply_markup=class_keyboard, priority=TRANSACTIONAL
         )
 
 
+deadlines.on("republish", on_republish_deadline)
+
+
 def _make_order_payload(user: types.User, data: dict, order_id: str) -> dict:
-    # Збираємо корисне навантаження для водійського боку
+    # Збираємо замовлення для водійського боку — одна пласка схема (wire.py)
     start_lat, start_lng = data["route_coords"][0]
-    payload = {
+    tariff = data.get("tariff")
+    quote = Quote.from_state(data.get("quote"))
+    multiplier = quote.multiplier if quote else 1.0
+    return {
         "id": order_id,
         "created_at": datetime.now(pytz.timezone("Europe/Kiev")).isoformat(),
         "passenger": {
@@ -1093,94 +1269,50 @@ def _make_order_payload(user: types.User, data: dict, order_id: str) -> dict:
             "last_name": user.last_name,
             "phone": (registered_users.get(str(user.id), {}) or {}).get("phone"),
         },
-        # ORIGINAL nested shape
-        "route": {
-            "start": {"coords": [start_lat, start_lng]},
-            "stops": data.get("stops_addresses", []),
-            "final": {
-                "address": data.get("final_address"),
-                "coords": list(data.get("final_coords") or []),
-            },
-            "distance_km": round(float(data.get("distance_km", 0.0)), 2),
-        },
-        "pricing": {
-            "tariff": data.get("tariff"),
-            "multiplier": data.get("multiplier", 1.0),
-            "extra_stops_fee": EXTRA_STOP_FEE,
-            "price_total": int(data.get("price", 0)),
-        },
-        "payment_type": data.get("payment_type"),
-        "eta_min": eta_minutes(
-            data.get("tariff", "Стандарт"), data.get("multiplier", 1.0)
-        ),
-        "status": "new",
-        # FLAT mirror for driver_bot compatibility
-        "pickup": {
-            "address": f"{start_lat:.6f},{start_lng:.6f}",
-            "coords": [start_lat, start_lng],
-        },
+        "pickup": {"coords": [start_lat, start_lng]},
         "dropoff": {
-            "address": data.get("final_address") or "Невідомо",
+            "address": data.get("final_address"),
             "coords": list(data.get("final_coords") or []),
         },
+        "stops": data.get("stops_addresses", []),
         "distance_km": round(float(data.get("distance_km", 0.0)), 2),
-        "tariff": data.get("tariff"),
-        "payment": data.get("payment_type"),
+        "duration_min": quote.duration_min if quote else None,
+        "tariff": tariff,
+        "multiplier": multiplier,
+        "extra_stops_fee": quote.stop_fee if quote else EXTRA_STOP_FEE,
         "price": int(data.get("price", 0)),
+        "payment": data.get("payment_type"),
+        "eta_min": class_eta(data.get("etas") or {}, tariff or "Стандарт", multiplier),
+        "status": "new",
     }
-    # Ensure required fields have defaults
-
-    if not payload.get("pickup"):
-        payload["pickup"] = "Невідомо"
-
-    if not payload.get("destination"):
-        payload["destination"] = "Невідомо"
-
-    if not payload.get("distance_km"):
-        payload["distance_km"] = "Невідомо"
-
-    if not payload.get("tariff"):
-        payload["tariff"] = "Невідомо"
-
-    if not payload.get("payment"):
-        payload["payment"] = "Невідомо"
-
-    if not payload.get("price"):
-        payload["price"] = "Невідомо"
-
-    if not payload.get("eta_min"):
-        payload["eta_min"] = "Невідомо"
-
-    # Ensure required fields have defaults
-
-    if not payload.get("pickup"):
-        payload["pickup"] = "Невідомо"
-
-    if not payload.get("destination"):
-        payload["destination"] = "Невідомо"
-
-    if not payload.get("distance_km"):
-        payload["distance_km"] = "Невідомо"
-
-    if not payload.get("tariff"):
-        payload["tariff"] = "Невідомо"
-
-    if not payload.get("payment"):
-        payload["payment"] = "Невідомо"
-
-    if not payload.get("price"):
-        payload["price"] = "Невідомо"
-
-    if not payload.get("eta_min"):
-        payload["eta_min"] = "Невідомо"
-
-    return payload
 
 
 @dp.message(OrderTaxi.waiting_for_confirmation, F.text == CONFIRM_TEXT)
 async def confirm_order_publish(message: types.Message, state: FSMContext):
     # Формуємо замовлення і шлемо у RabbitMQ
     data = await state.get_data()
+    quote = Quote.from_state(data.get("quote"))
+    if quote is None or quote.expired():
+        # ціна застаріла — перераховуємо і, якщо змінилась, питаємо ще раз
+        quote = await route_quote(state, data)
+        price = quote.price(data.get("tariff"))
+        if price is None:
+            await message.answer(
+                "❌ Цей тариф більше недоступний. Оберіть клас авто:",
+                reply_markup=kb_with_common_rows(tariff_rows(quote, data.get("etas") or {})),
+            )
+            await state.set_state(OrderTaxi.waiting_for_tariff)
+            return
+        if price != data.get("price"):
+            data["price"] = price
+            await state.update_data(price=price)
+            kb = kb_with_common_rows(
+                [[KeyboardButton(text=CONFIRM_TEXT), KeyboardButton(text=CANCEL_TEXT)]]
+            )
+            await message.answer(
+                f"⌛ Ціна оновилась: {price} грн. Підтвердити замовлення?", reply_markup=kb
+            )
+            return
     order_id = str(int(_time.time() * 1000))
     payload = _make_order_payload(message.from_user, data, order_id)
 
@@ -1192,13 +1324,21 @@ async def confirm_order_publish(message: types.Message, state: FSMContext):
         "payload": payload,
     }
     _save_orders_index()
+    demand.add_order(payload)
+    surge.note_order(order_pickup(payload))
 
     # Публікація
     _publish_order_to_mq(payload)
 
-    await message.answer("🚖 Заявку відправлено водіям. Очікуємо підтвердження...")
+    # картка статусу: далі її лише редагуємо (set_order_status)
+    orders_index[order_id]["status"] = CARD_SEARCHING
+    text, _ = render_card(order_id, orders_index[order_id])
+    card = await message.answer(text)
+    orders_index[order_id]["card_id"] = card.message_id
+    _save_orders_index()
+    status_cards.attach(order_id, card.message_id, text)
     await state.set_state(OrderTaxi.waiting_for_driver_confirmation)
-    asyncio.create_task(schedule_republish(order_id, 30, max_attempts=3))
+    schedule_republish(order_id, 30, max_attempts=3)
 
 
 @dp.message(OrderTaxi.waiting_for_confirmation, F.text == CANCEL_TEXT)
@@ -1223,170 +1363,190 @@ async def waiting_for_driver_confirmation_state(
 
 
 # === CONFIRMATIONS CONSUMER (NEW) ===
+DRIVER_CONTACT_CB = "drv_contact:"
+
+
+CARD_SEARCHING = "searching"
+CARD_NOT_FOUND = "not_found"
+CARD_FINAL = ("completed", "finished", CARD_NOT_FOUND)
+CARD_DEBOUNCE_SEC = float(os.getenv("STATUS_CARD_DEBOUNCE_SEC", "2"))
+
+
+def driver_keyboard(order_id: str, d: dict):
+    """Кнопки зв'язку з водієм; картку контакту шлемо лише на натискання."""
+    rows = []
+    if d.get("phone"):
+        rows.append(
+            [
+                InlineKeyboardButton(
+                    text="📞 Контакт водія", callback_data=f"{DRIVER_CONTACT_CB}{order_id}"
+                )
+            ]
+        )
+    if d.get("username"):
+        chat_url = f"https://t.me/{d['username']}"
+    elif d.get("id"):
+        chat_url = f"tg://user?id={d['id']}"
+    else:
+        chat_url = None
+    if chat_url:
+        rows.append([InlineKeyboardButton(text="💬 Написати в Telegram", url=chat_url)])
+    return InlineKeyboardMarkup(inline_keyboard=rows) if rows else None
+
+
+def render_card(order_id: str, info: dict):
+    """Текст і клавіатура картки статусу замовлення — цілком зі стану в orders_index."""
+    status = info.get("status") or CARD_SEARCHING
+    d = info.get("driver") or {}
+    lines = [f"🚖 Замовлення №{order_id}"]
+    if status == CARD_SEARCHING:
+        search_round = int(info.get("search_round") or 0)
+        lines.append("🔍 Заявку відправлено водіям. Очікуємо підтвердження...")
+        if search_round:
+            lines.append(f"🔁 Повторний пошук, спроба {search_round + 1}")
+    elif status == "accepted":
+        lines.append("✅ Ваше замовлення прийнято водієм!")
+    elif status == "arrived":
+        lines.append("🚖 Ваш водій на місці.")
+        lines.append(f"🕒 Розпочалось безкоштовне очікування {info.get('free_wait_min', 3)} хв.")
+    elif status == "driver_cancelled":
+        lines.append("🚫 Водій скасував поїздку.\n🔍 Продовжуємо пошук нового водія...")
+    elif status in ("completed", "finished"):
+        lines.append("✅ Дякуємо, що скористались FlyTaxi!\n🧾 Поїздку завершено. Оцініть від 1 до 5.")
+    elif status == CARD_NOT_FOUND:
+        lines.append("🚫 На жаль, авто не знайдено.")
+    kb = None
+    if status in ("accepted", "arrived") and d:
+        car = d.get("car") or {}
+        car_line = f"\nАвто: {car.get('model','-')} {car.get('plate','')}" if car else ""
+        lines.append(f"Водій: {d.get('name') or '-'} #{d.get('id') or ''}{car_line}")
+        kb = driver_keyboard(order_id, d)
+    return "\n".join(lines), kb
+
+
+def _store_card_id(order_id: str, message_id: int):
+    info = orders_index.get(order_id)
+    if info is not None:
+        info["card_id"] = message_id
+        _save_orders_index()
+
+
+status_cards = StatusCards(outbox, CARD_DEBOUNCE_SEC, on_new_card=_store_card_id)
+
+
+def set_order_status(order_id: str, status: str, **fields):
+    """Новий статус замовлення → картка пасажира (на циклі бота)."""
+    info = orders_index.get(order_id)
+    if not info:
+        return
+    info["status"] = status
+    info.update(fields)
+    _save_orders_index()
+    text, kb = render_card(order_id, info)
+    status_cards.update(order_id, info["chat_id"], info.get("card_id"), text, kb)
+    if status in CARD_FINAL:
+        status_cards.forget(order_id)  # once the last edit went out
+
+
+@dp.callback_query(F.data.startswith(DRIVER_CONTACT_CB))
+async def send_driver_contact(call: types.CallbackQuery):
+    order_id = call.data[len(DRIVER_CONTACT_CB):]
+    info = orders_index.get(order_id) or {}
+    driver = info.get("driver") or {}
+    if info.get("user_id") != call.from_user.id or not driver.get("phone"):
+        await call.answer("Контакт недоступний.", show_alert=True)
+        return
+    await call.answer()
+    await call.message.answer_contact(
+        phone_number=driver["phone"], first_name=driver.get("name") or "Водій"
+    )
+
+
 class ConfirmConsumer(threading.Thread):
-    def __init__(self, loop: asyncio.AbstractEventLoop, bot: Bot):
+    def __init__(self, loop: asyncio.AbstractEventLoop):
         super().__init__(daemon=True)
         self.loop = loop
-        self.bot = bot
-        self._stop = threading.Event()
+        self._stop_event = threading.Event()
 
     def run(self):
-        while not self._stop.is_set():
-            try:
-                params = pika.ConnectionParameters(
-                    RABBITMQ_HOST, heartbeat=30, blocked_connection_timeout=300
-                )
-                conn = pika.BlockingConnection(params)
-                ch = conn.channel()
-                ch.queue_declare(queue=QUEUE_CONFIRMATIONS, durable=True)
-                logging.info("[MQ] Listening '%s'", QUEUE_CONFIRMATIONS)
-                for method, props, body in ch.consume(
-                    QUEUE_CONFIRMATIONS, inactivity_timeout=1, auto_ack=True
-                ):
-                    if self._stop.is_set():
-                        break
-                    if not body:
-                        continue
-                    try:
-                        msg = json.loads(body.decode("utf-8"))
-                    except Exception:
-                        logging.exception("Invalid JSON in confirmations")
-                        continue
-
-                    order_id = str(msg.get("order_id") or msg.get("id") or "")
-                    status = msg.get("status", "accepted")
-                    info = orders_index.get(order_id)
-                    if not info:
-                        continue
-                    chat_id = info["chat_id"]
-
-                    if status == "accepted":
-                        text = "✅ Ваше замовлення прийнято водієм!\n"
-                        if msg.get("driver"):
-                            d = msg["driver"]
-                            name = d.get("name") or "-"
-                            dr_id = d.get("id") or ""
-                            car = d.get("car") or {}
-                            car_line = ""
-                            if car:
-                                car_line = f"\nАвто: {car.get('model','-')} {car.get('plate','')}"
-                            text += f"Водій: {name} #{dr_id}{car_line}"
-                        text += f"\nЗамовлення №{order_id}"
-                        asyncio.run_coroutine_threadsafe(
-                            self.bot.send_message(chat_id, text), self.loop
-                        )
-                        driver_phone = d.get("phone")
-                        driver_username = d.get("username")
-                        if driver_phone:
-                            asyncio.run_coroutine_threadsafe(
-                                self.bot.send_contact(
-                                    chat_id,
-                                    phone_number=driver_phone,
-                                    first_name=name or "Водій",
-                                ),
-                                self.loop,
-                            )
-
-                        from aiogram.types import (
-                            InlineKeyboardMarkup,
-                            InlineKeyboardButton,
-                        )
-
-                        rows = []
-                        if driver_phone:
-                            rows.append(
-                                [
-                                    InlineKeyboardButton(
-                                        text="📞 Подзвонити водію",
-                                        url=f"tel:{driver_phone}",
-                                    )
-                                ]
-                            )
-                        if driver_username:
-                            rows.append(
-                                [
-                                    InlineKeyboardButton(
-                                        text="💬 Написати в Telegram",
-                                        url=f"https://t.me/{driver_username}",
-                                    )
-                                ]
-                            )
-                        elif dr_id:
-                            rows.append(
-                                [
-                                    InlineKeyboardButton(
-                                        text="💬 Написати в Telegram",
-                                        url=f"tg://user?id={dr_id}",
-                                    )
-                                ]
-                            )
-                        if rows:
-                            kb = InlineKeyboardMarkup(inline_keyboard=rows)
-                            asyncio.run_coroutine_threadsafe(
-                                self.bot.send_message(
-                                    chat_id, "Зв’язок із водієм:", reply_markup=kb
-                                ),
-                                self.loop,
-                            )
-
-                        od = orders_index.get(order_id)
-                        if od:
-                            od["confirmed"] = True
-
-                    elif status == "arrived":
-                        wait_min = int(msg.get("free_wait_min", 3))
-                        asyncio.run_coroutine_threadsafe(
-                            self.bot.send_message(
-                                chat_id,
-                                f"🚖 Ваш водій на місці.\n🕒 Розпочалось безкоштовне очікування {wait_min} хв.",
-                            ),
-                            self.loop,
-                        )
-
-                    elif status == "driver_cancelled":
-                        asyncio.run_coroutine_threadsafe(
-                            self.bot.send_message(
-                                chat_id,
-                                "🚫 Водій скасував поїздку.\n🔍 Продовжуємо пошук нового водія...",
-                            ),
-                            self.loop,
-                        )
-                        # Отримуємо дані замовлення з локального індексу
-                        order_data = orders_index.get(order_id)
-                        if order_data:
-                            # Повертаємо в пошук
-                            _publish_order_to_mq(order_data["payload"])
-
-                    elif status in ("completed", "finished"):
-                        info["await_rating"] = True
-                        orders_index[order_id] = info
-                        _save_orders_index()
-                        asyncio.run_coroutine_threadsafe(
-                            self.bot.send_message(
-                                chat_id,
-                                "✅ Дякуємо, що скористались FlyTaxi!\n🧾 Поїздку завершено. Оцініть від 1 до 5.",
-                            ),
-                            self.loop,
-                        )
-
-                try:
-                    if conn and conn.is_open:
-                        conn.close()
-                except Exception:
-                    pass
-            except Exception as e:
-                logging.error(
-                    "[MQ] confirmations consumer error: %s. Reconnect in 3s...", e
-                )
-                _time.sleep(3)
+        get_bus().consume(QUEUE_CONFIRMATIONS, self.handle, self._stop_event)
+
+    def handle(self, body: bytes):
+        try:
+            msg = decode_confirmation(body)
+        except WireError as e:
+            logging.error("[MQ] Rejected confirmation: %s", e)
+            return
+
+        order_id = msg["order_id"]
+        status = msg["status"]
+        info = orders_index.get(order_id)
+        if not info:
+            return
+        if status == "accepted":
+            # водій, авто і кнопки зв'язку — у картці статусу замовлення
+            info["confirmed"] = True
+            self.loop.call_soon_threadsafe(deadlines.cancel, f"republish:{order_id}")
+            self.loop.call_soon_threadsafe(
+                lambda: set_order_status(order_id, status, driver=msg.get("driver") or {})
+            )
+
+        elif status == "arrived":
+            wait_min = int(msg.get("free_wait_min", 3))
+            self.loop.call_soon_threadsafe(
+                lambda: set_order_status(order_id, status, free_wait_min=wait_min)
+            )
+
+        elif status == "driver_cancelled":
+            self.loop.call_soon_threadsafe(set_order_status, order_id, status)
+            # Отримуємо дані замовлення з локального індексу
+            order_data = orders_index.get(order_id)
+            if order_data:
+                # Повертаємо в пошук — єдиний шлях повторної диспетчеризації;
+                # пріоритет росте з кожним поверненням (routing.order_priority)
+                payload = order_data["payload"]
+                payload["attempt"] = int(payload.get("attempt") or 0) + 1
+                _publish_order_to_mq(payload)
+
+        elif status in ("completed", "finished"):
+            info["await_rating"] = True
+            self.loop.call_soon_threadsafe(set_order_status, order_id, status)
 
     def stop(self):
-        self._stop.set()
+        self._stop_event.set()
 
 
 confirm_thread: ConfirmConsumer | None = None
 
 
+class SupplyConsumer(threading.Thread):
+    """Знімки вільних водіїв від driver-bot → surge і ETA подачі (на циклі бота)."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        super().__init__(daemon=True)
+        self.loop = loop
+        self._stop_event = threading.Event()
+
+    def run(self):
+        get_bus().consume(QUEUE_SUPPLY, self.handle, self._stop_event)
+
+    def handle(self, body: bytes):
+        try:
+            msg = decode_supply(body)
+        except WireError as e:
+            logging.error("[MQ] Rejected supply: %s", e)
+            return
+        self.loop.call_soon_threadsafe(surge.update_supply, msg["zones"], msg["at"])
+        if "drivers" in msg:  # старіший driver-bot шле лише лічильники по зонах
+            self.loop.call_soon_threadsafe(pickup_eta.update, msg["drivers"], msg["at"])
+
+    def stop(self):
+        self._stop_event.set()
+
+
+supply_thread: SupplyConsumer | None = None
+
+
 # === RATINGS ===
 @dp.message(OrderTaxi.waiting_for_rating)
 async def rate_driver_stateful(message: types.Message, state: FSMContext):
@@ -1525,9 +1685,14 @@ async def reset_favorites(message: types.Message, state: FSMContext):
 async def main():
     # Стартуємо фоновий consumer підтверджень
     loop = asyncio.get_running_loop()
-    global confirm_thread
-    confirm_thread = ConfirmConsumer(loop, bot)
+    global confirm_thread, supply_thread
+    outbox.start()
+    confirm_thread = ConfirmConsumer(loop)
     confirm_thread.start()
+    supply_thread = SupplyConsumer(loop)
+    supply_thread.start()
+    deadlines.start()
+    demand.backfill(ORDERS_INDEX_FILE, os.getenv("HEATMAP_DRIVER_ORDERS"))
 
     await bot.delete_webhook(drop_pending_updates=True)
     try:
@@ -1535,6 +1700,10 @@ async def main():
     finally:
         if confirm_thread and confirm_thread.is_alive():
             confirm_thread.stop()
+        if supply_thread and supply_thread.is_alive():
+            supply_thread.stop()
+        await deadlines.stop()
+        await outbox.stop()
 
 
 if __name__ == "__main__":
@@ -1,4 +1,6 @@
 import os
+from typing import NamedTuple, Optional
+
 import requests
 import polyline as pl
 import folium
@@ -9,8 +11,34 @@ load_dotenv()
 GOOGLE_MAPS_API_KEY = os.getenv("GOOGLE_MAPS_API_KEY")
 
 
+class RouteLeg(NamedTuple):
+    """Числові дистанція і тривалість з Directions (`value`, не локалізований `text`)."""
+
+    meters: int
+    seconds: int
+    traffic_seconds: Optional[int] = None  # duration_in_traffic, якщо Google його дав
+
+    @property
+    def km(self) -> float:
+        return self.meters / 1000.0
+
+    @property
+    def duration_sec(self) -> int:
+        """Тривалість з урахуванням заторів, коли вона відома."""
+        return self.traffic_seconds if self.traffic_seconds is not None else self.seconds
+
+
+def parse_leg(leg: dict) -> RouteLeg:
+    traffic = leg.get("duration_in_traffic")
+    return RouteLeg(
+        int(leg["distance"]["value"]),
+        int(leg["duration"]["value"]),
+        int(traffic["value"]) if traffic else None,
+    )
+
+
 def build_route(start_coords, destination_address):
-    """Будує маршрут, повертає (координати призначення, дистанцію, шлях до PNG карти)"""
+    """Будує маршрут, повертає (координати призначення, RouteLeg, шлях до PNG карти)"""
     geolocator = GoogleV3(api_key=GOOGLE_MAPS_API_KEY)
     location = geolocator.geocode(destination_address)
 
@@ -19,14 +47,14 @@ def build_route(start_coords, destination_address):
 
     dest_coords = (location.latitude, location.longitude)
 
-    directions_url = f"https://maps.googleapis.com/maps/api/directions/json?origin={start_coords[0]},{start_coords[1]}&destination={dest_coords[0]},{dest_coords[1]}&key={GOOGLE_MAPS_API_KEY}&language=uk"
+    directions_url = f"https://maps.googleapis.com/maps/api/directions/json?origin={start_coords[0]},{start_coords[1]}&destination={dest_coords[0]},{dest_coords[1]}&departure_time=now&key={GOOGLE_MAPS_API_KEY}&language=uk"
     response = requests.get(directions_url).json()
 
     if not response["routes"]:
         return None, None, None
 
-    distance_text = response["routes"][0]["legs"][0]["distance"]["text"]
-    distance_km = float(distance_text.replace(" км", "").replace(",", ".").strip())
+    # departure_time=now → Google додає duration_in_traffic
+    leg = parse_leg(response["routes"][0]["legs"][0])
 
     # Полілінія маршруту
     polyline_data = response["routes"][0]["overview_polyline"]["points"]
@@ -57,4 +85,4 @@ def build_route(start_coords, destination_address):
     with open(map_file, "wb") as f:
         f.write(img_data)
 
-    return dest_coords, distance_km, map_file
+    return dest_coords, leg, map_file
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+In-process metrics: counters, gauges and latency histograms.
+
+Cheap enough for hot paths (one lock + list append). Histograms keep the
+last HISTOGRAM_WINDOW samples for percentiles plus lifetime count/sum.
+`render()` gives a text snapshot (admin /metrics command, periodic log).
+
+This module is kept identical in driver-bot/ and passenger-bot/.
+"""
+import threading
+import time
+from typing import Dict, List, Optional
+
+HISTOGRAM_WINDOW = 2048
+
+_lock = threading.Lock()
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, n: int = 1):
+        with _lock:
+            self.value += n
+
+
+class Gauge:
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Histogram:
+    def __init__(self, window: int = HISTOGRAM_WINDOW):
+        self.window = window
+        self.samples: List[float] = []
+        self.count = 0
+        self.total = 0.0
+        self._pos = 0
+
+    def observe(self, value: float):
+        with _lock:
+            self.count += 1
+            self.total += value
+            if len(self.samples) < self.window:
+                self.samples.append(value)
+            else:
+                self.samples[self._pos] = value
+                self._pos = (self._pos + 1) % self.window
+
+    def percentile(self, q: float) -> Optional[float]:
+        with _lock:
+            data = sorted(self.samples)
+        if not data:
+            return None
+        idx = min(len(data) - 1, max(0, int(round(q / 100.0 * (len(data) - 1)))))
+        return data[idx]
+
+    def timer(self) -> "_Timer":
+        return _Timer(self)
+
+
+class _Timer:
+    def __init__(self, hist: Histogram):
+        self.hist = hist
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, *exc):
+        self.hist.observe(time.monotonic() - self.start)
+
+
+_counters: Dict[str, Counter] = {}
+_gauges: Dict[str, Gauge] = {}
+_histograms: Dict[str, Histogram] = {}
+
+
+def counter(name: str) -> Counter:
+    with _lock:
+        return _counters.setdefault(name, Counter())
+
+
+def gauge(name: str) -> Gauge:
+    with _lock:
+        return _gauges.setdefault(name, Gauge())
+
+
+def histogram(name: str) -> Histogram:
+    with _lock:
+        return _histograms.setdefault(name, Histogram())
+
+
+def render(prefix: str = "") -> str:
+    lines: List[str] = []
+    for name in sorted(_counters):
+        if name.startswith(prefix):
+            lines.append(f"{name} = {_counters[name].value}")
+    for name in sorted(_gauges):
+        if name.startswith(prefix):
+            lines.append(f"{name} = {_gauges[name].value:g}")
+    for name in sorted(_histograms):
+        if not name.startswith(prefix):
+            continue
+        h = _histograms[name]
+        if not h.count:
+            continue
+        p50, p95, p99 = (h.percentile(q) for q in (50, 95, 99))
+        lines.append(
+            f"{name}: n={h.count} avg={h.total / h.count:.3f} "
+            f"p50={p50:.3f} p95={p95:.3f} p99={p99:.3f}"
+        )
+    return "\n".join(lines) or "(no metrics yet)"
@@ -0,0 +1,424 @@
+# -*- coding: utf-8 -*-
+"""
+FlyTaxi message bus — one publish/consume API for both bots.
+
+Backends (MQ_BACKEND env):
+  rabbitmq  — RabbitMQ on RABBITMQ_HOST (default, production)
+  memory    — in-process queues; both bots in one process (see run_local.py)
+  file      — spool directory MQ_SPOOL_DIR; bots as separate processes on
+              one box without a broker
+
+Messages carry a priority 0..MAX_PRIORITY (higher first); queues consumed
+with `max_priority` are delivered highest-priority first on every backend.
+
+Besides plain named queues the bus supports topic exchanges (AMQP routing:
+`*` matches one dot-separated word, `#` zero or more), used to shard orders
+by zone across several driver-bot instances.
+
+This module is kept identical in driver-bot/ and passenger-bot/, so when both
+bots run in one process they share a single bus instance.
+"""
+import os
+import itertools
+import logging
+import queue
+import tempfile
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Iterable, List, Optional
+
+try:
+    import pika
+except ImportError:  # only the rabbitmq backend needs it
+    pika = None
+
+Handler = Callable[[bytes], None]
+
+MAX_PRIORITY = 9  # RabbitMQ recommends small x-max-priority values
+
+
+def _clamp_priority(priority: int) -> int:
+    return max(0, min(MAX_PRIORITY, int(priority or 0)))
+
+
+def _prefetch() -> int:
+    # small prefetch keeps the backlog in the broker, where priorities apply
+    return int(os.getenv("MQ_PREFETCH", "10"))
+
+
+def topic_matches(pattern: str, routing_key: str) -> bool:
+    """AMQP topic match: `*` = exactly one word, `#` = zero or more words."""
+    pw = pattern.split(".")
+    kw = routing_key.split(".")
+
+    def match(i: int, j: int) -> bool:
+        if i == len(pw):
+            return j == len(kw)
+        if pw[i] == "#":
+            return any(match(i + 1, k) for k in range(j, len(kw) + 1))
+        if j == len(kw):
+            return False
+        return (pw[i] == "*" or pw[i] == kw[j]) and match(i + 1, j + 1)
+
+    return match(0, 0)
+
+
+def _safe_call(handler: Handler, body: bytes):
+    try:
+        handler(body)
+    except Exception:
+        logging.exception("[MQ] Handler failed, message dropped")
+
+
+class MessageBus:
+    """Publish raw bytes to a named queue / consume them with a handler.
+
+    `consume` blocks the calling thread until `stop` is set, so consumers
+    keep running in their own background threads.
+    """
+
+    name = "base"
+
+    def publish(self, queue_name: str, body: bytes, priority: int = 0) -> None:
+        raise NotImplementedError
+
+    def consume(
+        self,
+        queue_name: str,
+        handler: Handler,
+        stop: threading.Event,
+        max_priority: int = 0,
+    ):
+        raise NotImplementedError
+
+    def publish_topic(
+        self, exchange: str, routing_key: str, body: bytes, priority: int = 0
+    ) -> None:
+        raise NotImplementedError
+
+    def bind(
+        self,
+        exchange: str,
+        queue_name: str,
+        binding_keys: Iterable[str],
+        max_priority: int = 0,
+    ):
+        """Route messages from `exchange` matching any key into `queue_name`.
+
+        Bindings are durable: they outlive the consumer, like in RabbitMQ.
+        """
+        raise NotImplementedError
+
+    def consume_topic(
+        self,
+        exchange: str,
+        queue_name: str,
+        binding_keys: Iterable[str],
+        handler: Handler,
+        stop: threading.Event,
+        max_priority: int = 0,
+    ):
+        self.bind(exchange, queue_name, binding_keys, max_priority)
+        self.consume(queue_name, handler, stop, max_priority)
+
+
+class RabbitMQBus(MessageBus):
+    name = "rabbitmq"
+
+    def __init__(self, host: str):
+        if pika is None:
+            raise RuntimeError("MQ_BACKEND=rabbitmq requires `pip install pika`")
+        self.host = host
+
+    @staticmethod
+    def _properties(priority: int):
+        priority = _clamp_priority(priority)
+        return pika.BasicProperties(priority=priority) if priority else None
+
+    @staticmethod
+    def _declare(channel, queue_name: str, max_priority: int):
+        args = {"x-max-priority": max_priority} if max_priority else None
+        channel.queue_declare(queue=queue_name, durable=True, arguments=args)
+
+    def publish(self, queue_name: str, body: bytes, priority: int = 0) -> None:
+        connection = pika.BlockingConnection(pika.ConnectionParameters(self.host))
+        try:
+            channel = connection.channel()
+            channel.queue_declare(queue=queue_name, durable=True)
+            channel.basic_publish(
+                exchange="",
+                routing_key=queue_name,
+                body=body,
+                properties=self._properties(priority),
+            )
+        finally:
+            connection.close()
+
+    def publish_topic(
+        self, exchange: str, routing_key: str, body: bytes, priority: int = 0
+    ) -> None:
+        connection = pika.BlockingConnection(pika.ConnectionParameters(self.host))
+        try:
+            channel = connection.channel()
+            channel.exchange_declare(exchange, exchange_type="topic", durable=True)
+            channel.basic_publish(
+                exchange=exchange,
+                routing_key=routing_key,
+                body=body,
+                properties=self._properties(priority),
+            )
+        finally:
+            connection.close()
+
+    def bind(
+        self,
+        exchange: str,
+        queue_name: str,
+        binding_keys: Iterable[str],
+        max_priority: int = 0,
+    ):
+        connection = pika.BlockingConnection(pika.ConnectionParameters(self.host))
+        try:
+            channel = connection.channel()
+            channel.exchange_declare(exchange, exchange_type="topic", durable=True)
+            self._declare(channel, queue_name, max_priority)
+            for key in binding_keys:
+                channel.queue_bind(queue_name, exchange, routing_key=key)
+        finally:
+            connection.close()
+
+    def consume_topic(
+        self,
+        exchange: str,
+        queue_name: str,
+        binding_keys: Iterable[str],
+        handler: Handler,
+        stop: threading.Event,
+        max_priority: int = 0,
+    ):
+        keys = list(binding_keys)
+        while not stop.is_set():
+            try:
+                self.bind(exchange, queue_name, keys, max_priority)
+                break
+            except Exception as e:
+                logging.error(f"[MQ] Bind error: {e}. Retrying in 3s...")
+                stop.wait(3)
+        self.consume(queue_name, handler, stop, max_priority)
+
+    def consume(
+        self,
+        queue_name: str,
+        handler: Handler,
+        stop: threading.Event,
+        max_priority: int = 0,
+    ):
+        while not stop.is_set():
+            connection = None
+            try:
+                params = pika.ConnectionParameters(
+                    self.host, heartbeat=30, blocked_connection_timeout=300
+                )
+                connection = pika.BlockingConnection(params)
+                channel = connection.channel()
+                self._declare(channel, queue_name, max_priority)
+                channel.basic_qos(prefetch_count=_prefetch())
+                logging.info(f"[MQ] Connected. Consuming from '{queue_name}'")
+
+                for method, _props, body in channel.consume(
+                    queue_name, inactivity_timeout=1
+                ):
+                    if stop.is_set():
+                        break
+                    if body is None:
+                        continue
+                    _safe_call(handler, body)
+                    channel.basic_ack(method.delivery_tag)
+                channel.cancel()
+            except Exception as e:
+                logging.error(f"[MQ] Connection error: {e}. Reconnecting in 3s...")
+                stop.wait(3)
+            finally:
+                try:
+                    if connection and connection.is_open:
+                        connection.close()
+                except Exception:
+                    pass
+
+
+class MemoryBus(MessageBus):
+    """Thread-safe in-process priority queues (consumers are threads,
+    publishers are the bot event loops); FIFO within one priority."""
+
+    name = "memory"
+
+    def __init__(self):
+        self._queues: Dict[str, queue.PriorityQueue] = {}
+        self._bindings: Dict[str, Dict[str, List[str]]] = {}
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+
+    def _queue(self, queue_name: str) -> queue.PriorityQueue:
+        with self._lock:
+            return self._queues.setdefault(queue_name, queue.PriorityQueue())
+
+    def publish(self, queue_name: str, body: bytes, priority: int = 0) -> None:
+        self._queue(queue_name).put((-_clamp_priority(priority), next(self._seq), body))
+
+    def publish_topic(
+        self, exchange: str, routing_key: str, body: bytes, priority: int = 0
+    ) -> None:
+        with self._lock:
+            bound = dict(self._bindings.get(exchange, {}))
+        for queue_name, keys in bound.items():
+            if any(topic_matches(k, routing_key) for k in keys):
+                self.publish(queue_name, body, priority)
+
+    def bind(
+        self,
+        exchange: str,
+        queue_name: str,
+        binding_keys: Iterable[str],
+        max_priority: int = 0,
+    ):
+        with self._lock:
+            keys = self._bindings.setdefault(exchange, {}).setdefault(queue_name, [])
+            keys.extend(k for k in binding_keys if k not in keys)
+
+    def consume(
+        self,
+        queue_name: str,
+        handler: Handler,
+        stop: threading.Event,
+        max_priority: int = 0,
+    ):
+        q = self._queue(queue_name)
+        logging.info(f"[MQ] In-process queue '{queue_name}'")
+        while not stop.is_set():
+            try:
+                _prio, _seq, body = q.get(timeout=1)
+            except queue.Empty:
+                continue
+            _safe_call(handler, body)
+
+
+class FileBus(MessageBus):
+    """One directory per queue, one file per message.
+
+    File names start with (MAX_PRIORITY - priority), so the sorted listing is
+    highest-priority first, then oldest first. Publish writes a hidden temp
+    file and renames it into place; consumers claim a message by renaming it,
+    so several consumers never get the same file.
+    """
+
+    name = "file"
+
+    def __init__(self, spool_dir: str, poll_sec: float = 0.2):
+        self.spool_dir = spool_dir
+        self.poll_sec = poll_sec
+
+    def _dir(self, queue_name: str) -> str:
+        path = os.path.join(self.spool_dir, queue_name)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def publish(self, queue_name: str, body: bytes, priority: int = 0) -> None:
+        d = self._dir(queue_name)
+        lane = MAX_PRIORITY - _clamp_priority(priority)
+        name = f"{lane}-{time.time_ns():020d}-{uuid.uuid4().hex}.msg"
+        tmp = os.path.join(d, "." + name)
+        with open(tmp, "wb") as f:
+            f.write(body)
+        os.replace(tmp, os.path.join(d, name))
+
+    def _bindings_dir(self, exchange: str) -> str:
+        path = os.path.join(self.spool_dir, "_bindings", exchange)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def publish_topic(
+        self, exchange: str, routing_key: str, body: bytes, priority: int = 0
+    ) -> None:
+        d = self._bindings_dir(exchange)
+        for queue_name in os.listdir(d):
+            if queue_name.startswith("."):
+                continue
+            with open(os.path.join(d, queue_name), "r", encoding="utf-8") as f:
+                keys = f.read().split()
+            if any(topic_matches(k, routing_key) for k in keys):
+                self.publish(queue_name, body, priority)
+
+    def bind(
+        self,
+        exchange: str,
+        queue_name: str,
+        binding_keys: Iterable[str],
+        max_priority: int = 0,
+    ):
+        d = self._bindings_dir(exchange)
+        path = os.path.join(d, queue_name)
+        keys: List[str] = []
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                keys = f.read().split()
+        keys.extend(k for k in binding_keys if k not in keys)
+        tmp = os.path.join(d, "." + queue_name)
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write("\n".join(keys))
+        os.replace(tmp, path)
+
+    def consume(
+        self,
+        queue_name: str,
+        handler: Handler,
+        stop: threading.Event,
+        max_priority: int = 0,
+    ):
+        d = self._dir(queue_name)
+        logging.info(f"[MQ] Spool directory '{d}'")
+        while not stop.is_set():
+            names = sorted(n for n in os.listdir(d) if n.endswith(".msg"))
+            if not names:
+                stop.wait(self.poll_sec)
+                continue
+            for name in names:
+                if stop.is_set():
+                    break
+                claimed = os.path.join(d, name[:-4] + ".work")
+                try:
+                    os.rename(os.path.join(d, name), claimed)
+                except FileNotFoundError:
+                    continue  # claimed by another consumer
+                with open(claimed, "rb") as f:
+                    body = f.read()
+                os.remove(claimed)
+                _safe_call(handler, body)
+
+
+_bus: Optional[MessageBus] = None
+_bus_lock = threading.Lock()
+
+
+def get_bus() -> MessageBus:
+    """Process-wide bus, created on first use from the env settings."""
+    global _bus
+    with _bus_lock:
+        if _bus is None:
+            backend = os.getenv("MQ_BACKEND", "rabbitmq").strip().lower()
+            if backend == "memory":
+                _bus = MemoryBus()
+            elif backend == "file":
+                _bus = FileBus(
+                    os.getenv(
+                        "MQ_SPOOL_DIR",
+                        os.path.join(tempfile.gettempdir(), "flytaxi-mq"),
+                    ),
+                    float(os.getenv("MQ_POLL_SEC", "0.2")),
+                )
+            elif backend == "rabbitmq":
+                _bus = RabbitMQBus(os.getenv("RABBITMQ_HOST", "localhost"))
+            else:
+                raise RuntimeError(f"Unknown MQ_BACKEND: {backend}")
+            logging.info(f"[MQ] Backend: {_bus.name}")
+        return _bus
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Peak-hour schedule compiled from peaks.json.
+
+File format — per weekday class, multiplier -> list of [from, to] windows
+("HH:MM", both ends inclusive to the minute; "to" before "from" wraps past
+midnight within the same day):
+
+  {"weekdays": {"1.3": [["07:00", "09:00"]]},
+   "weekends": {"1.75": [["21:30", "23:59"]]}}
+
+Compiling validates every entry (bad ones are logged and skipped, the rest
+still applies), resolves overlaps to the highest multiplier and produces one
+sorted, non-overlapping interval table per class. A lookup is a binary
+search over that table, and the answer is memoized for the current minute —
+callers may ask on every message for free.
+
+The file is re-read when its mtime changes (checked at most once a minute,
+on a memo miss); if the new version doesn't parse, the old table stays.
+"""
+import bisect
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+WEEKDAYS = "weekdays"  # Mon–Fri
+WEEKENDS = "weekends"  # Sat–Sun
+CLASSES = (WEEKDAYS, WEEKENDS)
+
+MAX_MULTIPLIER = 5.0
+MINUTES_PER_DAY = 24 * 60
+
+# The schedule used before peaks.json existed; applies when the file is missing.
+DEFAULT_PEAKS: Dict[str, Dict[str, List[List[str]]]] = {
+    WEEKDAYS: {
+        "1.3": [["05:00", "06:00"], ["07:30", "10:30"], ["16:30", "19:30"], ["21:30", "23:59"]],
+    },
+    WEEKENDS: {
+        "1.3": [["05:00", "06:00"], ["09:00", "11:00"], ["14:00", "17:00"]],
+        "1.75": [["21:30", "23:59"]],
+    },
+}
+
+
+class Table:
+    """Sorted, non-overlapping [start, end) minute intervals with multipliers."""
+
+    __slots__ = ("starts", "ends", "values")
+
+    def __init__(self, intervals: List[Tuple[int, int, float]]):
+        self.starts = [s for s, _e, _v in intervals]
+        self.ends = [e for _s, e, _v in intervals]
+        self.values = [v for _s, _e, v in intervals]
+
+    def lookup(self, minute: int) -> float:
+        i = bisect.bisect_right(self.starts, minute) - 1
+        if i >= 0 and minute < self.ends[i]:
+            return self.values[i]
+        return 1.0
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+
+def _minute(value: Any) -> int:
+    hh, mm = str(value).strip().split(":")
+    h, m = int(hh), int(mm)
+    if not (0 <= h <= 24 and 0 <= m < 60) or (h == 24 and m):
+        raise ValueError(f"bad time {value!r}")
+    return h * 60 + m
+
+
+def _compile_class(name: str, spec: Any) -> Table:
+    if not isinstance(spec, dict):
+        logging.warning(f"[PEAKS] {name}: expected an object, got {spec!r}")
+        return Table([])
+    raw: List[Tuple[int, int, float]] = []
+    for key, windows in spec.items():
+        try:
+            mult = float(key)
+        except (TypeError, ValueError):
+            logging.warning(f"[PEAKS] {name}: {key!r} is not a multiplier, skipped")
+            continue
+        if not 1.0 <= mult <= MAX_MULTIPLIER:
+            logging.warning(f"[PEAKS] {name}: multiplier {mult} out of range, skipped")
+            continue
+        for window in windows if isinstance(windows, list) else [windows]:
+            try:
+                start, end = window
+                s, e = _minute(start), _minute(end) + 1  # "to" is inclusive
+            except (TypeError, ValueError) as err:
+                logging.warning(f"[PEAKS] {name}/{key}: bad window {window!r} ({err}), skipped")
+                continue
+            e = min(e, MINUTES_PER_DAY)
+            if s < e:
+                raw.append((s, e, mult))
+            else:  # past midnight
+                raw.append((s, MINUTES_PER_DAY, mult))
+                raw.append((0, e, mult))
+    # split at every boundary, highest multiplier wins, merge equal neighbours
+    cuts = sorted({p for s, e, _m in raw for p in (s, e)})
+    out: List[Tuple[int, int, float]] = []
+    for a, b in zip(cuts, cuts[1:]):
+        best = max((m for s, e, m in raw if s <= a and b <= e), default=1.0)
+        if best <= 1.0:
+            continue
+        if out and out[-1][1] == a and out[-1][2] == best:
+            out[-1] = (out[-1][0], b, best)
+        else:
+            out.append((a, b, best))
+    return Table(out)
+
+
+def compile_schedule(data: Any) -> Dict[str, Table]:
+    if not isinstance(data, dict):
+        raise ValueError("peaks: top level must be an object")
+    for name in data:
+        if name not in CLASSES:
+            logging.warning(f"[PEAKS] unknown class {name!r}, ignored")
+    return {name: _compile_class(name, data.get(name, {})) for name in CLASSES}
+
+
+class PeakSchedule:
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._mtime: Optional[float] = None
+        self.tables = compile_schedule(DEFAULT_PEAKS)
+        self._memo_key: Optional[Tuple[int, int]] = None
+        self._memo_value = 1.0
+        self.reload()
+
+    def reload(self) -> bool:
+        """Recompile if the file changed; True when a new table was loaded."""
+        if not self.path:
+            return False
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return False  # no file: keep what we have
+        if mtime == self._mtime:
+            return False
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                tables = compile_schedule(json.load(f))
+        except (OSError, ValueError) as e:
+            logging.error(f"[PEAKS] Can't load {self.path}: {e}; keeping the old schedule")
+            self._mtime = mtime  # don't retry the same broken file every minute
+            return False
+        self.tables = tables
+        self._mtime = mtime
+        self._memo_key = None
+        logging.info(
+            "[PEAKS] Loaded %s: %s",
+            self.path,
+            ", ".join(f"{name} {len(t)} windows" for name, t in tables.items()),
+        )
+        return True
+
+    def multiplier(self, now: datetime) -> float:
+        """Multiplier at local time `now`; 1.0 outside every window."""
+        minute = now.hour * 60 + now.minute
+        key = (now.toordinal(), minute)
+        if key == self._memo_key:
+            return self._memo_value
+        self.reload()
+        name = WEEKDAYS if now.weekday() < 5 else WEEKENDS
+        self._memo_value = self.tables[name].lookup(minute)
+        self._memo_key = key
+        return self._memo_value
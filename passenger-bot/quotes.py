@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Price quotes: one immutable snapshot of what a route costs.
+
+A quote is made once per route (cd.TariffEngine prices every class in one
+call, the surge multiplier is read at the same moment) and reused by the
+tariff, payment and confirmation screens. It lives in FSM data as a short
+list (`to_state` / `from_state`). After `expires_at` it is stale: callers
+recompute it, but only on the screens that actually need a price.
+"""
+import time
+import uuid
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from cd import tariffs
+
+
+class Quote(NamedTuple):
+    id: str
+    distance_km: float
+    duration_min: float  # trip time with traffic, from the cached route
+    prices: Tuple[Tuple[str, int], ...]  # (class, total) in tariff order
+    multiplier: float
+    extra_stops: int
+    stop_fee: int
+    tariffs_version: int
+    expires_at: float
+
+    @property
+    def surcharge(self) -> int:
+        return self.extra_stops * self.stop_fee
+
+    @property
+    def classes(self) -> List[str]:
+        return [name for name, _ in self.prices]
+
+    def price(self, car_class: str) -> Optional[int]:
+        for name, total in self.prices:
+            if name == car_class:
+                return total
+        return None
+
+    def expired(self, now: Optional[float] = None) -> bool:
+        return (time.time() if now is None else now) >= self.expires_at
+
+    def matches(self, distance_km: float, duration_min: float, extra_stops: int) -> bool:
+        """Still the same route (the quote can be reused)."""
+        return (
+            self.distance_km == round(distance_km, 2)
+            and self.duration_min == round(duration_min, 1)
+            and self.extra_stops == extra_stops
+        )
+
+    def to_state(self) -> List[Any]:
+        return [
+            self.id,
+            self.distance_km,
+            self.duration_min,
+            [list(p) for p in self.prices],
+            self.multiplier,
+            self.extra_stops,
+            self.stop_fee,
+            self.tariffs_version,
+            self.expires_at,
+        ]
+
+    @classmethod
+    def from_state(cls, raw: Any) -> Optional["Quote"]:
+        try:
+            qid, km, minutes, prices, mult, stops, fee, version, expires = raw
+            return cls(
+                str(qid),
+                float(km),
+                float(minutes),
+                tuple((str(n), int(p)) for n, p in prices),
+                float(mult),
+                int(stops),
+                int(fee),
+                int(version),
+                float(expires),
+            )
+        except (TypeError, ValueError):
+            return None
+
+
+def make_quote(
+    distance_km: float,
+    duration_min: float,
+    multiplier: float,
+    extra_stops: int,
+    stop_fee: int,
+    ttl_sec: float,
+) -> Quote:
+    distance_km = round(float(distance_km), 2)
+    duration_min = round(float(duration_min), 1)
+    surcharge = extra_stops * stop_fee
+    prices: Dict[str, int] = tariffs.prices(distance_km, multiplier, surcharge, duration_min)
+    return Quote(
+        uuid.uuid4().hex[:12],
+        distance_km,
+        duration_min,
+        tuple(prices.items()),
+        float(multiplier),
+        int(extra_stops),
+        int(stop_fee),
+        tariffs.version,
+        time.time() + ttl_sec,
+    )
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Token bucket for outgoing Telegram calls.
+
+Telegram allows about 30 messages per second per bot overall; a flood answer
+(429 / RetryAfter) means everyone has to wait. The bucket hands out `rate`
+tokens per second with bursts up to `burst`, and `pause()` stops it for the
+time Telegram asked for. Used from the bot loop only: outbox.py keeps one
+for the whole bot and one per chat (`try_acquire`, so a throttled chat
+never holds up the others).
+
+This module is kept identical in driver-bot/ and passenger-bot/.
+"""
+import asyncio
+import time
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = float(rate)
+        self.capacity = max(1, int(burst))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()  # FIFO for waiters
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                wait = self.try_acquire()
+                if not wait:
+                    return
+                await asyncio.sleep(wait)
+
+    def try_acquire(self) -> float:
+        """Take a token if there is one: 0.0; else seconds until there is."""
+        now = time.monotonic()
+        if now < self.paused_until:
+            return self.paused_until - now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+        self.updated = self.paused_until
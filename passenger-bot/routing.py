@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Zone grid and routing keys shared by both bots.
+
+Pickup points are binned into a fixed grid of ZONE_CELL_KM squares (default
+5 km). Orders go to the ORDERS_EXCHANGE topic exchange as
+`orders.<zone>.<class>`, driver state between driver-bot instances as
+`drivers.<zone>`. A driver-bot instance owns the zones listed in SHARD_ZONES.
+
+Orders are also published with a priority (order_priority): retries, age and
+configured tariff classes move an order ahead of fresh standard ones.
+
+This module is kept identical in driver-bot/ and passenger-bot/ — both sides
+must compute the same zone for the same point.
+"""
+import os
+import math
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+ORDERS_EXCHANGE_DEFAULT = "orders.topic"
+NO_ZONE = "nozone"
+ANY_CLASS = "any"
+
+# Reference latitude for the longitude step: keeps cells ~square over Kyiv
+# while the grid stays a pure O(1) floor() lookup.
+_REF_LAT = 50.45
+_KM_PER_DEG_LAT = 111.32
+
+TARIFF_CLASSES = {
+    "Стандарт": "standard",
+    "Комфорт": "comfort",
+    "Бізнес": "business",
+    "standard": "standard",
+    "comfort": "comfort",
+    "business": "business",
+}
+
+
+@lru_cache(maxsize=1)
+def _cell_deg() -> Tuple[float, float]:
+    # read lazily: the bots call load_dotenv() after importing this module
+    cell_km = float(os.getenv("ZONE_CELL_KM", "5"))
+    dlat = cell_km / _KM_PER_DEG_LAT
+    dlon = cell_km / (_KM_PER_DEG_LAT * math.cos(math.radians(_REF_LAT)))
+    return dlat, dlon
+
+
+def zone_cell(lat: float, lon: float) -> Tuple[int, int]:
+    dlat, dlon = _cell_deg()
+    return math.floor(lat / dlat), math.floor(lon / dlon)
+
+
+def cell_span_km(lat: float) -> float:
+    """Shorter side of a grid cell at `lat`, km (cells narrow away from _REF_LAT)."""
+    dlat, dlon = _cell_deg()
+    return min(dlat, dlon * math.cos(math.radians(lat))) * _KM_PER_DEG_LAT
+
+
+def zone_of(coords: Optional[Sequence[float]]) -> str:
+    """Zone id like `1134x1174` for (lat, lon); NO_ZONE when unknown."""
+    try:
+        lat, lon = float(coords[0]), float(coords[1])
+    except (TypeError, ValueError, IndexError):
+        return NO_ZONE
+    row, col = zone_cell(lat, lon)
+    return f"{row}x{col}"
+
+
+def tariff_class(tariff: Any) -> str:
+    return TARIFF_CLASSES.get(str(tariff or "").strip(), ANY_CLASS)
+
+
+def order_pickup(order: Dict[str, Any]) -> Optional[Sequence[float]]:
+    pickup = order.get("pickup")
+    if isinstance(pickup, dict) and pickup.get("coords"):
+        return pickup["coords"]
+    return ((order.get("route") or {}).get("start") or {}).get("coords") or None
+
+
+def order_routing_key(order: Dict[str, Any]) -> str:
+    return f"orders.{zone_of(order_pickup(order))}.{tariff_class(order.get('tariff'))}"
+
+
+def driver_routing_key(zone: str) -> str:
+    return f"drivers.{zone}"
+
+
+@lru_cache(maxsize=1)
+def _priority_cfg() -> Tuple[Dict[str, int], float, int]:
+    # ORDER_PRIORITY_TARIFFS="business:2,comfort:1" — bonus per tariff class
+    bonus: Dict[str, int] = {}
+    for item in os.getenv("ORDER_PRIORITY_TARIFFS", "business:2,comfort:1").split(","):
+        cls, _, val = (part.strip() for part in item.partition(":"))
+        if cls and val:
+            bonus[TARIFF_CLASSES.get(cls, cls)] = int(val)
+    age_step = float(os.getenv("ORDER_PRIORITY_AGE_STEP_SEC", "30"))
+    max_age_bonus = int(os.getenv("ORDER_PRIORITY_MAX_AGE_BONUS", "4"))
+    return bonus, age_step, max_age_bonus
+
+
+def order_age_sec(order: Dict[str, Any], now: Optional[datetime] = None) -> float:
+    """Seconds since the order was created (0 when unknown)."""
+    try:
+        created = datetime.fromisoformat(str(order.get("created_at")))
+    except (TypeError, ValueError):
+        return 0.0
+    if created.tzinfo is None:
+        created = created.replace(tzinfo=timezone.utc)
+    now = now or datetime.now(timezone.utc)
+    return max(0.0, (now - created).total_seconds())
+
+
+def order_priority(order: Dict[str, Any], now: Optional[datetime] = None) -> int:
+    """0..9: +1 per retry, +1 per ORDER_PRIORITY_AGE_STEP_SEC waited (capped),
+    plus the tariff class bonus."""
+    bonus, age_step, max_age_bonus = _priority_cfg()
+    prio = int(order.get("attempt") or 0)
+    if age_step > 0:
+        prio += min(max_age_bonus, int(order_age_sec(order, now) // age_step))
+    prio += bonus.get(tariff_class(order.get("tariff")), 0)
+    return max(0, min(9, prio))
+
+
+def parse_shard_list(raw: Optional[str]) -> Optional[List[str]]:
+    """SHARD_ZONES / SHARD_CLASSES value → list, or None for "all";
+    "-" is the empty list (a sharded poller that dispatches nothing)."""
+    raw = (raw or "*").strip()
+    if raw in ("*", "#", ""):
+        return None
+    if raw == "-":
+        return []
+    return [z.strip() for z in raw.split(",") if z.strip()]
+
+
+def order_binding_keys(
+    zones: Optional[Iterable[str]], classes: Optional[Iterable[str]] = None
+) -> List[str]:
+    zone_words = list(zones) if zones else ["*"]
+    class_words = list(classes) if classes else ["*"]
+    if zone_words == ["*"] and class_words == ["*"]:
+        return ["orders.#"]
+    return [f"orders.{z}.{c}" for z in zone_words for c in class_words]
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+One live status card per order, edited in place.
+
+The card is the message sent when the order goes out; its message_id lives
+in orders_index (`card_id`). Every status change renders the whole card and
+calls `update()`; edits go through outbox.py as TRANSACTIONAL.
+
+Edits are debounced per order: the first change goes out at once, later
+ones at most every `debounce_sec`, and only the newest content is sent —
+a burst of accepted → arrived costs one or two edits, not one per event.
+A card with the same text and keyboard as the last one shown is skipped.
+If the message can't be edited (deleted, too old) a new card is sent and
+`on_new_card(key, message_id)` lets the caller store the new id.
+
+Call `forget(key)` once the order reaches a terminal status: the state is
+dropped right away, or after the pending edit when one is still due.
+
+Not thread-safe: call `update` on the bot loop (call_soon_threadsafe from
+the bus thread).
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+
+from aiogram.exceptions import TelegramBadRequest
+
+from outbox import TRANSACTIONAL, Outbox
+
+# (chat_id, message_id, text, reply_markup)
+Card = Tuple[int, Optional[int], str, Any]
+
+
+class StatusCards:
+    def __init__(
+        self,
+        outbox: Outbox,
+        debounce_sec: float = 2.0,
+        on_new_card: Callable[[str, int], None] = lambda key, message_id: None,
+    ):
+        self.outbox = outbox
+        self.debounce_sec = debounce_sec
+        self.on_new_card = on_new_card
+        self._latest: Dict[str, Card] = {}
+        self._shown: Dict[str, Tuple[str, Any]] = {}
+        self._ids: Dict[str, int] = {}
+        self._last_flush: Dict[str, float] = {}
+        self._busy: Set[str] = set()
+        self._closing: Set[str] = set()
+
+    def attach(self, key: str, message_id: int, text: str):
+        """The card was just sent (outside the debouncer)."""
+        self._ids[key] = message_id
+        self._shown[key] = (text, None)
+        self._last_flush[key] = time.monotonic()
+
+    def update(self, key: str, chat_id: int, message_id: Optional[int], text: str, reply_markup: Any = None):
+        self._latest[key] = (chat_id, message_id, text, reply_markup)
+        self._closing.discard(key)  # still in use
+        if key in self._busy:
+            return  # the running flush picks it up
+        self._busy.add(key)
+        wait = self._last_flush.get(key, 0.0) + self.debounce_sec - time.monotonic()
+        asyncio.get_running_loop().call_later(max(0.0, wait), self._start, key)
+
+    def forget(self, key: str):
+        if key in self._busy:
+            self._closing.add(key)  # after the pending flush
+            return
+        self._closing.discard(key)
+        for d in (self._latest, self._shown, self._ids, self._last_flush):
+            d.pop(key, None)
+
+    # ---- internals ----
+
+    def _start(self, key: str):
+        asyncio.create_task(self._flush(key))
+
+    async def _flush(self, key: str):
+        try:
+            card = self._latest.pop(key, None)
+            if card is not None:
+                await self._show(key, *card)
+                self._last_flush[key] = time.monotonic()
+        except Exception as e:
+            logging.error(f"[CARD] Failed to update card {key}: {e}")
+        finally:
+            self._busy.discard(key)
+        if key in self._latest:  # changed while we were sending
+            chat_id, message_id, text, kb = self._latest.pop(key)
+            self.update(key, chat_id, message_id, text, kb)
+        elif key in self._closing:
+            self.forget(key)
+
+    async def _show(self, key: str, chat_id: int, message_id: Optional[int], text: str, kb: Any):
+        if self._shown.get(key) == (text, kb):
+            return
+        message_id = self._ids.get(key, message_id)
+        if message_id is not None:
+            try:
+                await self.outbox.edit_message_text(
+                    text, chat_id=chat_id, message_id=message_id, reply_markup=kb,
+                    priority=TRANSACTIONAL,
+                )
+                self._shown[key] = (text, kb)
+                return
+            except TelegramBadRequest as e:
+                if "not modified" in str(e):
+                    self._shown[key] = (text, kb)
+                    return
+                logging.info(f"[CARD] Can't edit card {key}: {e}; sending a new one")
+            except Exception as e:  # network, flood control: the card may still be fine
+                logging.error(f"[CARD] Failed to edit card {key}: {e}")
+                return
+        try:
+            msg = await self.outbox.send_message(
+                chat_id, text, reply_markup=kb, priority=TRANSACTIONAL
+            )
+        except Exception as e:
+            logging.error(f"[CARD] Failed to send card {key}: {e}")
+            return
+        self._ids[key] = msg.message_id
+        self._shown[key] = (text, kb)
+        self.on_new_card(key, msg.message_id)
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Surge pricing from live supply and demand, per zone (routing.zone_of grid).
+
+  ratio = pickups in the zone over `window` (heatmap.DemandHeatmap)
+          / available drivers in the zone (driver-bot supply feed, ≥ 1)
+  raw   = 1 + step · (ratio - start)   when ratio > start and there were
+          at least `min_orders` pickups, else 1.0
+
+The raw value is smoothed per zone with a time-based EMA (time constant
+`smooth_sec`), so one burst of orders or a driver going offline doesn't
+jerk prices around, and capped at `cap`. The result never goes below
+`floor()` — the time-of-day peak schedule.
+
+Both inputs are incremental counters: demand is a handful of ring buckets,
+supply a dict replaced by each snapshot, so a quote costs O(1). Without a
+fresh snapshot (older than `stale_sec`) only the floor applies.
+
+Supply snapshots arrive on the bus thread; hand them to `update_supply` on
+the bot loop (call_soon_threadsafe) — the engine is not thread-safe.
+"""
+import math
+import time
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+from heatmap import PICKUP, DemandHeatmap
+from routing import NO_ZONE, zone_of
+
+
+class SurgeEngine:
+    def __init__(
+        self,
+        demand: DemandHeatmap,
+        floor: Callable[[], float] = lambda: 1.0,
+        window: str = "5m",
+        start: float = 1.0,
+        step: float = 0.5,
+        cap: float = 2.0,
+        min_orders: int = 3,
+        smooth_sec: float = 180.0,
+        stale_sec: float = 120.0,
+        round_to: float = 0.05,
+    ):
+        self.demand = demand
+        self.floor = floor
+        self.window = window
+        self.start = start
+        self.step = step
+        self.cap = cap
+        self.min_orders = min_orders
+        self.smooth_sec = smooth_sec
+        self.stale_sec = stale_sec
+        self.round_to = round_to
+        self._supply: Dict[str, int] = {}
+        self._supply_at = 0.0
+        # zone -> (smoothed multiplier, when it was last updated)
+        self._smooth: Dict[str, Tuple[float, float]] = {}
+
+    # ---- inputs ----
+
+    def note_order(self, coords: Optional[Sequence[float]]):
+        """A new order: start tracking its zone, so the EMA is sampled on
+        every supply snapshot and not only when someone asks for a price."""
+        zone = zone_of(coords)
+        if zone != NO_ZONE:
+            self._update(zone, time.time())
+
+    def update_supply(self, zones: Dict[str, int], at: Optional[float] = None):
+        self._supply = zones
+        self._supply_at = time.time() if at is None else at
+        # sample the zones we're tracking, so the EMA sees every snapshot
+        for zone in list(self._smooth):
+            self._update(zone, time.time())
+
+    def supply_fresh(self) -> bool:
+        return time.time() - self._supply_at <= self.stale_sec
+
+    # ---- outputs ----
+
+    def raw(self, zone: str) -> float:
+        if not self.supply_fresh():
+            return 1.0
+        orders = self.demand.count(zone, self.window, PICKUP)
+        if orders < self.min_orders:
+            return 1.0
+        ratio = orders / max(1, self._supply.get(zone, 0))
+        if ratio <= self.start:
+            return 1.0
+        return min(self.cap, 1.0 + self.step * (ratio - self.start))
+
+    def zone_multiplier(self, zone: str) -> float:
+        """Smoothed and capped dynamic part, without the floor."""
+        return self._update(zone, time.time())
+
+    def multiplier(self, coords: Optional[Sequence[float]]) -> float:
+        """Price multiplier for a pickup at `coords`: dynamic surge, but not
+        below the schedule floor; rounded to `round_to`."""
+        floor = self.floor()
+        zone = zone_of(coords)
+        if zone == NO_ZONE:
+            return floor
+        value = max(floor, self.zone_multiplier(zone))
+        return round(round(value / self.round_to) * self.round_to, 2)
+
+    # ---- internals ----
+
+    def _update(self, zone: str, now: float) -> float:
+        target = self.raw(zone)
+        prev = self._smooth.get(zone)
+        value, at = prev if prev is not None else (1.0, now)
+        alpha = 1.0 - math.exp(-max(0.0, now - at) / self.smooth_sec)
+        value += (target - value) * alpha
+        if target <= 1.0 and value <= 1.0 + 1e-3:
+            self._smooth.pop(zone, None)  # calm again: stop tracking
+            return 1.0
+        self._smooth[zone] = (value, now)
+        return min(self.cap, value)
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent tariff configuration (TARIFFS_FILE, default tariffs.json).
+
+  {"version": 3, "updated_at": "...",
+   "tariffs": {"Стандарт": {"base": 100, "per_km": 17, "included_km": 2,
+                             "per_min": 0}, ...}}
+
+`base` covers the first `included_km` kilometres, every further kilometre
+costs `per_km`, and every minute of the (traffic-aware) trip `per_min`.
+Every save bumps `version` and replaces the file atomically, so
+cd.TariffEngine (which watches the file) never reads half a config.
+Without a file the defaults below apply.
+"""
+import copy
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+DEFAULT_INCLUDED_KM = 2.0
+DEFAULT_PER_MIN = 0.0
+
+DEFAULT_TARIFFS: Dict[str, Dict[str, float]] = {
+    "Стандарт": {
+        "base": 100, "per_km": 17, "included_km": DEFAULT_INCLUDED_KM, "per_min": DEFAULT_PER_MIN
+    },
+    "Комфорт": {
+        "base": 130, "per_km": 20, "included_km": DEFAULT_INCLUDED_KM, "per_min": DEFAULT_PER_MIN
+    },
+    "Бізнес": {
+        "base": 170, "per_km": 24, "included_km": DEFAULT_INCLUDED_KM, "per_min": DEFAULT_PER_MIN
+    },
+}
+
+
+def tariffs_path() -> str:
+    # read lazily: main.py calls load_dotenv() after importing this module
+    return os.getenv("TARIFFS_FILE", "tariffs.json")
+
+
+def default_cfg() -> Dict[str, Any]:
+    return {"version": 0, "updated_at": None, "tariffs": copy.deepcopy(DEFAULT_TARIFFS)}
+
+
+def load_tariffs_cfg(path: Optional[str] = None) -> Dict[str, Any]:
+    path = path or tariffs_path()
+    if not os.path.exists(path):
+        return default_cfg()
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            cfg = json.load(f)
+    except (OSError, ValueError):
+        logging.exception(f"[TARIFFS] Can't read {path}, using defaults")
+        return default_cfg()
+    if not isinstance(cfg, dict) or not isinstance(cfg.get("tariffs"), dict):
+        logging.error(f"[TARIFFS] {path} has no 'tariffs' object, using defaults")
+        return default_cfg()
+    cfg.setdefault("version", 0)
+    return cfg
+
+
+def upsert_tariff(
+    cfg: Dict[str, Any],
+    name: str,
+    base: float,
+    per_km: float,
+    included_km: Optional[float] = None,
+    per_min: Optional[float] = None,
+) -> Dict[str, Any]:
+    if base < 0 or per_km < 0:
+        raise ValueError("база і ціна за км не можуть бути від'ємними")
+    entry = cfg.setdefault("tariffs", {}).setdefault(name, {})
+    entry["base"] = base
+    entry["per_km"] = per_km
+    if included_km is not None:
+        if included_km < 0:
+            raise ValueError("включені км не можуть бути від'ємними")
+        entry["included_km"] = included_km
+    if per_min is not None:
+        if per_min < 0:
+            raise ValueError("ціна за хвилину не може бути від'ємною")
+        entry["per_min"] = per_min
+    entry.setdefault("included_km", DEFAULT_INCLUDED_KM)
+    entry.setdefault("per_min", DEFAULT_PER_MIN)
+    return entry
+
+
+def save_tariffs_cfg(cfg: Dict[str, Any], path: Optional[str] = None):
+    path = path or tariffs_path()
+    cfg["version"] = int(cfg.get("version", 0)) + 1
+    cfg["updated_at"] = datetime.now().isoformat(timespec="seconds")
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(cfg, f, ensure_ascii=False, indent=4)
+    os.replace(tmp, path)
+    logging.info(f"[TARIFFS] Saved version {cfg['version']} to {path}")
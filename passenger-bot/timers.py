@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+One deadline scheduler per bot instead of a sleeping task per order.
+
+Entries are (key, kind, due, data): `key` is unique ("offer:<order_id>"),
+`kind` picks the handler registered with `on()`, `data` is a JSON-able dict.
+A heap orders the deadlines; cancel/reschedule just drop the key from the
+index, stale heap items are skipped when they surface (lazy deletion), so
+both stay O(log n) at most.
+
+Deadlines are wall-clock epochs and are saved to `path` (at most once per
+second while dirty, and on stop), so pending timeouts survive a restart;
+overdue ones fire right after start.
+
+This module is kept identical in driver-bot/ and passenger-bot/.
+"""
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+Handler = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+SAVE_EVERY_SEC = 1.0
+
+
+class DeadlineScheduler:
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._heap: List[Tuple[float, int, str]] = []
+        self._entries: Dict[str, Tuple[float, int, str, Dict[str, Any]]] = {}
+        self._handlers: Dict[str, Handler] = {}
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dirty = False
+        self._saved_at = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    # ---- API (bot loop only) ----
+
+    def on(self, kind: str, handler: Handler):
+        self._handlers[kind] = handler
+
+    def schedule(
+        self,
+        key: str,
+        kind: str,
+        delay: Optional[float] = None,
+        at: Optional[float] = None,
+        data: Optional[Dict[str, Any]] = None,
+    ):
+        """Set (or move) the deadline for `key`: `delay` seconds from now or
+        at epoch `at`."""
+        due = at if at is not None else time.time() + (delay or 0.0)
+        seq = next(self._seq)
+        self._entries[key] = (due, seq, kind, data or {})
+        heapq.heappush(self._heap, (due, seq, key))
+        self._changed()
+
+    def cancel(self, key: str) -> bool:
+        if self._entries.pop(key, None) is None:
+            return False
+        self._changed()
+        return True
+
+    def due(self, key: str) -> Optional[float]:
+        entry = self._entries.get(key)
+        return entry[0] if entry else None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # ---- lifecycle ----
+
+    def start(self):
+        self.load()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.save()
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+        except Exception:
+            logging.exception(f"[TIMERS] Can't read {self.path}, starting empty")
+            return
+        for key, e in saved.items():
+            self.schedule(key, e["kind"], at=float(e["due"]), data=e.get("data"))
+        logging.info(f"[TIMERS] Restored {len(saved)} deadlines")
+
+    def save(self):
+        if not self.path:
+            return
+        snapshot = {
+            key: {"kind": kind, "due": due, "data": data}
+            for key, (due, _seq, kind, data) in self._entries.items()
+        }
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+        self._dirty = False
+        self._saved_at = time.monotonic()
+
+    # ---- internals ----
+
+    def _changed(self):
+        self._dirty = True
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _pop_due(self, now: float) -> List[Tuple[str, str, Dict[str, Any]]]:
+        fired = []
+        while self._heap and self._heap[0][0] <= now:
+            _due, seq, key = heapq.heappop(self._heap)
+            entry = self._entries.get(key)
+            if entry is None or entry[1] != seq:
+                continue  # cancelled or rescheduled
+            del self._entries[key]
+            fired.append((key, entry[2], entry[3]))
+        # drop stale heads so the sleep below targets a live deadline
+        while self._heap and self._entries.get(self._heap[0][2], (0, -1))[1] != self._heap[0][1]:
+            heapq.heappop(self._heap)
+        return fired
+
+    async def _fire(self, key: str, kind: str, data: Dict[str, Any]):
+        handler = self._handlers.get(kind)
+        if handler is None:
+            logging.error(f"[TIMERS] No handler for {kind} ({key})")
+            return
+        try:
+            await handler(key, data)
+        except Exception:
+            logging.exception(f"[TIMERS] {kind} handler failed for {key}")
+
+    async def _run(self):
+        while True:
+            fired = self._pop_due(time.time())
+            for key, kind, data in fired:
+                asyncio.create_task(self._fire(key, kind, data))
+            if fired:
+                self._dirty = True
+            if self._dirty and time.monotonic() - self._saved_at >= SAVE_EVERY_SEC:
+                try:
+                    self.save()
+                except Exception:
+                    logging.exception("[TIMERS] Save failed")
+            timeout = self._heap[0][0] - time.time() if self._heap else None
+            if self._dirty:
+                timeout = SAVE_EVERY_SEC if timeout is None else min(timeout, SAVE_EVERY_SEC)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""
+Run the passenger and driver bots in one process over the in-process
+message bus (no RabbitMQ needed). Handy for local testing and benchmarking.
+
+  python run_local.py                  # MQ_BACKEND=memory
+  MQ_BACKEND=file python run_local.py  # same, but through the spool directory
+
+Each bot still reads its own .env (tokens, Google key).
+"""
+import asyncio
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+PASSENGER_DIR = os.path.join(ROOT, "passenger-bot")
+DRIVER_DIR = os.path.join(ROOT, "driver-bot")
+
+os.environ.setdefault("MQ_BACKEND", "memory")
+sys.path[:0] = [PASSENGER_DIR, DRIVER_DIR]
+# passenger-bot keeps its JSON files relative to the working directory
+os.chdir(PASSENGER_DIR)
+
+import driver_bot  # noqa: E402
+import main as passenger_bot  # noqa: E402
+
+
+async def run():
+    await asyncio.gather(driver_bot.main(), passenger_bot.main())
+
+
+if __name__ == "__main__":
+    asyncio.run(run())